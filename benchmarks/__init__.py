@@ -0,0 +1,6 @@
+"""Benchmarks for the EventEase site and bots.
+
+Run from the project root, e.g. ``python -m benchmarks.db_queries``. Each
+benchmark creates its own throwaway database, so ``db.sqlite3`` is never
+touched.
+"""
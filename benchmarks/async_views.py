@@ -0,0 +1,269 @@
+"""Throughput and tail latency of the bot-facing API, served over WSGI and ASGI.
+
+    python -m benchmarks.async_views [--events 20000] [--connections 1000] [--requests 10000]
+        [--workers 1] [--threads 32] [--servers wsgi,asgi-sync,asgi] [--save PATH] [--compare PATH]
+
+Serves a generated catalog with the production settings from a separate
+server process, in turn:
+
+* ``wsgi``: gunicorn's threaded workers (``--threads`` each) and the
+  synchronous views;
+* ``asgi-sync``: uvicorn with ``DJANGO_ASYNC_VIEWS=0``, so the synchronous
+  views, each request on a thread of its own;
+* ``asgi``: uvicorn and the native async views of
+  ``event_management_system_app.async_api``.
+
+For each endpoint the bots call, ``--connections`` keep-alive connections
+send ``--requests`` requests between them, each waiting for its response
+before sending the next, as bot workers do. Catalog reads are cached per
+catalog version, so the read rows mix hits with misses on events and
+pages not asked for before; the bookings run last since each one bumps
+the version. Bookings carry idempotency keys, as the bots send them.
+
+Needs gunicorn and uvicorn. The client is a minimal HTTP/1.1 client on
+one event loop, which shares the machine with the server: compare runs
+from the same machine. Results are saved as JSON (by default under
+``benchmarks/results/``); ``--compare`` prints the change from a saved run.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.common import (
+    ROOT, WORDS, load_results, percentile, populate_catalog, print_comparison, print_table, save_results,
+    setup_django, summarize, temporary_database,
+)
+
+SERVERS = ('wsgi', 'asgi-sync', 'asgi')
+DETAIL_FIELDS = 'id,name,category,category_id,start_date,end_date,priority,participants,description,location,organizer'
+
+
+def wsgi_application():
+    """Entry point for gunicorn (``benchmarks.async_views:wsgi_application()``)."""
+    from django.core.wsgi import get_wsgi_application
+
+    return get_wsgi_application()
+
+
+def asgi_application():
+    """Entry point for uvicorn (``--factory benchmarks.async_views:asgi_application``)."""
+    from django.core.asgi import get_asgi_application
+
+    return get_asgi_application()
+
+
+def server_command(server, port, args):
+    if server == 'wsgi':
+        return [
+            sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+            '--worker-class', 'gthread', '--threads', str(args.threads),
+            '--worker-connections', str(args.connections * 2), '--backlog', str(args.connections * 2),
+            '--log-level', 'warning', 'benchmarks.async_views:wsgi_application()',
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', '--factory', 'benchmarks.async_views:asgi_application',
+        '--host', '127.0.0.1', '--port', str(port), '--workers', str(args.workers),
+        '--backlog', str(args.connections * 2), '--log-level', 'warning', '--no-access-log',
+    ]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server, database, directory, args):
+    """Start ``server`` on a free port and wait until it accepts connections."""
+    port = free_port()
+    env = {
+        **os.environ,
+        'PYTHONPATH': str(ROOT),
+        'DJANGO_SETTINGS_MODULE': 'event_management_system.settings_production',
+        'DJANGO_ALLOWED_HOSTS': '127.0.0.1',
+        'DJANGO_ASYNC_VIEWS': '1' if server == 'asgi' else '0',
+        'SQLITE_PATH': database,
+        'DJANGO_CACHE_DIR': os.path.join(directory, f'cache-{server}'),
+    }
+    process = subprocess.Popen(server_command(server, port, args), cwd=ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(f'{server} server did not start')
+            time.sleep(0.1)
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection, one request at a time."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def request(self, method, path, headers=()):
+        """Send a request and read the response; returns its status."""
+        if self.writer is None:
+            await self.open()
+        lines = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1', 'Content-Length: 0', *headers, '', '']
+        self.writer.write('\r\n'.join(lines).encode())
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        status, length, close = int(head[9:12]), None, False
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            if name == b'content-length':
+                length = int(value)
+            elif name == b'connection':
+                close = value.strip().lower() == b'close'
+        await self.reader.readexactly(length or 0)
+        if close:
+            self.close()
+        return status
+
+
+async def drive(port, requests, connections):
+    """Send ``requests`` (``(method, path, headers)``) over ``connections``
+    connections, each waiting for a response before sending again."""
+    pool = [Connection(port) for _ in range(connections)]
+    await asyncio.gather(*(connection.open() for connection in pool))
+    queue = iter(requests)
+    samples, errors = [], 0
+
+    async def worker(connection):
+        nonlocal errors
+        for method, path, headers in queue:
+            started = time.perf_counter()
+            try:
+                errors += await connection.request(method, path, headers) >= 400
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                connection.close()
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(connection) for connection in pool))
+    wall = time.perf_counter() - started
+    for connection in pool:
+        connection.close()
+    ordered = sorted(samples)
+    return {
+        **summarize(samples),
+        'p99.9': percentile(ordered, 0.999) * 1000,
+        'throughput': len(samples) / wall if wall else 0.0,
+        'errors': errors,
+    }
+
+
+def workload(category_ids, event_ids, count, rng):
+    """``{operation: requests}`` in the order they are run."""
+    return {
+        'GET categories': [
+            ('GET', '/api/categories/?fields=id,name&limit=10', ()) for _ in range(count)
+        ],
+        'GET category events': [
+            ('GET', f'/api/categories/{rng.choice(category_ids)}/events/?fields={DETAIL_FIELDS}&limit=10', ())
+            for _ in range(count)
+        ],
+        'GET event': [
+            ('GET', f'/api/events/{rng.choice(event_ids)}/?fields={DETAIL_FIELDS}', ())
+            for _ in range(count)
+        ],
+        'GET search': [
+            ('GET', f'/api/search/?q={rng.choice(WORDS)}+{rng.choice(WORDS)[:3]}&fields={DETAIL_FIELDS}&limit=10', ())
+            for _ in range(count)
+        ],
+        'POST increment_participants': [
+            ('POST', f'/increment_participants/{rng.choice(event_ids)}/', (f'Idempotency-Key: bench:{n}',))
+            for n in range(count)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=20_000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=10_000, help='Requests per endpoint and server.')
+    parser.add_argument('--workers', type=int, default=1, help='Server processes.')
+    parser.add_argument('--threads', type=int, default=32, help="Threads per gunicorn worker.")
+    parser.add_argument('--servers', default=','.join(SERVERS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='Results file (default: benchmarks/results/async_views-<time>.json).')
+    parser.add_argument('--compare', help='A saved results file to compare with.')
+    args = parser.parse_args()
+    servers = [server for server in args.servers.split(',') if server]
+    unknown = set(servers) - set(SERVERS)
+    if unknown:
+        parser.error(f"unknown server(s): {', '.join(sorted(unknown))}")
+
+    setup_django()
+    from event_management_system_app.models import Event
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, temporary_database() as connection:
+        category_ids = populate_catalog(args.categories, args.events)
+        connection.cursor().execute('ANALYZE')
+        event_ids = list(Event.objects.values_list('id', flat=True))
+        database = connection.settings_dict['NAME']
+        # Same requests for every server, each against a fresh server and cache.
+        for server in servers:
+            process, port = start_server(server, database, directory, args)
+            try:
+                operations = workload(category_ids, event_ids, args.requests, random.Random(args.seed))
+                # Warm the server up before timing it.
+                asyncio.run(drive(port, operations['GET categories'][:args.connections], args.connections))
+                for name, requests in operations.items():
+                    results[f'{server} {name}'] = asyncio.run(drive(port, requests, args.connections))
+            finally:
+                stop_server(process)
+
+    print(f'{args.events} events in {args.categories} categories, {args.connections} connections, '
+          f'{args.workers} worker(s), latency in ms\n')
+    print_table(
+        ('operation', 'server', 'per second', 'p50', 'p99', 'p99.9', 'errors'),
+        [(name, server, f"{r['throughput']:.0f}", f"{r['p50']:.1f}", f"{r['p99']:.1f}", f"{r['p99.9']:.1f}",
+          r['errors'])
+         for name in operations for server in servers for r in [results[f'{server} {name}']]],
+    )
+
+    path = args.save or ROOT / 'benchmarks' / 'results' / f"async_views-{datetime.now():%Y%m%d-%H%M%S}.json"
+    save_results(path, 'async_views', results, {key: value for key, value in vars(args).items()
+                                               if key not in ('save', 'compare')})
+    print(f'saved to {path}')
+    if args.compare:
+        print()
+        print_comparison(load_results(args.compare), results, metrics=('p50', 'p99', 'p99.9'))
+
+
+if __name__ == '__main__':
+    main()
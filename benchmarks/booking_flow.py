@@ -0,0 +1,233 @@
+"""Load test of the booking flow, from the site's views to the bot.
+
+    python -m benchmarks.booking_flow [--events 100000] [--requests 500] [--users 200]
+        [--concurrency 20] [--telegram-latency 0.0] [--telegram-limits] [--save PATH] [--compare PATH]
+
+Serves the site from a threaded local HTTP server over a generated catalog
+and measures, with ``--concurrency`` requests in flight:
+
+* ``GET category_list`` and ``GET category_events``, the HTML pages;
+* ``POST increment_participants``, the single-seat booking write;
+* the bot: ``--users`` simulated users each run the whole booking
+  conversation (/start, categories, a category, an event, confirm, name,
+  email) through bot2's real handlers and catalog client. A
+  :class:`~benchmarks.fake_telegram.FakeTelegram` stands in for the Bot
+  API, answering after ``--telegram-latency`` seconds. Every step and the
+  whole conversation are timed.
+
+The bot's send scheduler is unlimited by default, so the steps time the
+handlers. With ``--telegram-limits`` it paces messages at Telegram's rates
+(or the ``BOT_*_SEND_RATE`` settings) and the fake API answers 429s to a
+chat sent more than ``DEFAULT_CHAT_BURST`` messages a second: expect
+conversations of several seconds and no floods.
+
+Client and server share one process, so the numbers are for comparing runs
+on the same machine. Results are saved as JSON (by default under
+``benchmarks/results/``); ``--compare`` prints the change from a saved run.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.common import (
+    ROOT, load_results, populate_catalog, print_comparison, print_table, save_results, setup_django,
+    summarize, temporary_database,
+)
+from benchmarks.fake_telegram import FakeTelegram, callback_update, message_update
+
+BOT_STEPS = ('/start', 'categories', 'category', 'event', 'confirm', 'name', 'email')
+# Messages a second; no pacing at all in effect.
+UNLIMITED = 1_000_000
+
+
+def serve():
+    """Serve the site on a free local port from a background thread."""
+    from django.conf import settings
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, '127.0.0.1']
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def result(samples, wall, errors=0):
+    return {**summarize(samples), 'throughput': len(samples) / wall if wall else 0.0, 'errors': errors}
+
+
+async def load(requests, concurrency):
+    """Await ``requests`` (coroutine factories), ``concurrency`` at a time."""
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples, errors = [], 0
+
+    async def one(request):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await request()
+                errors += response.status_code >= 400
+            except httpx.HTTPError:
+                errors += 1
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(request) for request in requests))
+    return result(samples, time.perf_counter() - started, errors)
+
+
+async def site_load(base_url, category_ids, event_ids, requests, concurrency, rng):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        return {
+            'GET category_list': await load(
+                [lambda: client.get('/') for _ in range(requests)], concurrency,
+            ),
+            'GET category_events': await load(
+                [lambda category_id=rng.choice(category_ids): client.get(f'/categories/{category_id}/')
+                 for _ in range(requests)], concurrency,
+            ),
+            'POST increment_participants': await load(
+                [lambda event_id=rng.choice(event_ids): client.post(f'/increment_participants/{event_id}/')
+                 for _ in range(requests)], concurrency,
+            ),
+        }
+
+
+async def converse(application, telegram, user_id, rng, timings):
+    """One user's booking conversation; returns whether it was confirmed."""
+    bot = application.bot
+
+    async def step(name, update):
+        started = time.perf_counter()
+        await application.process_update(update)
+        timings[name].append(time.perf_counter() - started)
+        return telegram.buttons(user_id)
+
+    started = time.perf_counter()
+    await step('/start', message_update(bot, user_id, '/start'))
+    buttons = await step('categories', callback_update(bot, user_id, 'event_categories'))
+    buttons = await step('category', callback_update(bot, user_id, rng.choice([b for b in buttons if b.startswith('cat_')])))
+    events = [b for b in buttons if b.startswith('event_')]
+    if not events:
+        return False
+    await step('event', callback_update(bot, user_id, rng.choice(events)))
+    await step('confirm', callback_update(bot, user_id, 'confirm_booking'))
+    await step('name', message_update(bot, user_id, f'User {user_id}'))
+    await step('email', message_update(bot, user_id, f'user{user_id}@example.com'))
+    timings['conversation'].append(time.perf_counter() - started)
+    return 'confirmed' in (telegram.sent[user_id][0] or '')
+
+
+async def bot_load(base_url, state_path, users, concurrency, latency, telegram_limits, rng):
+    os.environ['EVENTEASE_API_URL'] = base_url
+    os.environ['BOT_STATE_PATH'] = state_path
+    if not telegram_limits:
+        for name in ('BOT_SEND_RATE', 'BOT_CHAT_SEND_RATE'):
+            os.environ[name] = str(UNLIMITED)
+    import bot2
+    from eventease.sending import DEFAULT_CHAT_BURST
+    from eventease.webhook import application_builder
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    telegram = FakeTelegram(latency, flood_limit=DEFAULT_CHAT_BURST if telegram_limits else None)
+    application = bot2.build_application(
+        application_builder(bot2.TOKEN).request(telegram).get_updates_request(FakeTelegram())
+    )
+    timings = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def user(user_id):
+        async with semaphore:
+            return await converse(application, telegram, user_id, rng, timings)
+
+    async with application:
+        await application.post_init(application)
+        try:
+            started = time.perf_counter()
+            confirmed = await asyncio.gather(*(user(1000 + n) for n in range(users)))
+            wall = time.perf_counter() - started
+        finally:
+            await application.post_shutdown(application)
+    results = {f'bot {name}': result(timings[name], wall) for name in BOT_STEPS}
+    results['bot conversation'] = result(timings['conversation'], wall, errors=users - sum(confirmed))
+    results['bot conversation']['telegram_calls'] = sum(telegram.calls.values()) / users
+    results['bot conversation']['floods'] = telegram.floods
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=100_000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=500, help='Requests per site view.')
+    parser.add_argument('--users', type=int, default=200, help='Simulated bot users.')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='Seconds per Bot API call.')
+    parser.add_argument('--telegram-limits', action='store_true', help="Pace sends at Telegram's rate limits.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='Results file (default: benchmarks/results/booking_flow-<time>.json).')
+    parser.add_argument('--compare', help='A saved results file to compare with.')
+    args = parser.parse_args()
+
+    setup_django()
+    from event_management_system_app.models import Event
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory, temporary_database() as connection:
+        category_ids = populate_catalog(args.categories, args.events)
+        if connection.vendor == 'sqlite':
+            connection.cursor().execute('ANALYZE')
+        event_ids = list(Event.objects.values_list('id', flat=True))
+        server = serve()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+        try:
+            results = asyncio.run(site_load(base_url, category_ids, event_ids, args.requests, args.concurrency, rng))
+            results.update(asyncio.run(bot_load(
+                base_url, os.path.join(directory, 'bot_state.sqlite3'),
+                args.users, args.concurrency, args.telegram_latency, args.telegram_limits, rng,
+            )))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    print(f'{args.events} events in {args.categories} categories ({connection.vendor}), '
+          f'concurrency {args.concurrency}, latency in ms\n')
+    print_table(
+        ('operation', 'n', 'p50', 'p95', 'p99', 'per second', 'errors'),
+        [(name, r['n'], f"{r['p50']:.2f}", f"{r['p95']:.2f}", f"{r['p99']:.2f}", f"{r['throughput']:.1f}", r['errors'])
+         for name, r in results.items()],
+    )
+    conversation = results['bot conversation']
+    print(f"\nBot API calls per conversation: {conversation['telegram_calls']:.1f}, "
+          f"flood control errors: {conversation['floods']}")
+
+    path = args.save or ROOT / 'benchmarks' / 'results' / f"booking_flow-{datetime.now():%Y%m%d-%H%M%S}.json"
+    save_results(path, 'booking_flow', results, {key: value for key, value in vars(args).items()
+                                                 if key not in ('save', 'compare')})
+    print(f'saved to {path}')
+    if args.compare:
+        print()
+        print_comparison(load_results(args.compare), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Bulk import and export throughput.
+
+    python -m benchmarks.bulk_import [--events 500000] [--format csv] [--per-row 2000]
+
+Writes a season schedule of ``--events`` rows to a temporary file, imports
+it with ``bulk.import_events`` and exports it again. For comparison,
+``--per-row`` events are created one ``objects.create()`` at a time like
+``create_event`` does, and the rate is extrapolated. Peak RSS shows that
+memory does not grow with the file.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import WORDS, print_table, setup_django, temporary_database
+
+
+def write_schedule(path, events, format, categories=50, seed=1):
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    columns = ('name', 'category', 'start_date', 'end_date', 'priority', 'description', 'location', 'organizer')
+    with open(path, 'w', newline='') as output:
+        if format == 'csv':
+            import csv
+            writer = csv.writer(output)
+            writer.writerow(columns)
+        for _ in range(events):
+            begins = start + timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            row = (
+                ' '.join(rng.choice(WORDS) for _ in range(3)).title(),
+                f'{WORDS[rng.randrange(categories) % len(WORDS)].title()} {rng.randrange(categories)}',
+                begins.isoformat(),
+                (begins + timedelta(hours=rng.randint(1, 6))).isoformat(),
+                rng.randint(1, 5),
+                ' '.join(rng.choice(WORDS) for _ in range(12)),
+                f'Venue {rng.randint(1, 500)}',
+                f'Organizer {rng.randint(1, 200)}',
+            )
+            if format == 'csv':
+                writer.writerow(row)
+            else:
+                output.write(json.dumps(dict(zip(columns, row))) + '\n')
+
+
+def peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=500_000)
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    parser.add_argument('--per-row', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from event_management_system_app.bulk import export_events, import_events
+    from event_management_system_app.models import Category, Event
+
+    with tempfile.TemporaryDirectory() as directory, temporary_database() as connection:
+        path = os.path.join(directory, f'schedule.{args.format}')
+        write_schedule(path, args.events, args.format)
+        size = os.path.getsize(path) / 2 ** 20
+        rss_before = peak_rss_mib()
+
+        started = time.perf_counter()
+        with open(path, newline='') as stream:
+            result = import_events(stream, args.format, create_categories=True)
+        imported = time.perf_counter() - started
+        rss_import = peak_rss_mib()
+
+        started = time.perf_counter()
+        exported_bytes = sum(len(chunk) for chunk in export_events(format=args.format))
+        exported = time.perf_counter() - started
+
+        category = Category.objects.first()
+        now = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        for i in range(args.per_row):
+            Event.objects.create(name=f'Event {i}', category=category, start_date=now, end_date=now)
+        per_row = (time.perf_counter() - started) / args.per_row
+
+        print(f'{args.events} events, {size:.1f} MiB {args.format} ({connection.vendor}); '
+              f'{result.created} imported, {result.error_count} rejected\n')
+        print_table(
+            ('operation', 'seconds', 'events/s'),
+            [
+                ('bulk import', f'{imported:.1f}', f'{result.created / imported:,.0f}'),
+                ('streaming export', f'{exported:.1f}', f'{args.events / exported:,.0f}'),
+                (f'create() per row (extrapolated from {args.per_row})',
+                 f'{per_row * args.events:.1f}', f'{1 / per_row:,.0f}'),
+            ],
+        )
+        print(f'\npeak RSS {rss_before:.0f} MiB before import, {rss_import:.0f} MiB after; '
+              f'export wrote {exported_bytes / 2 ** 20:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django(settings_module='event_management_system.settings'):
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def temporary_database():
+    """Create a migrated, throwaway copy of the default database."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    settings_dict = connection.settings_dict
+    with tempfile.TemporaryDirectory() as tmp:
+        if connection.vendor == 'sqlite':
+            settings_dict['TEST'] = {**settings_dict.get('TEST', {}), 'NAME': str(Path(tmp) / 'bench.sqlite3')}
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            yield connection
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    values = sorted(sample * 1000 for sample in samples)
+    return {
+        'n': len(values),
+        'mean': statistics.fmean(values) if values else 0.0,
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+    }
+
+
+def measure(fn, repeat=100, warmup=5):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    line = '  '.join(f'{{:<{width}}}' for width in widths)
+    print(line.format(*headers))
+    print(line.format(*['-' * width for width in widths]))
+    for row in rows:
+        print(line.format(*row))
+
+
+def save_results(path, benchmark, results, parameters):
+    """Write ``{operation: summary}`` results as JSON for later comparison."""
+    import json
+    import platform
+    from datetime import datetime, timezone
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'benchmark': benchmark,
+        'recorded_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'parameters': parameters,
+        'results': results,
+    }, indent=2) + '\n')
+
+
+def load_results(path):
+    import json
+
+    return json.loads(Path(path).read_text())
+
+
+def print_comparison(baseline, results, metrics=('p50', 'p95', 'p99')):
+    """Print each metric next to a saved baseline run, with the change."""
+    rows = []
+    for name, current in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        for metric in metrics:
+            if metric in current and metric in before:
+                old, new = before[metric], current[metric]
+                change = f'{(new - old) / old:+.0%}' if old else 'n/a'
+                rows.append((name, metric, f'{old:.3f}', f'{new:.3f}', change))
+    print(f"compared with {baseline['recorded_at']}:\n")
+    print_table(('operation', 'metric', 'baseline', 'now', 'change'), rows)
+
+
+WORDS = (
+    'jazz', 'rock', 'comedy', 'cinema', 'theatre', 'opera', 'festival', 'night',
+    'live', 'open', 'air', 'acoustic', 'classic', 'indie', 'gala', 'summer',
+    'winter', 'workshop', 'tour', 'show', 'dance', 'poetry', 'food', 'market',
+)
+
+
+def populate_catalog(categories=50, events=100_000, seed=1, batch_size=5000):
+    """Fill the current database with a deterministic, realistic catalog."""
+    import random
+    from datetime import timedelta
+
+    from django.db import transaction
+    from django.utils import timezone
+
+    from event_management_system_app.models import Category, Event
+    from event_management_system_app.stats import reconcile
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    with transaction.atomic():
+        category_ids = [
+            Category.objects.create(name=f'{WORDS[i % len(WORDS)].title()} {i}').id
+            for i in range(categories)
+        ]
+        batch = []
+        for i in range(events):
+            start = now + timedelta(minutes=rng.randint(-60 * 24 * 90, 60 * 24 * 365))
+            batch.append(Event(
+                name=' '.join(rng.choice(WORDS) for _ in range(3)).title(),
+                category_id=rng.choice(category_ids),
+                start_date=start,
+                end_date=start + timedelta(hours=rng.randint(1, 6)),
+                priority=rng.randint(1, 5),
+                description=' '.join(rng.choice(WORDS) for _ in range(12)),
+                location=f'Venue {rng.randint(1, 500)}',
+                organizer=f'Organizer {rng.randint(1, 200)}',
+                participants=rng.randint(0, 300),
+            ))
+            if len(batch) >= batch_size:
+                Event.objects.bulk_create(batch)
+                batch = []
+        Event.objects.bulk_create(batch)
+        # bulk_create() sends no signals.
+        reconcile()
+    return category_ids
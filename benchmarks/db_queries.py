@@ -0,0 +1,113 @@
+"""Latency of the catalog's real query patterns on a large dataset.
+
+    python -m benchmarks.db_queries [--events 100000] [--compare]
+
+``--compare`` re-runs every query after swapping the event indexes for the
+single ``category_id`` index the schema had before, to show what they buy.
+"""
+import argparse
+
+from benchmarks.common import measure, populate_catalog, print_table, setup_django, temporary_database
+
+INDEXES = ('event_category_start_idx', 'event_start_idx', 'event_priority_idx', 'event_end_start_idx')
+
+
+def query_patterns(category_id):
+    from django.db.models import Count, Q
+    from django.utils import timezone
+
+    from event_management_system_app.models import Category, Event
+    from event_management_system_app.pagination import encode_cursor, paginate
+    from event_management_system_app.search import ranked_ids
+    from event_management_system_app.stats import bookings_per_day, category_totals
+    from event_management_system_app.timeline import _load, events_between, time_range
+
+    listing = Event.objects.filter(category_id=category_id).values('id', 'name', 'start_date')
+    # Roughly the 50th page of 20.
+    middle = listing.order_by('start_date', 'id')[1000:1001].first()
+    cursor = encode_cursor(middle, ('start_date', 'id')) if middle else None
+    event_id = Event.objects.filter(category_id=category_id).values_list('id', flat=True).first()
+    today = timezone.localdate()
+    week = [today + timezone.timedelta(days=n) for n in range(7)]
+
+    return {
+        'category page 1': lambda: paginate(listing, ('start_date', 'id'), size=20).items,
+        'category page ~50': lambda: paginate(listing, ('start_date', 'id'), after=cursor, size=20).items,
+        # What event_chart computed before, then the statistics rows it reads now.
+        'upcoming counts, from events': lambda: list(Category.objects.annotate(
+            pending=Count('event', filter=Q(event__start_date__gt=timezone.now()))
+        ).values_list('name', 'pending')),
+        'upcoming counts, stats rows': category_totals,
+        'bookings per day, stats rows': bookings_per_day,
+        'upcoming (next 7 days)': lambda: list(Event.objects.filter(
+            start_date__gt=timezone.now(), start_date__lt=timezone.now() + timezone.timedelta(days=7),
+        ).values_list('id', flat=True)[:50]),
+        # A cold load of the day buckets, then the cached read that serves
+        # every "what's on" request until an event on those days changes.
+        "what's on: load 7 day buckets": lambda: _load(week),
+        "what's on: next 7 days, cached": lambda: events_between(*time_range('days', days=7)),
+        'priority filter': lambda: Event.objects.filter(priority=5).count(),
+        'event detail': lambda: Event.objects.filter(pk=event_id).values().first(),
+        # Every match is ranked, so cost follows the number of matches:
+        # about 0.2% and 20% of the catalog here.
+        'search "417"': lambda: ranked_ids('417', 0, 20),
+        'search "jazz night"': lambda: ranked_ids('jazz night', 0, 20),
+        'search "417", icontains': lambda: list(Event.objects.filter(
+            Q(name__icontains='417') | Q(description__icontains='417')
+            | Q(location__icontains='417') | Q(organizer__icontains='417')
+        ).order_by('start_date', 'id').values_list('id', flat=True)[:20]),
+    }
+
+
+def run(patterns, repeat):
+    return {name: measure(fn, repeat=repeat) for name, fn in patterns.items()}
+
+
+def swap_to_old_indexes(connection):
+    from event_management_system_app.models import Event
+
+    table = Event._meta.db_table
+    with connection.cursor() as cursor:
+        for name in INDEXES:
+            cursor.execute(f'DROP INDEX {name}')
+        cursor.execute(f'CREATE INDEX event_category_id_bench ON {table} (category_id)')
+        if connection.vendor == 'sqlite':
+            cursor.execute('ANALYZE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=100_000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--compare', action='store_true')
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database() as connection:
+        category_ids = populate_catalog(args.categories, args.events)
+        if connection.vendor == 'sqlite':
+            connection.cursor().execute('ANALYZE')
+        patterns = query_patterns(category_ids[0])
+        indexed = run(patterns, args.repeat)
+        print(f'{args.events} events in {args.categories} categories ({connection.vendor}), latency in ms\n')
+        if not args.compare:
+            print_table(
+                ('query', 'p50', 'p95', 'p99'),
+                [(name, f"{r['p50']:.3f}", f"{r['p95']:.3f}", f"{r['p99']:.3f}") for name, r in indexed.items()],
+            )
+            return
+        swap_to_old_indexes(connection)
+        unindexed = run(patterns, args.repeat)
+        print_table(
+            ('query', 'p50 indexed', 'p50 before', 'speedup'),
+            [
+                (name, f"{indexed[name]['p50']:.3f}", f"{unindexed[name]['p50']:.3f}",
+                 f"{unindexed[name]['p50'] / max(indexed[name]['p50'], 1e-9):.1f}x")
+                for name in patterns
+            ],
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""An in-process stand-in for the Telegram Bot API.
+
+:class:`FakeTelegram` plugs into python-telegram-bot as the bot's request
+object, answers the methods the bots call with plausible results after an
+optional simulated round trip, and counts the calls. It can also enforce
+flood control, answering 429s the way Telegram does. :func:`message_update`
+and :func:`callback_update` build the updates a user would send.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict, deque
+
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'EventEase', 'username': 'eventease_bot'}
+
+_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}
+
+
+def _message(user_id, text, message_id=None):
+    return {
+        'message_id': message_id or next(_ids), 'date': int(time.time()), 'text': text,
+        'chat': {'id': user_id, 'type': 'private'}, 'from': _user(user_id),
+    }
+
+
+def message_update(bot, user_id, text):
+    data = {'update_id': next(_ids), 'message': _message(user_id, text)}
+    if text.startswith('/'):
+        command = text.split()[0]
+        data['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return Update.de_json(data, bot)
+
+
+def callback_update(bot, user_id, data, message_id=1):
+    return Update.de_json({
+        'update_id': next(_ids),
+        'callback_query': {
+            'id': str(next(_ids)), 'from': _user(user_id), 'chat_instance': str(user_id), 'data': data,
+            'message': {**_message(user_id, '…', message_id), 'from': BOT_USER},
+        },
+    }, bot)
+
+
+class FakeTelegram(BaseRequest):
+    """Answers Bot API calls in-process, each after ``latency`` seconds.
+
+    ``calls`` counts requests per method and ``sent`` keeps the last
+    ``(text, reply_markup)`` sent or edited per chat, so a driver can find
+    the buttons a user would see; ``log`` has every ``(method, chat_id,
+    text)`` delivered, in order.
+
+    With ``flood_limit``, a chat sent or edited more than that many
+    messages within a second gets a 429 asking to retry after
+    ``retry_after`` seconds; ``floods`` counts them.
+    """
+
+    def __init__(self, latency=0.0, flood_limit=None, retry_after=1):
+        self.latency = latency
+        self.flood_limit = flood_limit
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.sent = {}
+        self.log = []
+        self.floods = 0
+        self._recent = defaultdict(deque)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data: RequestData = None, **timeouts):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        parameters = request_data.parameters if request_data else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint in ('sendMessage', 'editMessageText'):
+            chat_id = int(parameters.get('chat_id', 0))
+            if self._flooded(chat_id):
+                self.floods += 1
+                return 429, json.dumps({
+                    'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after},
+                }).encode()
+            self.log.append((endpoint, chat_id, parameters.get('text')))
+            self.sent[chat_id] = (parameters.get('text'), parameters.get('reply_markup'))
+            result = {**_message(chat_id, parameters.get('text', ''), parameters.get('message_id')), 'from': BOT_USER}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    def _flooded(self, chat_id):
+        if self.flood_limit is None:
+            return False
+        now, recent = time.monotonic(), self._recent[chat_id]
+        while recent and recent[0] <= now - 1:
+            recent.popleft()
+        if len(recent) >= self.flood_limit:
+            return True
+        recent.append(now)
+        return False
+
+    def buttons(self, chat_id):
+        """Callback data of the buttons last shown to ``chat_id``, in order."""
+        markup = self.sent.get(chat_id, (None, None))[1]
+        if not markup:
+            return []
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        return [button['callback_data'] for row in markup['inline_keyboard'] for button in row]
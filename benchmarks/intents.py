@@ -0,0 +1,54 @@
+"""Accuracy and latency of the bot's free-text routing.
+
+    python -m benchmarks.intents [--names 2000] [--repeat 200]
+
+Scores ``IntentModel`` against the held-out ``EVALUATION`` set and times
+classifying one message, building the model, and matching a message
+against a ``NameIndex`` of ``--names`` catalog names.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import WORDS, measure, print_table
+from eventease.intent_data import EVALUATION
+from eventease.intents import IntentModel, NameIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--names', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    model = IntentModel()
+    built = time.perf_counter() - started
+
+    predictions = [(text, label, model.classify(text)[0]) for text, label in EVALUATION]
+    misses = [prediction for prediction in predictions if prediction[1] != prediction[2]]
+    correct = len(EVALUATION) - len(misses)
+    print(f'accuracy {correct}/{len(EVALUATION)} ({correct / len(EVALUATION):.0%}), '
+          f'model built in {built * 1000:.1f} ms')
+    for text, label, predicted in misses:
+        print(f'  {text!r}: expected {label}, got {predicted}')
+    print()
+
+    rng = random.Random(1)
+    names = NameIndex(
+        (i, ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))).title())
+        for i in range(args.names)
+    )
+    messages = [text for text, _ in EVALUATION]
+    rows = []
+    for name, fn in (
+        ('classify', lambda: model.classify(rng.choice(messages))),
+        (f'name match ({args.names} names)', lambda: names.match(rng.choice(messages))),
+    ):
+        summary = measure(fn, repeat=args.repeat)
+        rows.append((name, *(f'{summary[key]:.3f}' for key in ('mean', 'p50', 'p95', 'p99'))))
+    print_table(('operation', 'mean ms', 'p50 ms', 'p95 ms', 'p99 ms'), rows)
+
+
+if __name__ == '__main__':
+    main()
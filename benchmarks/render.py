@@ -0,0 +1,152 @@
+"""CPU time bot2's handlers spend per update, with and without reusing renders.
+
+    python -m benchmarks.render [--events 5000] [--categories 50] [--repeat 500]
+
+Runs each browsing handler ``--repeat`` times over an in-memory catalog,
+with a :class:`~benchmarks.fake_telegram.FakeTelegram` answering the Bot
+API. ``uncached`` renders every keyboard and event text on each call, as
+the handlers used to. ``cached`` reuses them through bot2's
+:class:`~eventease.render.RenderCache`. The menus that never change are
+module constants in both runs; the ``render main menu`` row compares
+building the menu on each call with the constant. Times are process CPU
+time per update, including python-telegram-bot's serialization of the
+request; the ``render`` rows time rendering alone.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.booking_flow import UNLIMITED
+from benchmarks.common import print_table
+from benchmarks.fake_telegram import FakeTelegram, callback_update, message_update
+from benchmarks.session_memory import catalog_pages
+
+USER_ID = 1000
+
+
+class MemoryCatalog:
+    """Catalog API pages served from memory; cursors are ignored."""
+
+    def __init__(self, categories, events):
+        self.pages = {key: json.loads(page) for key, page in catalog_pages(categories, events).items()}
+        self.events_by_id = {event['id']: event for page in self.pages.values() for event in page['events']}
+        self.category_ids = sorted({category_id for category_id, _ in self.pages})
+
+    async def categories(self, after=None, before=None):
+        return {
+            'categories': [{'id': category_id, 'name': f'Category {category_id}'} for category_id in self.category_ids[:10]],
+            'next': 'Mg', 'prev': None,
+        }
+
+    async def events(self, category_id, after=None, before=None):
+        return {**self.pages[(category_id, 0)], 'category': {'id': category_id, 'name': f'Category {category_id}'},
+                'next': 'Mg', 'prev': None}
+
+    async def event(self, event_id):
+        return self.events_by_id[event_id]
+
+    async def whats_on(self, when, days=None, after=None, before=None):
+        return {**self.pages[(self.category_ids[0], 0)], 'next': 'Mg', 'prev': None}
+
+
+async def cpu_times(handler, update, context, renders, repeat, warmup=5):
+    """``{mode: samples}``, running the modes' ``renders`` in turn so that
+    both see the same conditions."""
+    samples = {mode: [] for mode in renders}
+    for n in range(warmup + repeat):
+        for mode, cache in renders.items():
+            context.bot_data['renders'] = cache
+            started = time.process_time()
+            await handler(update, context)
+            if n >= warmup:
+                samples[mode].append(time.process_time() - started)
+    return samples
+
+
+def render_times(build, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        build()
+        samples.append(time.process_time() - started)
+    return samples
+
+
+async def run(catalog, repeat):
+    import bot2
+    from eventease.cache import CatalogCache
+    from eventease.render import RenderCache
+    from eventease.webhook import application_builder
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    from telegram.ext import CallbackContext
+
+    application = bot2.build_application(
+        application_builder(bot2.TOKEN).request(FakeTelegram()).get_updates_request(FakeTelegram())
+    )
+    bot = application.bot
+    category_id = catalog.category_ids[0]
+    event_id = catalog.pages[(category_id, 0)]['events'][0]['id']
+    steps = {
+        'start': (bot2.start, message_update(bot, USER_ID, '/start')),
+        'categories': (bot2.event_categories, callback_update(bot, USER_ID, 'event_categories')),
+        'category': (bot2.category_selection, callback_update(bot, USER_ID, f'cat_{category_id}')),
+        'event': (bot2.event_selection, callback_update(bot, USER_ID, f'event_{event_id}')),
+        "what's on": (bot2.whats_on_selection, callback_update(bot, USER_ID, 'when_today')),
+        'company info': (bot2.company_info, callback_update(bot, USER_ID, 'company_info')),
+    }
+    results = {}
+    async with application:
+        cache = application.bot_data['catalog_cache'] = CatalogCache(catalog)
+        renders = {'uncached': RenderCache(maxsize=0), 'cached': RenderCache()}
+        for name, (handler, update) in steps.items():
+            context = CallbackContext.from_update(update, application)
+            for mode, samples in (await cpu_times(handler, update, context, renders, repeat)).items():
+                results[(name, mode)] = samples
+
+        page = await cache.events(category_id)
+        event = await cache.event(event_id)
+        cache = RenderCache()
+        for name, template, source, build, revision in (
+            ('render category', 'events', page, lambda: bot2.render_category_events(page), 0),
+            ('render event', 'event', event, lambda: bot2.render_event(event), event.revision),
+        ):
+            results[(name, 'uncached')] = render_times(build, repeat)
+            results[(name, 'cached')] = render_times(lambda: cache.get(template, source, build, revision), repeat)
+        # What the start handler built on every call before the menu became a constant.
+        results[('render main menu', 'uncached')] = render_times(lambda: InlineKeyboardMarkup([
+            [InlineKeyboardButton(button.text, callback_data=button.callback_data) for button in row]
+            for row in bot2.MAIN_MENU_KEYBOARD.inline_keyboard
+        ]), repeat)
+        results[('render main menu', 'cached')] = render_times(lambda: bot2.MAIN_MENU_KEYBOARD, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    catalog = MemoryCatalog(args.categories, args.events)
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['BOT_STATE_PATH'] = os.path.join(directory, 'bot_state.sqlite3')
+        # Time the handlers, not the waits for Telegram's rate limits.
+        for name in ('BOT_SEND_RATE', 'BOT_CHAT_SEND_RATE'):
+            os.environ[name] = str(UNLIMITED)
+        results = asyncio.run(run(catalog, args.repeat))
+
+    rows = []
+    for name in dict.fromkeys(name for name, _ in results):
+        before, after = (statistics.fmean(results[(name, mode)]) * 1e6 for mode in ('uncached', 'cached'))
+        rows.append((name, f'{before:.1f}', f'{after:.1f}', f'{(after - before) / before:+.0%}'))
+    print(f'{args.events} events in {args.categories} categories, {args.repeat} calls each, CPU time\n')
+    print_table(('handler', 'uncached µs', 'cached µs', 'change'), rows)
+
+
+if __name__ == '__main__':
+    main()
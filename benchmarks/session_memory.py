@@ -0,0 +1,141 @@
+"""Memory a bot process holds for users browsing the catalog.
+
+    python -m benchmarks.session_memory [--users 50000] [--events 5000]
+
+Simulates ``--users`` users who each opened a page of events in some
+category and then one event on it:
+
+* ``legacy`` keeps what bot2 kept in ``user_data`` before: the parsed event
+  dicts of the page the user received and the chosen event dict.
+* ``compact`` keeps only IDs and page cursors in ``user_data``; each event
+  is held once, as an ``EventRecord`` in the shared ``EventIndex``.
+
+Memory is measured with tracemalloc and includes the shared index.
+"""
+import argparse
+import base64
+import gc
+import json
+import random
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import WORDS, print_table
+from eventease.cache import EventIndex
+from eventease.catalog import PAGE_SIZE
+
+
+def catalog_pages(categories, events, seed=1):
+    """``{(category_id, page_number): page JSON}`` shaped like the events API."""
+    rng = random.Random(seed)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    by_category = {category_id: [] for category_id in range(1, categories + 1)}
+    for event_id in range(1, events + 1):
+        category_id = rng.randint(1, categories)
+        start = now + timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+        by_category[category_id].append({
+            'id': event_id,
+            'name': ' '.join(rng.choice(WORDS) for _ in range(3)).title(),
+            'category': f'{WORDS[category_id % len(WORDS)].title()} {category_id}',
+            'category_id': category_id,
+            'start_date': start.isoformat().replace('+00:00', 'Z'),
+            'end_date': (start + timedelta(hours=2)).isoformat().replace('+00:00', 'Z'),
+            'priority': rng.randint(1, 5),
+            'participants': rng.randint(0, 300),
+            'description': ' '.join(rng.choice(WORDS) for _ in range(12)),
+            'location': f'Venue {rng.randint(1, 500)}',
+            'organizer': f'Organizer {rng.randint(1, 200)}',
+        })
+    pages = {}
+    for category_id, category_events in by_category.items():
+        category_events.sort(key=lambda event: (event['start_date'], event['id']))
+        for number in range(0, len(category_events), PAGE_SIZE):
+            pages[(category_id, number // PAGE_SIZE)] = json.dumps({'events': category_events[number:number + PAGE_SIZE]})
+    return pages
+
+
+def cursor(event):
+    raw = json.dumps([event['start_date'], event['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def legacy_sessions(pages, picks):
+    sessions = []
+    for key, position in picks:
+        # Every user parsed their own response.
+        events = json.loads(pages[key])['events']
+        sessions.append({'category': key[0], 'events': events, 'event': events[position]})
+    return sessions
+
+
+def compact_sessions(pages, picks):
+    index = EventIndex(client=None, maxsize=len(pages) * PAGE_SIZE)
+    # The catalog cache loads each page once and shares it.
+    shared_pages = {}
+    sessions = []
+    for key, position in picks:
+        if key not in shared_pages:
+            shared_pages[key] = [index.add(event) for event in json.loads(pages[key])['events']]
+        events = shared_pages[key]
+        first, last = events[0], events[-1]
+        page_cursors = {
+            'current': {'after': cursor({'start_date': first.start_date, 'id': first.id})},
+            'next': cursor({'start_date': last.start_date, 'id': last.id}),
+            'prev': cursor({'start_date': first.start_date, 'id': first.id}),
+        }
+        sessions.append({
+            'category': key[0],
+            'category_page': {'current': {}, 'next': 'WzEwXQ', 'prev': None},
+            'event_page': page_cursors,
+            'event_id': events[position].id,
+        })
+    return sessions, index, shared_pages
+
+
+def traced(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--categories', type=int, default=50)
+    args = parser.parse_args()
+
+    pages = catalog_pages(args.categories, args.events)
+    rng = random.Random(2)
+    keys = list(pages)
+    picks = []
+    for _ in range(args.users):
+        key = rng.choice(keys)
+        picks.append((key, rng.randrange(len(json.loads(pages[key])['events']))))
+
+    legacy, legacy_bytes = traced(lambda: legacy_sessions(pages, picks))
+    legacy_stored = sum(len(json.dumps(session)) for session in legacy)
+    del legacy
+    (compact, index, _), compact_bytes = traced(lambda: compact_sessions(pages, picks))
+    compact_stored = sum(len(json.dumps(session)) for session in compact)
+
+    print(f'{args.users} users, {args.events} events in {args.categories} categories, '
+          f'{len(index)} events indexed\n')
+    print_table(
+        ('layout', 'memory MiB', 'bytes/user', 'persisted bytes/user'),
+        [
+            (name, f'{total / 2 ** 20:.1f}', f'{total / args.users:.0f}', f'{stored / args.users:.0f}')
+            for name, total, stored in (
+                ('legacy', legacy_bytes, legacy_stored),
+                ('compact', compact_bytes, compact_stored),
+            )
+        ],
+    )
+
+
+if __name__ == '__main__':
+    main()
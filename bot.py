@@ -1,12 +1,19 @@
 import logging
-import requests
-from bs4 import BeautifulSoup
+import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
     ConversationHandler, MessageHandler, filters, ContextTypes
 )
-from datetime import datetime
+
+from eventease.bookings import booking_key, new_conversation_id
+from eventease.cache import CatalogCache
+from eventease.catalog import CatalogClient, CatalogError
+from eventease.metrics import instrument_application, serve_from_env
+from eventease.profiling import profile_application
+from eventease.sending import HIGH
+from eventease.sync import CatalogSync
+from eventease.webhook import application_builder, run
 
 # Enable logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
@@ -14,47 +21,17 @@ logger = logging.getLogger(__name__)
 
 # Define conversation states
 MAIN_MENU, CATEGORY, EVENT, BOOKING, NAME, EMAIL = range(6)
+# Their names in metrics
+STATE_NAMES = dict(enumerate(('main_menu', 'category', 'event', 'booking', 'name', 'email')))
 
-# URL of the Django website to scrape event data from localhost
-DJANGO_WEBSITE_URL = "http://127.0.0.1:8000"
+TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', "6874845152:AAHVmTYvC_6pM_w7TtDDMYqWPvcFN9Vrcsg")
 
-def scrape_event_categories():
-    try:
-        response = requests.get(f"{DJANGO_WEBSITE_URL}")
-        soup = BeautifulSoup(response.text, 'html.parser')
-        categories = {cat.text: f"{DJANGO_WEBSITE_URL}{cat['href']}" for cat in soup.find_all('a', class_='category-link')}
-        return categories
-    except requests.RequestException as e:
-        logger.error(f"Error scraping event categories: {e}")
-        return {}
+# URL of the Django website serving the catalog API
+DJANGO_WEBSITE_URL = os.environ.get('EVENTEASE_API_URL', "http://127.0.0.1:8000")
 
-def scrape_events_for_category(category_url):
-    try:
-        response = requests.get(category_url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        events = []
-        for event in soup.find_all('div', class_='event'):
-            event_data = {
-                'id': int(event['data-event-id']),  # Convert to integer
-                'name': event.find('h2').text.strip(),
-                'start_date': event.find('span', class_='date').text.strip() + ' ' + event.find('span', class_='time').text.strip(),
-                'end_date': event.find('span', class_='end-date').text.strip() + ' ' + event.find('span', class_='end-time').text.strip(),
-                'category': event.find('span', class_='category').text.strip(),
-                'priority': int(event.find('span', class_='priority').text.strip()),
-                'description': event.find('p', class_='description').text.strip(),
-                'location': event.find('span', class_='venue').text.strip(),
-                'organizer': event.find('span', class_='organizer').text.strip(),
-                'participants': int(event.find('span', class_='participants').text.strip())
-            }  
-            events.append(event_data)
-        return events
-    except requests.RequestException as e:
-        logger.error(f"Error scraping events for category: {e}")
-        return []
-
-# Start command handler
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    features = """
+# Messages and keyboards that never change, built once. Markups are
+# immutable, so every user can be sent the same object.
+START_TEXT = """
 🎉 Welcome to EventEase Bot! 🎉
 
 Here are the main features of our bot:
@@ -75,26 +52,74 @@ Here are the main features of our bot:
 
 How can I assist you today?
     """
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎫 Book Event", callback_data='book_event')],
+    [InlineKeyboardButton("ℹ️ Company Info", callback_data='company_info')],
+    [InlineKeyboardButton("📞 Contact Us", callback_data='contact_us')]
+])
+COMPANY_INFO_TEXT = """
+    About EventEase
+    Welcome to EventEase! We specialize in providing seamless event booking experiences. Our platform offers a wide range of events, 
+    from cinema screenings to live music and comedy shows. Our mission is to make your event booking process as smooth and enjoyable as possible.
+    """
+CONTACT_US_TEXT = """
+    📞 Contact Us
     
-    keyboard = [
-        [InlineKeyboardButton("🎫 Book Event", callback_data='book_event')],
-        [InlineKeyboardButton("ℹ️ Company Info", callback_data='company_info')],
-        [InlineKeyboardButton("📞 Contact Us", callback_data='contact_us')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    We'd love to hear from you! If you have any questions or need assistance, please reach out to us:
     
+    📧 Email: support@eventease.com
+    📱 Phone: +1-234-567-890
+    
+    Our support team is available Monday to Friday, 9 AM to 6 PM.
+    """
+BACK_TO_MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')]])
+
+async def open_catalog(application: Application) -> None:
+    catalog = CatalogClient(DJANGO_WEBSITE_URL)
+    application.bot_data['catalog'] = catalog
+    # Shared by every user, so catalog reads scale with catalog changes, not clicks
+    application.bot_data['catalog_cache'] = CatalogCache(catalog)
+    # Kept up to date from the site's change feed rather than by re-fetching
+    application.bot_data['catalog_sync'] = CatalogSync(application.bot_data['catalog_cache'], catalog)
+    application.bot_data['catalog_sync'].start()
+
+    # Prometheus-style /metrics listener, when BOT_METRICS_PORT is set
+    application.bot_data['metrics_server'] = await serve_from_env()
+
+async def close_catalog(application: Application) -> None:
+    if application.bot_data['metrics_server']:
+        application.bot_data['metrics_server'].close()
+    await application.bot_data['catalog_sync'].stop()
+    await application.bot_data['catalog'].aclose()
+
+async def fetch_event_categories(catalog):
+    try:
+        page = await catalog.categories()
+        return {cat['name']: cat['id'] for cat in page['categories']}
+    except CatalogError as e:
+        logger.error(f"Error fetching event categories: {e}")
+        return {}
+
+async def fetch_events_for_category(catalog, category_id):
+    try:
+        return (await catalog.events(category_id))['events']
+    except CatalogError as e:
+        logger.error(f"Error fetching events for category: {e}")
+        return []
+
+# Start command handler
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if update.message:
-        await update.message.reply_text(features, reply_markup=reply_markup)
+        await update.message.reply_text(START_TEXT, reply_markup=MAIN_MENU_KEYBOARD)
     else:
-        await update.callback_query.edit_message_text(features, reply_markup=reply_markup)
+        await update.callback_query.edit_message_text(START_TEXT, reply_markup=MAIN_MENU_KEYBOARD)
     return MAIN_MENU
 
 # Book event handler
 async def book_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    categories = scrape_event_categories()
-    context.user_data['categories'] = categories
+    categories = await fetch_event_categories(context.bot_data['catalog_cache'])
     if not categories:
         await query.edit_message_text("Sorry, we couldn't fetch event categories at the moment. Please try again later.")
         return MAIN_MENU
@@ -116,6 +141,7 @@ async def category_selection(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     category = query.data.split('_')[1]
     context.user_data['category'] = category
+    context.user_data['booking_id'] = new_conversation_id()
     
     await query.edit_message_text(f"You've selected the {category} category. Please enter your name:")
     return NAME
@@ -123,6 +149,7 @@ async def category_selection(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def enter_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
+    context.user_data['booking_id'] = new_conversation_id()
     await query.edit_message_text("Please enter your name:")
     return NAME
 
@@ -151,27 +178,38 @@ async def save_email(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     print("\n\n\n")
     print(event_id)
     if event_id:
+        # Retried on failure under one key, so the seat is taken at most once.
+        key = booking_key(
+            update.effective_chat.id, event_id, context.user_data.setdefault('booking_id', new_conversation_id())
+        )
         try:
-            response = requests.post(f"{DJANGO_WEBSITE_URL}/increment_participants/{event_id}/")
-            if response.status_code == 200:
-                participants = response.json()['participants']
-                booking_message = f"Your booking for '{event['name']}' in the {category} category is confirmed!\n\n"
-                booking_message += f"Name: {name}\nEmail: {email}\n\n"
-                booking_message += f"You are participant number {participants}!\n\n"
-                booking_message += "Thank you for using EventEase!"
-            else:
-                booking_message = "Your booking is confirmed, but we couldn't update the participant count."
-        except requests.RequestException:
-            booking_message = "Your booking is confirmed, but we couldn't update the participant count."
+            participants = await context.bot_data['catalog'].increment_participants(event_id, key=key)
+        except CatalogError:
+            # Keep the key: sending the email again retries the same booking.
+            await update.message.reply_text(
+                f"Sorry, we couldn't confirm your booking for '{event['name']}' yet. "
+                "Please send your email again to retry."
+            )
+            return EMAIL
+        if participants is None:
+            booking_message = f"Sorry, '{event['name']}' is fully booked."
+        else:
+            booking_message = f"Your booking for '{event['name']}' in the {category} category is confirmed!\n\n"
+            booking_message += f"Name: {name}\nEmail: {email}\n\n"
+            booking_message += f"You are participant number {participants}!\n\n"
+            booking_message += "Thank you for using EventEase!"
     else:
         booking_message = f"Your booking for the {category} category is confirmed!\n\n"
         booking_message += f"Name: {name}\nEmail: {email}\n\n"
         booking_message += "Thank you for using EventEase!"
     
-    keyboard = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    context.user_data.pop('booking_id', None)
     
-    await update.message.reply_text(booking_message, reply_markup=reply_markup)
+    # Sent ahead of menu edits waiting for the same rate limits.
+    await context.bot.send_message(
+        update.effective_chat.id, booking_message, reply_markup=BACK_TO_MAIN_MENU_KEYBOARD,
+        rate_limit_args={'priority': HIGH},
+    )
     return MAIN_MENU
 
 async def book_now(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -184,10 +222,7 @@ async def book_now(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     
     booking_message = f"Your ticket for the {category} category has been booked!\n\nName: {name}\nEmail: {email}\n\nThank you for using EventEase!"
     
-    keyboard = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(booking_message, reply_markup=reply_markup)
+    await query.edit_message_text(booking_message, reply_markup=BACK_TO_MAIN_MENU_KEYBOARD)
     return MAIN_MENU
 
 # The rest of the code remains the same...
@@ -235,39 +270,24 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def company_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    company_info_text = """
-    About EventEase
-    Welcome to EventEase! We specialize in providing seamless event booking experiences. Our platform offers a wide range of events, 
-    from cinema screenings to live music and comedy shows. Our mission is to make your event booking process as smooth and enjoyable as possible.
-    """
-    keyboard = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(company_info_text, reply_markup=reply_markup)
+    await query.edit_message_text(COMPANY_INFO_TEXT, reply_markup=BACK_TO_MAIN_MENU_KEYBOARD)
     return MAIN_MENU
 
 # Contact info handler
 async def contact_us(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    contact_info_text = """
-    📞 Contact Us
-    
-    We'd love to hear from you! If you have any questions or need assistance, please reach out to us:
-    
-    📧 Email: support@eventease.com
-    📱 Phone: +1-234-567-890
-    
-    Our support team is available Monday to Friday, 9 AM to 6 PM.
-    """
-    keyboard = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(contact_info_text, reply_markup=reply_markup)
+    await query.edit_message_text(CONTACT_US_TEXT, reply_markup=BACK_TO_MAIN_MENU_KEYBOARD)
     return MAIN_MENU
 
 
-# Main function to start the bot
-def main():
-    application = Application.builder().token("6874845152:AAHVmTYvC_6pM_w7TtDDMYqWPvcFN9Vrcsg").build()
+def build_application():
+    application = (
+        application_builder(TOKEN)
+        .post_init(open_catalog)
+        .post_shutdown(close_catalog)
+        .build()
+    )
     conv_handler = ConversationHandler(
     entry_points=[CommandHandler('start', start)],
     states={
@@ -294,8 +314,12 @@ def main():
 
     application.add_handler(conv_handler)
     application.add_handler(CallbackQueryHandler(start, pattern='^main_menu$'))
+    profile_application(application)
+    instrument_application(application, STATE_NAMES)
+    return application
 
-    application.run_polling()
+def main():
+    run(build_application())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,62 +1,62 @@
+import functools
 import logging
-import requests
-from bs4 import BeautifulSoup
+import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
     ConversationHandler, MessageHandler, filters, ContextTypes
 )
-from datetime import datetime
+
+from eventease.bookings import BookingQueue, booking_key, new_conversation_id
+from eventease.cache import CatalogCache
+from eventease.catalog import CatalogClient, CatalogError, format_datetime
+from eventease.intents import CatalogNames, IntentModel, tokenize
+from eventease.persistence import persistence_from_env, share_conversations
+from eventease.metrics import instrument_application, serve_from_env
+from eventease.profiling import profile_application
+from eventease.render import RenderCache
+from eventease.sending import HIGH
+from eventease.sync import CatalogSync
+from eventease.webhook import application_builder, run
 
 # Enable logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Define conversation states
-MAIN_MENU, CATEGORY, EVENT, BOOKING, NAME, EMAIL = range(6)
+MAIN_MENU, CATEGORY, EVENT, BOOKING, NAME, EMAIL, SEARCH, WHATS_ON = range(8)
+# Their names in metrics
+STATE_NAMES = dict(enumerate(('main_menu', 'category', 'event', 'booking', 'name', 'email', 'search', 'whats_on')))
 
-# URL of the Django website to scrape event data from localhost
-DJANGO_WEBSITE_URL = "http://127.0.0.1:8000"
+TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', "6874845152:AAHVmTYvC_6pM_w7TtDDMYqWPvcFN9Vrcsg")
 
-def scrape_event_categories():
-    try:
-        response = requests.get(f"{DJANGO_WEBSITE_URL}")
-        soup = BeautifulSoup(response.text, 'html.parser')
-        categories = {cat.text: f"{DJANGO_WEBSITE_URL}{cat['href']}" for cat in soup.find_all('a', class_='category-link')}
-        return categories
-    except requests.RequestException as e:
-        logger.error(f"Error scraping event categories: {e}")
-        return {}
-
-def scrape_events_for_category(category_url):
-    try:
-        response = requests.get(category_url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        events = []
-        for event_div in soup.find_all('div', class_='event'):
-            event_data = {
-                'id': int(event_div.find('p', id='event-id').text.split(':')[1].strip()),
-                'name': event_div.find('p', id='event-name').text.split(':')[1].strip(),
-                'category': event_div.find('p', id='event-category').text.split(':')[1].strip(),
-                'start_date': event_div.find('p', id='event-start-date').text.split(':')[1].strip(),
-                'end_date': event_div.find('p', id='event-end-date').text.split(':')[1].strip(),
-                'priority': int(event_div.find('p', id='event-priority').text.split(':')[1].strip()),
-                'participants': int(event_div.find('p', id='event-participants').text.split(':')[1].strip()),
-                'description': event_div.find('p', id='event-description').text.split(':')[1].strip(),
-                'location': event_div.find('p', id='event-location').text.split(':')[1].strip(),
-                'organizer': event_div.find('p', id='event-organizer').text.split(':')[1].strip()
-            }
-            events.append(event_data)
-        return events
-    except requests.RequestException as e:
-        logger.error(f"Error scraping events for category: {e}")
-        return []
-    except Exception as e:
-        logger.error(f"Unexpected error while scraping events: {e}")
-        return []
+# user_data keys kept across restarts and shared between bot workers.
+# Only IDs, page cursors and what the user typed; never catalog data.
+PERSISTED_USER_DATA = (
+    'category', 'category_page', 'event_page', 'search', 'search_page', 'when', 'when_page', 'back',
+    'event_id', 'name', 'email', 'booking_id',
+)
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    features = """
+# /whatson ranges: button key -> label. 'week' is the API's 'days' range.
+WHATS_ON_RANGES = {
+    'ongoing': "🟢 On now",
+    'today': "📅 Today",
+    'tonight': "🌙 Tonight",
+    'weekend': "🎉 This weekend",
+    'week': "🗓️ Next 7 days",
+}
+# Words in a typed "what's on" question that pick a range directly.
+WHATS_ON_WORDS = {
+    'now': 'ongoing', 'today': 'today', 'tonight': 'tonight', 'evening': 'tonight',
+    'weekend': 'weekend', 'saturday': 'weekend', 'sunday': 'weekend', 'week': 'week',
+}
+
+# URL of the Django website serving the catalog API
+DJANGO_WEBSITE_URL = os.environ.get('EVENTEASE_API_URL', "http://127.0.0.1:8000")
+
+# Messages and keyboards that never change, built once. Markups are
+# immutable, so every user can be sent the same object.
+START_TEXT = """
 🎉 Welcome to EventEase Bot! 🎉
 
 Here are the main features of our bot:
@@ -72,36 +72,199 @@ Here are the main features of our bot:
 3. 📞 Contact Us:
    - Get our contact information for further inquiries
 
+4. 🔎 Search:
+   - Send /search followed by a few words, e.g. /search jazz night
+
+5. 🗓️ What's On:
+   - Send /whatson to see what's on now, today, tonight or this weekend
+
+You can also just tell me what you're after, like "book a comedy show".
+
 How can I assist you today?
     """
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 Event Categories List", callback_data='event_categories')],
+    [InlineKeyboardButton("🗓️ What's On", callback_data='whats_on')],
+    [InlineKeyboardButton("ℹ️ Company Info", callback_data='company_info')],
+    [InlineKeyboardButton("📞 Contact Us", callback_data='contact_us')]
+])
+COMPANY_INFO_TEXT = """
+    About EventEase
+    Welcome to EventEase! We specialize in providing seamless event booking experiences. Our platform offers a wide range of events, 
+    from cinema screenings to live music and comedy shows. Our mission is to make your event booking process as smooth and enjoyable as possible.
+    """
+CONTACT_US_TEXT = """
+    📞 Contact Us
+    
+    We'd love to hear from you! If you have any questions or need assistance, please reach out to us:
+    
+    📧 Email: support@eventease.com
+    📱 Phone: +1-234-567-890
     
+    Our support team is available Monday to Friday, 9 AM to 6 PM.
+    """
+BACK_TO_MAIN_MENU = InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')
+BACK_TO_MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([[BACK_TO_MAIN_MENU]])
+WHATS_ON_KEYBOARD = InlineKeyboardMarkup([
+    *([InlineKeyboardButton(label, callback_data=f'when_{key}')] for key, label in WHATS_ON_RANGES.items()),
+    [BACK_TO_MAIN_MENU],
+])
+WHATS_ON_BACK = InlineKeyboardButton("🔙 Back", callback_data='whats_on')
+
+async def open_catalog(application: Application) -> None:
+    catalog = CatalogClient(DJANGO_WEBSITE_URL)
+    application.bot_data['catalog'] = catalog
+    # Shared by every user, so catalog reads scale with catalog changes, not clicks
+    application.bot_data['catalog_cache'] = CatalogCache(catalog)
+    # Kept up to date from the site's change feed rather than by re-fetching
+    application.bot_data['catalog_sync'] = CatalogSync(application.bot_data['catalog_cache'], catalog)
+    application.bot_data['catalog_sync'].start()
+    # Bookings are written in batches, one transaction per batch
+    application.bot_data['booking_queue'] = BookingQueue(catalog)
+    application.bot_data['booking_queue'].start()
+    # Free-text routing: intents plus catalog names mentioned in a message
+    application.bot_data['intents'] = IntentModel()
+    application.bot_data['catalog_names'] = CatalogNames(application.bot_data['catalog_cache'])
+    # Keyboards and texts rendered from catalog pages, reused until a page changes
+    application.bot_data['renders'] = RenderCache()
+
+    # Prometheus-style /metrics listener, when BOT_METRICS_PORT is set
+    application.bot_data['metrics_server'] = await serve_from_env()
+
+async def close_catalog(application: Application) -> None:
+    if application.bot_data['metrics_server']:
+        application.bot_data['metrics_server'].close()
+    await application.bot_data['catalog_sync'].stop()
+    await application.bot_data['booking_queue'].stop()
+    await application.bot_data['catalog'].aclose()
+
+async def fetch_category_page(catalog, after=None, before=None):
+    try:
+        return await catalog.categories(after=after, before=before)
+    except CatalogError as e:
+        logger.error(f"Error fetching event categories: {e}")
+        return None
+
+async def fetch_events_page(catalog, category_id, after=None, before=None):
+    try:
+        return await catalog.events(category_id, after=after, before=before)
+    except CatalogError as e:
+        logger.error(f"Error fetching events for category: {e}")
+        return None
+
+async def fetch_search_page(catalog, text, after=None, before=None):
+    try:
+        return await catalog.search(text, after=after, before=before)
+    except CatalogError as e:
+        logger.error(f"Error searching events: {e}")
+        return None
+
+async def fetch_whats_on_page(catalog, key, after=None, before=None):
+    when, days = ('days', 7) if key == 'week' else (key, None)
+    try:
+        return await catalog.whats_on(when, days=days, after=after, before=before)
+    except CatalogError as e:
+        logger.error(f"Error fetching events on {key}: {e}")
+        return None
+
+async def fetch_event(catalog, event_id):
+    try:
+        return await catalog.event(event_id)
+    except CatalogError as e:
+        logger.error(f"Error fetching event {event_id}: {e}")
+        return None
+
+def page_cursor(query, context, key):
+    """Map a '<prefix>_next', '<prefix>_prev' or '<prefix>_back' button to API cursors."""
+    action = query.data.rsplit('_', 1)[1]
+    cursors = context.user_data.get(key, {})
+    if action == 'next':
+        return {'after': cursors.get('next')}
+    if action == 'prev':
+        return {'before': cursors.get('prev')}
+    return cursors.get('current', {})
+
+def remember_page(context, key, cursor, page):
+    context.user_data[key] = {'current': cursor, 'next': page['next'], 'prev': page['prev']}
+
+def respond(update):
+    """Reply to a typed message, or edit the message whose button was pressed."""
+    return update.message.reply_text if update.message else update.callback_query.edit_message_text
+
+def page_buttons(prefix, page):
+    buttons = []
+    if page['prev']:
+        buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=f'{prefix}_prev'))
+    if page['next']:
+        buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f'{prefix}_next'))
+    return [buttons] if buttons else []
+
+def render_categories(page):
     keyboard = [
-        [InlineKeyboardButton("📋 Event Categories List", callback_data='event_categories')],
-        [InlineKeyboardButton("ℹ️ Company Info", callback_data='company_info')],
-        [InlineKeyboardButton("📞 Contact Us", callback_data='contact_us')]
+        [InlineKeyboardButton(cat['name'], callback_data=f"cat_{cat['id']}")] for cat in page['categories']
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    keyboard += page_buttons('catpage', page)
+    keyboard.append([BACK_TO_MAIN_MENU])
+    return InlineKeyboardMarkup(keyboard)
+
+def render_category_events(page):
+    keyboard = [
+        [InlineKeyboardButton(event.name, callback_data=f"event_{event.id}")] for event in page['events']
+    ]
+    keyboard += page_buttons('evpage', page)
+    keyboard.append([InlineKeyboardButton("🔙 Back to Categories", callback_data='catpage_back')])
+    return f"Events in {page['category']['name']} category:", InlineKeyboardMarkup(keyboard)
+
+def render_event(event):
+    return f"""
+    🎭 Event: {event.name}
+    🏷️ Category: {event.category}
+    📅 Start: {format_datetime(event.start_date)}
+    🏁 End: {format_datetime(event.end_date)}
+    🔢 Priority: {event.priority}
+    👥 Participants: {event.participants}
+    📍 Location: {event.location}
+    🎤 Organizer: {event.organizer}
     
-    if update.message:
-        await update.message.reply_text(features, reply_markup=reply_markup)
-    else:
-        await update.callback_query.edit_message_text(features, reply_markup=reply_markup)
+    📝 Description: {event.description}
+    
+    Would you like to book this event?
+    """
+
+@functools.lru_cache(maxsize=1024)
+def event_keyboard(back):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Yes, book now", callback_data='confirm_booking')],
+        [InlineKeyboardButton("🔙 Back to Events", callback_data=back)]
+    ])
+
+def render_whats_on(page, label):
+    keyboard = [
+        [InlineKeyboardButton(f"{format_datetime(event['start_date'])} · {event['name']}", callback_data=f"event_{event['id']}")]
+        for event in page['events']
+    ]
+    keyboard += page_buttons('whenpage', page)
+    keyboard.append([WHATS_ON_BACK])
+    return InlineKeyboardMarkup(keyboard)
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await respond(update)(START_TEXT, reply_markup=MAIN_MENU_KEYBOARD)
     return MAIN_MENU
 
 async def event_categories(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    categories = scrape_event_categories()
-    context.user_data['categories'] = categories
-    if not categories:
-        await query.edit_message_text("Sorry, we couldn't fetch event categories at the moment. Please try again later.")
+    cursor = page_cursor(query, context, 'category_page') if query.data.startswith('catpage_') else {}
+    return await show_categories(update, context, cursor)
+
+async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE, cursor) -> int:
+    page = await fetch_category_page(context.bot_data['catalog_cache'], **cursor)
+    if not page or not page['categories']:
+        await respond(update)("Sorry, we couldn't fetch event categories at the moment. Please try again later.")
         return MAIN_MENU
-    keyboard = [
-        [InlineKeyboardButton(cat, callback_data=f'cat_{cat}')] for cat in categories.keys()
-    ]
-    keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(
+    remember_page(context, 'category_page', cursor, page)
+    reply_markup = context.bot_data['renders'].get('categories', page, lambda: render_categories(page))
+    await respond(update)(
         "🌈 Please select an event category:",
         reply_markup=reply_markup
     )
@@ -110,66 +273,159 @@ async def event_categories(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 async def category_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    category = query.data.split('_')[1]
-    context.user_data['category'] = category
-    
-    category_url = context.user_data['categories'][category]
-    events = scrape_events_for_category(category_url)
-    context.user_data['events'] = events
+    if query.data.startswith('cat_'):
+        category_id = int(query.data.split('_')[1])
+        cursor = {}
+    else:
+        category_id = context.user_data['category']
+        cursor = page_cursor(query, context, 'event_page')
+    return await show_category_events(update, context, category_id, cursor)
+
+async def show_category_events(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id, cursor) -> int:
+    context.user_data['category'] = category_id
+    page = await fetch_events_page(context.bot_data['catalog_cache'], category_id, **cursor)
+    category = page['category']['name'] if page else 'selected'
     
-    if not events:
-        await query.edit_message_text(f"Sorry, no events found in the {category} category.")
+    if not page or not page['events']:
+        await respond(update)(f"Sorry, no events found in the {category} category.")
         return MAIN_MENU
     
-    keyboard = [
-        [InlineKeyboardButton(event['name'], callback_data=f"event_{event['id']}")] for event in events
-    ]
-    keyboard.append([InlineKeyboardButton("🔙 Back to Categories", callback_data='event_categories')])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    remember_page(context, 'event_page', cursor, page)
+    context.user_data['back'] = 'evpage_back'
     
-    await query.edit_message_text(f"Events in {category} category:", reply_markup=reply_markup)
+    text, reply_markup = context.bot_data['renders'].get('events', page, lambda: render_category_events(page))
+    await respond(update)(text, reply_markup=reply_markup)
     return EVENT
 
 async def event_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    event_id = int(query.data.split('_')[1])
-    events = context.user_data['events']
-    event = next((event for event in events if event['id'] == event_id), None)
+    return await show_event(update, context, int(query.data.split('_')[1]))
+
+async def show_event(update: Update, context: ContextTypes.DEFAULT_TYPE, event_id) -> int:
+    event = await fetch_event(context.bot_data['catalog_cache'], event_id)
     
     if not event:
-        await query.edit_message_text("Sorry, the selected event was not found.")
+        await respond(update)("Sorry, the selected event was not found.")
         return MAIN_MENU
     
-    context.user_data['event'] = event
-
-    event_details = f"""
-    🎭 Event: {event['name']}
-    🏷️ Category: {event['category']}
-    📅 Start: {event['start_date']}
-    🏁 End: {event['end_date']}
-    🔢 Priority: {event['priority']}
-    👥 Participants: {event['participants']}
-    📍 Location: {event['location']}
-    🎤 Organizer: {event['organizer']}
-    
-    📝 Description: {event['description']}
-    
-    Would you like to book this event?
-    """
+    context.user_data['event_id'] = event_id
+
+    event_details = context.bot_data['renders'].get('event', event, lambda: render_event(event), event.revision)
+    reply_markup = event_keyboard(context.user_data.setdefault('back', f'cat_{event.category_id}'))
+    await respond(update)(event_details, reply_markup=reply_markup)
+    return BOOKING
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    text = ' '.join(context.args)
+    if not text.strip():
+        await update.message.reply_text("🔎 Send /search followed by what you're looking for, e.g. /search jazz night")
+        return MAIN_MENU
+    context.user_data['search'] = text
+    return await show_search_results(update, context, {})
+
+async def search_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    return await show_search_results(update, context, page_cursor(query, context, 'search_page'))
+
+async def show_search_results(update: Update, context: ContextTypes.DEFAULT_TYPE, cursor) -> int:
+    text = context.user_data['search']
+    reply = respond(update)
+    page = await fetch_search_page(context.bot_data['catalog_cache'], text, **cursor)
+    if page is None:
+        await reply("Sorry, search is not available at the moment. Please try again later.")
+        return MAIN_MENU
+    if not page['events']:
+        await reply(f"No events found for '{text}'.", reply_markup=BACK_TO_MAIN_MENU_KEYBOARD)
+        return MAIN_MENU
+    remember_page(context, 'search_page', cursor, page)
+    context.user_data['back'] = 'srchpage_back'
     keyboard = [
-        [InlineKeyboardButton("Yes, book now", callback_data='confirm_booking')],
-        [InlineKeyboardButton("🔙 Back to Events", callback_data=f"cat_{context.user_data['category']}")]
+        [InlineKeyboardButton(event.name, callback_data=f"event_{event.id}")] for event in page['events']
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(event_details, reply_markup=reply_markup)
-    return BOOKING
+    keyboard += page_buttons('srchpage', page)
+    keyboard.append([BACK_TO_MAIN_MENU])
+    await reply(f"🔎 Events matching '{text}':", reply_markup=InlineKeyboardMarkup(keyboard))
+    return SEARCH
+
+async def whats_on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    if update.callback_query:
+        await update.callback_query.answer()
+    await respond(update)("🗓️ What would you like to see?", reply_markup=WHATS_ON_KEYBOARD)
+    return WHATS_ON
+
+async def whats_on_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    if query.data.startswith('when_'):
+        context.user_data['when'] = query.data.split('_', 1)[1]
+        cursor = {}
+    else:
+        cursor = page_cursor(query, context, 'when_page')
+    return await show_whats_on(update, context, cursor)
+
+async def show_whats_on(update: Update, context: ContextTypes.DEFAULT_TYPE, cursor) -> int:
+    key = context.user_data['when']
+    label = WHATS_ON_RANGES[key]
+    reply = respond(update)
+    page = await fetch_whats_on_page(context.bot_data['catalog_cache'], key, **cursor)
+    if page is None:
+        await reply("Sorry, we couldn't load upcoming events at the moment. Please try again later.")
+        return MAIN_MENU
+    if not page['events']:
+        await reply(f"{label}: nothing on, sorry.", reply_markup=InlineKeyboardMarkup([[WHATS_ON_BACK]]))
+        return WHATS_ON
+    remember_page(context, 'when_page', cursor, page)
+    context.user_data['back'] = 'whenpage_back'
+    reply_markup = context.bot_data['renders'].get('whats_on', page, lambda: render_whats_on(page, label))
+    await reply(f"{label}:", reply_markup=reply_markup)
+    return WHATS_ON
+
+async def route_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Jump to the right place for free text like "book a comedy show"."""
+    text = update.message.text
+    intent, _ = context.bot_data['intents'].classify(text)
+    if intent == 'greeting':
+        return await start(update, context)
+    if intent == 'company_info':
+        return await company_info(update, context)
+    if intent == 'contact_us':
+        return await contact_us(update, context)
+    if intent in ('book', None):
+        try:
+            mentioned = await context.bot_data['catalog_names'].match(text)
+        except CatalogError as e:
+            logger.error(f"Error loading catalog names: {e}")
+            mentioned = None
+        if mentioned:
+            (kind, object_id), _ = mentioned
+            if kind == 'event':
+                # Back leads to the event's category rather than a stale page.
+                context.user_data.pop('back', None)
+                return await show_event(update, context, object_id)
+            return await show_category_events(update, context, object_id, {})
+    if intent == 'whats_on':
+        key = next((WHATS_ON_WORDS[word] for word in tokenize(text) if word in WHATS_ON_WORDS), None)
+        if key is None:
+            return await whats_on(update, context)
+        context.user_data['when'] = key
+        return await show_whats_on(update, context, {})
+    if intent == 'book':
+        return await show_categories(update, context, {})
+    await update.message.reply_text(
+        "Sorry, I didn't get that. Try \"book a comedy show\", \"contact\" or /search jazz.",
+        reply_markup=BACK_TO_MAIN_MENU_KEYBOARD,
+    )
+    return MAIN_MENU
 
 async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
+    # Every attempt at this booking shares its idempotency key.
+    context.user_data['booking_id'] = new_conversation_id()
     keyboard = [
-        [InlineKeyboardButton("🔙 Back to Event Details", callback_data=f"event_{context.user_data['event']['id']}")]
+        [InlineKeyboardButton("🔙 Back to Event Details", callback_data=f"event_{context.user_data['event_id']}")]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text("✨ Wonderful choice! Let's proceed with the booking.\n\nPlease enter your name:", reply_markup=reply_markup)
@@ -182,94 +438,135 @@ async def save_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def save_email(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data['email'] = update.message.text
-    event = context.user_data['event']
+    event_id = context.user_data['event_id']
     name = context.user_data['name']
     email = context.user_data['email']
+    event = await fetch_event(context.bot_data['catalog_cache'], event_id)
+    title = event.name if event else f"event #{event_id}"
     
-    # Increment participant count
-    event_id = event['id']
+    # Record the booking, which also increments the participant count
+    chat_id = update.effective_chat.id
+    key = booking_key(chat_id, event_id, context.user_data.setdefault('booking_id', new_conversation_id()))
     try:
-        response = requests.post(f"{DJANGO_WEBSITE_URL}/increment_participants/{event_id}/")
-        if response.status_code == 200:
-            participants = response.json()['participants']
-            booking_message = f"Your booking for '{event['name']}' is confirmed!\n\n"
-            booking_message += f"Name: {name}\nEmail: {email}\n\n"
-            booking_message += f"You are participant number {participants}!\n\n"
-            booking_message += "Thank you for using EventEase!"
-        else:
-            booking_message = "Your booking is confirmed, but we couldn't update the participant count."
-    except requests.RequestException:
-        booking_message = "Your booking is confirmed, but we couldn't update the participant count."
-    
-    keyboard = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+        result = await context.bot_data['booking_queue'].submit(
+            event_id, update.effective_user.id, name, email, key=key
+        )
+    except CatalogError:
+        result = None
+    if result is None or result['status'] == 'pending':
+        # Keep the booking, key included, so sending the email again
+        # completes it without taking a second seat.
+        await context.bot.send_message(
+            chat_id, f"Sorry, we couldn't confirm your booking for '{title}' yet. "
+                     "Please send your email again to retry.",
+            rate_limit_args={'priority': HIGH},
+        )
+        return EMAIL
+    if result['status'] != 'success':
+        booking_message = f"Sorry, we couldn't book '{title}': {result['message']}."
+    else:
+        participants = result['participants']
+        booking_message = f"Your booking for '{title}' is confirmed!\n\n"
+        booking_message += f"Name: {name}\nEmail: {email}\n\n"
+        booking_message += f"You are participant number {participants}!\n\n"
+        booking_message += "Thank you for using EventEase!"
+    for field in ('event_id', 'name', 'email', 'booking_id'):
+        context.user_data.pop(field, None)
     
-    await update.message.reply_text(booking_message, reply_markup=reply_markup)
+    # Sent ahead of menu edits waiting for the same rate limits.
+    await context.bot.send_message(
+        chat_id, booking_message, reply_markup=BACK_TO_MAIN_MENU_KEYBOARD,
+        rate_limit_args={'priority': HIGH},
+    )
     return MAIN_MENU
 
 async def company_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    query = update.callback_query
-    await query.answer()
-    company_info_text = """
-    About EventEase
-    Welcome to EventEase! We specialize in providing seamless event booking experiences. Our platform offers a wide range of events, 
-    from cinema screenings to live music and comedy shows. Our mission is to make your event booking process as smooth and enjoyable as possible.
-    """
-    keyboard = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(company_info_text, reply_markup=reply_markup)
+    if update.callback_query:
+        await update.callback_query.answer()
+    await respond(update)(COMPANY_INFO_TEXT, reply_markup=BACK_TO_MAIN_MENU_KEYBOARD)
     return MAIN_MENU
 
 async def contact_us(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    query = update.callback_query
-    await query.answer()
-    contact_info_text = """
-    📞 Contact Us
-    
-    We'd love to hear from you! If you have any questions or need assistance, please reach out to us:
-    
-    📧 Email: support@eventease.com
-    📱 Phone: +1-234-567-890
-    
-    Our support team is available Monday to Friday, 9 AM to 6 PM.
-    """
-    keyboard = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data='main_menu')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(contact_info_text, reply_markup=reply_markup)
+    if update.callback_query:
+        await update.callback_query.answer()
+    await respond(update)(CONTACT_US_TEXT, reply_markup=BACK_TO_MAIN_MENU_KEYBOARD)
     return MAIN_MENU
 
-def main():
-    application = Application.builder().token("6874845152:AAHVmTYvC_6pM_w7TtDDMYqWPvcFN9Vrcsg").build()
+def build_application(builder=None):
+    """Build the bot; ``builder`` (default: from the environment) lets
+    callers such as the benchmarks swap the Telegram connection."""
+    application = (
+        (builder or application_builder(TOKEN))
+        .persistence(persistence_from_env(PERSISTED_USER_DATA))
+        .post_init(open_catalog)
+        .post_shutdown(close_catalog)
+        .build()
+    )
+    free_text = MessageHandler(filters.TEXT & ~filters.COMMAND, route_message)
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
+        entry_points=[
+            CommandHandler('start', start), CommandHandler('search', search), CommandHandler('whatson', whats_on),
+            free_text,
+        ],
         states={
             MAIN_MENU: [
                 CallbackQueryHandler(event_categories, pattern='^event_categories$'),
+                CallbackQueryHandler(whats_on, pattern='^whats_on$'),
                 CallbackQueryHandler(company_info, pattern='^company_info$'),
                 CallbackQueryHandler(contact_us, pattern='^contact_us$'),
+                free_text,
             ],
             CATEGORY: [
                 CallbackQueryHandler(category_selection, pattern='^cat_'),
+                CallbackQueryHandler(event_categories, pattern='^catpage_'),
                 CallbackQueryHandler(start, pattern='^main_menu$'),
+                free_text,
             ],
             EVENT: [
-                CallbackQueryHandler(event_selection, pattern='^event_'),
-                CallbackQueryHandler(event_categories, pattern='^event_categories$'),
+                CallbackQueryHandler(event_selection, pattern=r'^event_\d+$'),
+                CallbackQueryHandler(category_selection, pattern='^evpage_'),
+                CallbackQueryHandler(event_categories, pattern='^(event_categories|catpage_back)$'),
+                free_text,
             ],
             BOOKING: [
                 CallbackQueryHandler(confirm_booking, pattern='^confirm_booking$'),
-                CallbackQueryHandler(event_selection, pattern='^event_'),
+                CallbackQueryHandler(event_selection, pattern=r'^event_\d+$'),
+                CallbackQueryHandler(category_selection, pattern='^(evpage_back|cat_)'),
+                CallbackQueryHandler(search_page, pattern='^srchpage_back$'),
+                CallbackQueryHandler(whats_on_selection, pattern='^whenpage_back$'),
+                free_text,
+            ],
+            SEARCH: [
+                CallbackQueryHandler(event_selection, pattern=r'^event_\d+$'),
+                CallbackQueryHandler(search_page, pattern='^srchpage_'),
+                CallbackQueryHandler(start, pattern='^main_menu$'),
+                free_text,
+            ],
+            WHATS_ON: [
+                CallbackQueryHandler(event_selection, pattern=r'^event_\d+$'),
+                CallbackQueryHandler(whats_on_selection, pattern='^(when|whenpage)_'),
+                CallbackQueryHandler(whats_on, pattern='^whats_on$'),
+                CallbackQueryHandler(start, pattern='^main_menu$'),
+                free_text,
             ],
             NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_name)],
             EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_email)],
         },
-        fallbacks=[CommandHandler('start', start)]
+        fallbacks=[CommandHandler('start', start), CommandHandler('search', search), CommandHandler('whatson', whats_on)],
+        name='booking',
+        persistent=True,
     )
 
     application.add_handler(conv_handler)
     application.add_handler(CallbackQueryHandler(start, pattern='^main_menu$'))
+    if application.persistence.shared:
+        share_conversations(application, conv_handler)
+    profile_application(application)
+    instrument_application(application, STATE_NAMES)
+    return application
 
-    application.run_polling()
+def main():
+    run(build_application())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
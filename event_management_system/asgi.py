@@ -3,6 +3,13 @@ ASGI config for event_management_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+With BOT_MODE=webhook the Telegram bot is served from the same deployment:
+webhook updates posted to TELEGRAM_WEBHOOK_PATH go to the bot (see
+eventease.webhook) and every other request goes to Django.
+
+With DJANGO_ASYNC_VIEWS=1 the bot-facing API is served by native async views
+(see event_management_system_app.async_api).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
@@ -14,3 +21,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'event_management_system.settings')
 
 application = get_asgi_application()
+
+if os.environ.get('BOT_MODE') == 'webhook':
+    from bot2 import build_application
+    from eventease.webhook import WebhookApp
+
+    application = WebhookApp.from_env(build_application(), fallback=application)
@@ -0,0 +1,98 @@
+"""
+Production settings for event_management_system.
+
+Use with DJANGO_SETTINGS_MODULE=event_management_system.settings_production.
+The database defaults to a tuned SQLite file; set POSTGRES_DB (and the other
+POSTGRES_* variables) to switch to PostgreSQL.
+"""
+
+import os
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)  # noqa: F405
+
+DEBUG = os.environ.get('DJANGO_DEBUG', '') == '1'
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+# Bearer token Prometheus sends to /metrics; without one only local clients
+# are answered.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+# Sampled request profiles, browsable at /admin/profiles/ (see
+# event_management_system_app.profiling); on when PROFILE_SAMPLE_RATE is set.
+if os.environ.get('PROFILE_SAMPLE_RATE'):
+    PROFILE_SAMPLE_RATE = float(os.environ['PROFILE_SAMPLE_RATE'])
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', BASE_DIR / 'profiles')
+    SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1.0))
+    MIDDLEWARE = [*MIDDLEWARE]  # noqa: F405
+    MIDDLEWARE.insert(1, 'event_management_system_app.profiling.ProfilingMiddleware')
+
+
+# Database
+# Connections are kept open between requests (CONN_MAX_AGE) instead of
+# being opened and closed for every request.
+
+CONN_MAX_AGE = int(os.environ.get('DJANGO_CONN_MAX_AGE', 60))
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', ''),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', ''),
+            'PORT': os.environ.get('POSTGRES_PORT', ''),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'OPTIONS': {
+                # Seconds a writer waits for the lock before "database is locked".
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+            },
+        }
+    }
+
+# Applied to every new SQLite connection (see event_management_system_app.db).
+# WAL lets readers proceed while a booking is being written, and
+# synchronous=NORMAL is durable across application crashes in WAL mode.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,  # KiB
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+# Cache
+# Catalog reads are cached under a version that every write bumps (see
+# event_management_system_app.caching), so all workers must share one cache:
+# Redis when REDIS_URL is set, otherwise files next to the database. It only
+# holds what can be rebuilt, so Redis may evict from it (allkeys-lru); booking
+# idempotency keys are kept in the database instead.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': Path(os.environ.get('DJANGO_CACHE_DIR', BASE_DIR / 'cache')),
+        },
+    }
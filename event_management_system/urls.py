@@ -16,12 +16,22 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 
-from event_management_system_app import views
+from event_management_system_app import admin as app_admin, api, async_api, changes, metrics, views
+
+
+def bot_view(module, name):
+	"""``module.name``, or its native async twin when ASYNC_VIEWS is on."""
+	return getattr(async_api if settings.ASYNC_VIEWS else module, name)
+
 
 urlpatterns = [
+	path('admin/profiles/', admin.site.admin_view(app_admin.profile_list_view), name='admin_profiles'),
+	path('admin/profiles/<str:profile_id>/', admin.site.admin_view(app_admin.profile_detail_view), name='admin_profile'),
+	path('admin/profiles/<str:profile_id>.<str:format>', admin.site.admin_view(app_admin.profile_download_view), name='admin_profile_download'),
 	path('admin/', admin.site.urls),
 	path('', views.category_list, name='category_list'),
 	path('categories/create/', views.create_category, name='create_category'),
@@ -31,5 +41,14 @@ urlpatterns = [
 	path('events/update/<int:event_id>/', views.update_event, name='update_event'),
 	path('events/delete/<int:event_id>/', views.delete_event, name='delete_event'),
 	path('event-chart/', views.event_chart, name='event_chart'),
-	path('increment_participants/<int:event_id>/', views.increment_participants, name='increment_participants'),
+	path('increment_participants/<int:event_id>/', bot_view(views, 'increment_participants'), name='increment_participants'),
+	path('api/bookings/', views.create_bookings, name='create_bookings'),
+	path('api/categories/', bot_view(api, 'api_categories'), name='api_categories'),
+	path('api/categories/<int:category_id>/events/', bot_view(api, 'api_category_events'), name='api_category_events'),
+	path('api/events/<int:event_id>/', bot_view(api, 'api_event'), name='api_event'),
+	path('api/search/', bot_view(api, 'api_search'), name='api_search'),
+	path('api/whats-on/', api.api_whats_on, name='api_whats_on'),
+	path('api/stats/', api.api_stats, name='api_stats'),
+	path('api/changes/', changes.api_changes, name='api_changes'),
+	path('metrics', metrics.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,6 +1,28 @@
+import io
+import json
+
+from django import forms
 from django.contrib import admin
 from django.contrib import admin
-from .models import Category, Event
+from django.contrib import messages
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.safestring import mark_safe
+from eventease.profiling import flamegraph_svg, list_profiles, load_folded, load_profile
+from .bulk import FORMATS, export_events, guess_format, import_events
+from .models import Booking, Category, Event
+from .profiling import profile_directory
+from .search import matching
+
+
+class ImportEventsForm(forms.Form):
+	file = forms.FileField(help_text='CSV with a header row, or JSON Lines. Columns: name, category (by name), start_date, end_date (ISO 8601), priority, description, location, organizer, capacity.')
+	format = forms.ChoiceField(choices=[('', 'From the file name')] + [(f, f) for f in FORMATS], required=False)
+	create_categories = forms.BooleanField(required=False, help_text='Create categories that do not exist yet.')
+	dry_run = forms.BooleanField(required=False, help_text='Only validate the file.')
 
 
 @admin.register(Category)
@@ -12,4 +34,106 @@ class CategoryAdmin(admin.ModelAdmin):
 class EventAdmin(admin.ModelAdmin):
 	list_display = ('name', 'category', 'start_date', 'end_date', 'priority')
 	list_filter = ('category', 'priority')
-	search_fields = ('name', 'category__name', 'description', 'location', 'organizer')
\ No newline at end of file
+	search_fields = ('name', 'category__name', 'description', 'location', 'organizer')
+	change_list_template = 'admin/event_management_system_app/event/change_list.html'
+
+	def get_search_results(self, request, queryset, search_term):
+		# Use the full-text index instead of icontains scans over every column
+		if not search_term.strip():
+			return queryset, False
+		return queryset.filter(matching(search_term) | Q(category__name__icontains=search_term)), False
+
+	def get_urls(self):
+		return [
+			path('import/', self.admin_site.admin_view(self.import_view), name='event_import'),
+			path('export/', self.admin_site.admin_view(self.export_view), name='event_export'),
+		] + super().get_urls()
+
+	def import_view(self, request):
+		if not self.has_add_permission(request):
+			return redirect('admin:event_management_system_app_event_changelist')
+		form = ImportEventsForm(request.POST or None, request.FILES or None)
+		if request.method == 'POST' and form.is_valid():
+			upload = form.cleaned_data['file']
+			# Large uploads are spooled to disk and read back row by row.
+			stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+			result = import_events(
+				stream, form.cleaned_data['format'] or guess_format(upload.name),
+				create_categories=form.cleaned_data['create_categories'], dry_run=form.cleaned_data['dry_run'],
+			)
+			verb = 'Would import' if form.cleaned_data['dry_run'] else 'Imported'
+			self.message_user(request, f'{verb} {result.created} events ({result.categories_created} new categories).')
+			if result.error_count:
+				shown = '; '.join(f'line {line}: {message}' for line, message in result.errors[:10])
+				self.message_user(request, f'Skipped {result.error_count} invalid rows: {shown}', messages.WARNING)
+			return redirect('admin:event_management_system_app_event_changelist')
+		return TemplateResponse(request, 'admin/event_management_system_app/event/import.html', {
+			**self.admin_site.each_context(request),
+			'opts': self.model._meta,
+			'title': 'Import events',
+			'form': form,
+		})
+
+	def export_view(self, request):
+		format = request.GET.get('format', 'csv')
+		if format not in FORMATS or not self.has_view_permission(request):
+			return redirect('admin:event_management_system_app_event_changelist')
+		response = StreamingHttpResponse(
+			export_events(format=format),
+			content_type='text/csv' if format == 'csv' else 'application/jsonl',
+		)
+		response['Content-Disposition'] = f'attachment; filename="events.{format}"'
+		return response
+
+@admin.register(Booking)
+class BookingAdmin(admin.ModelAdmin):
+	list_display = ('event', 'name', 'email', 'participant_number', 'created_at')
+	list_select_related = ('event',)
+	search_fields = ('name', 'email')
+
+
+# Profiles written by the profiling middleware and the bots; staff only
+# through admin_view (see urls.py).
+
+PROFILE_DOWNLOADS = {'folded': 'text/plain', 'json': 'application/json', 'svg': 'image/svg+xml'}
+
+def profile_list_view(request):
+	return TemplateResponse(request, 'admin/profiles/list.html', {
+		**admin.site.each_context(request),
+		'title': 'Profiles',
+		'profiles': list_profiles(profile_directory()),
+	})
+
+def profile_detail_view(request, profile_id):
+	profile = load_profile(profile_directory(), profile_id)
+	if profile is None:
+		raise Http404('No such profile')
+	folded = load_folded(profile_directory(), profile_id) or {}
+	# The hottest leaf frames, by samples
+	leaves = {}
+	for line, count in folded.items():
+		leaf = line.rsplit(';', 1)[-1]
+		leaves[leaf] = leaves.get(leaf, 0) + count
+	return TemplateResponse(request, 'admin/profiles/detail.html', {
+		**admin.site.each_context(request),
+		'title': f"Profile of {profile['name']}",
+		'profile': profile,
+		'sql_seconds': sum(query['seconds'] for query in profile['queries']),
+		'hot_frames': sorted(leaves.items(), key=lambda item: -item[1])[:20],
+		'flamegraph': mark_safe(flamegraph_svg(folded)),
+	})
+
+def profile_download_view(request, profile_id, format):
+	profile = load_profile(profile_directory(), profile_id)
+	if format not in PROFILE_DOWNLOADS or profile is None:
+		raise Http404('No such profile')
+	folded = load_folded(profile_directory(), profile_id) or {}
+	if format == 'folded':
+		content = ''.join(f'{line} {count}\n' for line, count in folded.items())
+	elif format == 'svg':
+		content = flamegraph_svg(folded)
+	else:
+		content = json.dumps(profile, indent=2)
+	response = HttpResponse(content, content_type=PROFILE_DOWNLOADS[format])
+	response['Content-Disposition'] = f'attachment; filename="{profile_id}.{format}"'
+	return response
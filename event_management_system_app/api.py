@@ -0,0 +1,212 @@
+"""Read-only JSON catalog API consumed by the Telegram bots.
+
+Every endpoint accepts an optional ``fields`` query parameter (comma
+separated) so that clients only pay for the columns they render, and all
+responses are serialized without insignificant whitespace. Responses are
+cached per catalog version and support conditional GET. Listings are
+paged with ``after``/``before`` cursors and ``limit``; each page carries the
+``next`` and ``prev`` cursors (``null`` at either end). Search results are
+paged the same way, best match first. The "what's on" endpoint is served
+from the day buckets in :mod:`.timeline` instead of the version cache, as
+bookings do not change it. Statistics come from the precomputed rows of
+:mod:`.stats`, reused for a short window. The endpoints the bots call most
+have native async twins in :mod:`.async_api`, served under ASGI.
+"""
+import time
+
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from . import stats
+from .caching import cache_response, cached, catalog_condition
+
+from .models import Category, Event
+from .pagination import InvalidCursor, paginate, paginate_offsets, parse_page_size
+from .search import ranked_ids
+from .timeline import BUCKET_FIELDS, events_between, time_range
+
+# Public field name -> ORM lookup.
+CATEGORY_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+}
+
+EVENT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'category': 'category__name',
+    'category_id': 'category_id',
+    'start_date': 'start_date',
+    'end_date': 'end_date',
+    'priority': 'priority',
+    'participants': 'participants',
+    'capacity': 'capacity',
+    'description': 'description',
+    'location': 'location',
+    'organizer': 'organizer',
+}
+
+CATEGORY_ORDER = ('id',)
+EVENT_ORDER = ('start_date', 'id')
+
+COMPACT_JSON = {'separators': (',', ':')}
+
+
+def api_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params=COMPACT_JSON)
+
+
+def api_error(message, status=400):
+    return api_response({'status': 'error', 'message': message}, status=status)
+
+
+def parse_fields(request, available):
+    """Return the requested field names, defaulting to every field."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def serialize(queryset, fields, available):
+    lookups = [available[field] for field in fields]
+    return [dict(zip(fields, row)) for row in queryset.values_list(*lookups)]
+
+
+def serialize_page(request, queryset, fields, available, keys):
+    """Paginate ``queryset`` by ``keys`` and serialize one page of it."""
+    lookups = {available[field] for field in fields} | set(keys)
+    page = paginate(
+        queryset.values(*lookups), keys,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+        size=parse_page_size(request),
+    )
+    items = [{field: row[available[field]] for field in fields} for row in page]
+    return {'next': page.next_cursor, 'prev': page.prev_cursor}, items
+
+
+@require_GET
+@catalog_condition
+@cache_response
+def api_categories(request):
+    try:
+        fields = parse_fields(request, CATEGORY_FIELDS)
+        cursors, categories = serialize_page(
+            request, Category.objects.all(), fields, CATEGORY_FIELDS, CATEGORY_ORDER,
+        )
+    except ValueError as e:
+        return api_error(str(e))
+    return api_response({'categories': categories, **cursors})
+
+
+@require_GET
+@catalog_condition
+@cache_response
+def api_category_events(request, category_id):
+    try:
+        fields = parse_fields(request, EVENT_FIELDS)
+    except ValueError as e:
+        return api_error(str(e))
+    category = Category.objects.filter(pk=category_id).values('id', 'name').first()
+    if category is None:
+        return api_error('Category not found', status=404)
+    try:
+        cursors, events = serialize_page(
+            request, Event.objects.filter(category_id=category_id), fields, EVENT_FIELDS, EVENT_ORDER,
+        )
+    except InvalidCursor as e:
+        return api_error(str(e))
+    return api_response({
+        'category': category,
+        'events': events,
+        **cursors,
+    })
+
+
+@require_GET
+@catalog_condition
+@cache_response
+def api_event(request, event_id):
+    try:
+        fields = parse_fields(request, EVENT_FIELDS)
+    except ValueError as e:
+        return api_error(str(e))
+    events = serialize(Event.objects.filter(pk=event_id), fields, EVENT_FIELDS)
+    if not events:
+        return api_error('Event not found', status=404)
+    return api_response({'event': events[0]})
+
+
+@require_GET
+@catalog_condition
+@cache_response
+def api_search(request):
+    text = request.GET.get('q', '').strip()
+    if not text:
+        return api_error('Missing search text (q)')
+    try:
+        fields = parse_fields(request, EVENT_FIELDS)
+        page = paginate_offsets(
+            lambda offset, limit: ranked_ids(text, offset, limit),
+            after=request.GET.get('after'), before=request.GET.get('before'),
+            size=parse_page_size(request),
+        )
+    except ValueError as e:
+        return api_error(str(e))
+    lookups = {EVENT_FIELDS[field] for field in fields} | {'id'}
+    rows = {row['id']: row for row in Event.objects.filter(pk__in=page.items).values(*lookups)}
+    events = [
+        {field: rows[event_id][EVENT_FIELDS[field]] for field in fields}
+        for event_id in page.items if event_id in rows
+    ]
+    return api_response({
+        'query': text,
+        'events': events,
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+    })
+
+
+@require_GET
+def api_whats_on(request):
+    """Events on ``when`` (``today``, ``tonight``, ``weekend``, ``days`` with
+    ``days=N``, or ``ongoing``), in start order."""
+    when = request.GET.get('when', 'today')
+    days = request.GET.get('days', '7')
+    if not days.isdigit():
+        return api_error('Invalid days')
+    try:
+        fields = parse_fields(request, BUCKET_FIELDS)
+        start, end = time_range(when, days=int(days))
+        rows = events_between(start, end)
+        page = paginate_offsets(
+            lambda offset, limit: rows[offset:offset + limit],
+            after=request.GET.get('after'), before=request.GET.get('before'),
+            size=parse_page_size(request),
+        )
+    except ValueError as e:
+        return api_error(str(e))
+    return api_response({
+        'when': when,
+        'start': start,
+        'end': end,
+        'events': [{field: row[field] for field in fields} for row in page.items],
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+    })
+
+
+@require_GET
+@condition(etag_func=stats.window_etag)
+def api_stats(request):
+    """Per-category totals and the bookings of the last ``days`` days."""
+    days = request.GET.get('days', str(stats.DEFAULT_DAYS))
+    if not days.isdigit() or not 1 <= int(days) <= stats.MAX_DAYS:
+        return api_error(f'days must be between 1 and {stats.MAX_DAYS}')
+    window = int(time.time() // stats.WINDOW)
+    dashboard = cached('api_stats', days, window, loader=lambda: stats.dashboard(int(days)), timeout=stats.WINDOW)
+    return api_response(dashboard)
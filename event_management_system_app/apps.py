@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class EventManagementSystemAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'event_management_system_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .db import apply_sqlite_pragmas
+        connection_created.connect(apply_sqlite_pragmas)
@@ -0,0 +1,158 @@
+"""Native async views for the endpoints the bots call most.
+
+The catalog reads, search and ``increment_participants`` are served here
+when ``ASYNC_VIEWS`` is on (``DJANGO_ASYNC_VIEWS=1``). Under an ASGI server
+a synchronous view is handed to a thread per request, while these run on
+the event loop and reach the database through the async ORM interface.
+Requests and responses are the same as those of the synchronous views in
+:mod:`.api` and :mod:`.views`.
+
+Django runs transactions and raw cursors in synchronous code only, so the
+booking write and the full-text ranking still go through a thread, and so
+does every query of the async ORM for now. With Django's own middleware
+also running on threads under ASGI, a threaded WSGI server is still
+faster for these endpoints; see ``benchmarks/async_views.py``.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+
+from . import idempotency
+from .api import (
+    CATEGORY_FIELDS, CATEGORY_ORDER, EVENT_FIELDS, EVENT_ORDER, api_error, api_response, parse_fields,
+)
+from .caching import cache_response, catalog_condition
+from .models import Category, Event
+from .pagination import InvalidCursor, apaginate, apaginate_offsets, parse_page_size
+from .search import ranked_ids
+from .views import IDEMPOTENCY_HEADER, replay_response
+
+
+async def serialize_page(request, queryset, fields, available, keys):
+    """Paginate ``queryset`` by ``keys`` and serialize one page of it."""
+    lookups = {available[field] for field in fields} | set(keys)
+    page = await apaginate(
+        queryset.values(*lookups), keys,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+        size=parse_page_size(request),
+    )
+    items = [{field: row[available[field]] for field in fields} for row in page]
+    return {'next': page.next_cursor, 'prev': page.prev_cursor}, items
+
+
+@require_GET
+@catalog_condition
+@cache_response
+async def api_categories(request):
+    try:
+        fields = parse_fields(request, CATEGORY_FIELDS)
+        cursors, categories = await serialize_page(
+            request, Category.objects.all(), fields, CATEGORY_FIELDS, CATEGORY_ORDER,
+        )
+    except ValueError as e:
+        return api_error(str(e))
+    return api_response({'categories': categories, **cursors})
+
+
+@require_GET
+@catalog_condition
+@cache_response
+async def api_category_events(request, category_id):
+    try:
+        fields = parse_fields(request, EVENT_FIELDS)
+    except ValueError as e:
+        return api_error(str(e))
+    category = await Category.objects.filter(pk=category_id).values('id', 'name').afirst()
+    if category is None:
+        return api_error('Category not found', status=404)
+    try:
+        cursors, events = await serialize_page(
+            request, Event.objects.filter(category_id=category_id), fields, EVENT_FIELDS, EVENT_ORDER,
+        )
+    except InvalidCursor as e:
+        return api_error(str(e))
+    return api_response({
+        'category': category,
+        'events': events,
+        **cursors,
+    })
+
+
+@require_GET
+@catalog_condition
+@cache_response
+async def api_event(request, event_id):
+    try:
+        fields = parse_fields(request, EVENT_FIELDS)
+    except ValueError as e:
+        return api_error(str(e))
+    row = await Event.objects.filter(pk=event_id).values_list(*[EVENT_FIELDS[field] for field in fields]).afirst()
+    if row is None:
+        return api_error('Event not found', status=404)
+    return api_response({'event': dict(zip(fields, row))})
+
+
+@require_GET
+@catalog_condition
+@cache_response
+async def api_search(request):
+    text = request.GET.get('q', '').strip()
+    if not text:
+        return api_error('Missing search text (q)')
+    try:
+        fields = parse_fields(request, EVENT_FIELDS)
+        page = await apaginate_offsets(
+            sync_to_async(lambda offset, limit: ranked_ids(text, offset, limit)),
+            after=request.GET.get('after'), before=request.GET.get('before'),
+            size=parse_page_size(request),
+        )
+    except ValueError as e:
+        return api_error(str(e))
+    lookups = {EVENT_FIELDS[field] for field in fields} | {'id'}
+    rows = {row['id']: row async for row in Event.objects.filter(pk__in=page.items).values(*lookups)}
+    events = [
+        {field: rows[event_id][EVENT_FIELDS[field]] for field in fields}
+        for event_id in page.items if event_id in rows
+    ]
+    return api_response({
+        'query': text,
+        'events': events,
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+    })
+
+
+@csrf_exempt
+async def increment_participants(request, event_id):
+    """Take one seat at an event; see :func:`.views.increment_participants`."""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+    try:
+        key = idempotency.clean_key(request.headers.get(IDEMPOTENCY_HEADER))
+    except idempotency.InvalidKey:
+        return JsonResponse({'status': 'error', 'message': f'Invalid {IDEMPOTENCY_HEADER}'}, status=400)
+    scope = f'increment_participants:{event_id}'
+    if key is not None:
+        used = await idempotency.aclaim(scope, [key])
+        if key in used:
+            return replay_response(used[key])
+    try:
+        body, status = await _increment_participants(event_id)
+    except BaseException:
+        if key is not None:
+            await idempotency.arelease(scope, [key])
+        raise
+    if key is not None:
+        await idempotency.aremember(scope, {key: (body, status)})
+    return JsonResponse(body, status=status)
+
+
+async def _increment_participants(event_id):
+    try:
+        participants = await Event.objects.aincrement_participants(event_id)
+    except Event.DoesNotExist:
+        return {'status': 'error', 'message': 'Event not found'}, 404
+    if participants is None:
+        return {'status': 'error', 'message': 'Event is full'}, 409
+    return {'status': 'success', 'participants': participants}, 200
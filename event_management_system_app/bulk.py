@@ -0,0 +1,231 @@
+"""Bulk event import and export as CSV or JSON Lines.
+
+Both directions stream, so memory stays flat whatever the file size.
+Imports read one row at a time and validate it. Every ``chunk_size`` rows
+they resolve the chunk's category names in one query and insert its events
+with one ``bulk_create``, in a transaction of its own. Exports page through
+the table by primary key.
+
+``bulk_create`` sends no signals, so imports bump the catalog version and
+the time buckets themselves, and add each chunk to the category statistics
+and the change log; the search index follows through its triggers.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import changes, stats, timeline
+from .caching import bump_catalog_version
+from .models import Category, Event
+
+FORMATS = ('csv', 'jsonl')
+# Columns read on import; the category is given by name.
+COLUMNS = ('name', 'category', 'start_date', 'end_date', 'priority', 'description', 'location', 'organizer', 'capacity')
+EXPORT_COLUMNS = ('id', *COLUMNS, 'participants')
+EXPORT_LOOKUPS = {'category': 'category__name'}
+CHUNK_SIZE = 2000
+# Invalid rows reported individually; the rest are only counted.
+MAX_ERRORS = 100
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, format):
+    """Yield ``(line number, fields)`` from a text stream; ``fields`` is
+    ``None`` for a JSON line that is not an object."""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def _text(fields, name, max_length=None, required=False):
+    value = fields.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f'{name} is required')
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{name} is longer than {max_length} characters')
+    return value
+
+
+def _datetime(fields, name):
+    value = _text(fields, name, required=True)
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'{name} is not an ISO 8601 date and time: {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_default_timezone())
+    return parsed
+
+
+def _integer(fields, name, default):
+    value = _text(fields, name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} is not a whole number: {value!r}')
+
+
+def build_event(fields, category_id):
+    """Validate one row into an unsaved ``Event``; raises ``ValueError``."""
+    if fields is None:
+        raise ValueError('not a JSON object')
+    start_date = _datetime(fields, 'start_date')
+    end_date = _datetime(fields, 'end_date')
+    if end_date < start_date:
+        raise ValueError('end_date is before start_date')
+    capacity = _integer(fields, 'capacity', None)
+    if capacity is not None and capacity < 0:
+        raise ValueError('capacity is negative')
+    return Event(
+        name=_text(fields, 'name', 100, required=True),
+        category_id=category_id,
+        start_date=start_date,
+        end_date=end_date,
+        priority=_integer(fields, 'priority', 1),
+        description=_text(fields, 'description'),
+        location=_text(fields, 'location', 255),
+        organizer=_text(fields, 'organizer', 100),
+        capacity=capacity,
+    )
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    categories_created: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)  # (line number, message), the first MAX_ERRORS
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+class _Importer:
+    def __init__(self, create_categories, dry_run):
+        self.create_categories = create_categories
+        self.dry_run = dry_run
+        self.category_ids = {}  # name -> id, or None for a new one in a dry run
+        self.result = ImportResult()
+
+    def resolve_categories(self, names):
+        missing = {name for name in names if name and len(name) <= 100 and name not in self.category_ids}
+        if not missing:
+            return
+        # Names are not unique; the oldest category of a name wins.
+        for category_id, name in Category.objects.filter(name__in=missing).order_by('-id').values_list('id', 'name'):
+            self.category_ids[name] = category_id
+        missing -= self.category_ids.keys()
+        if missing and self.create_categories:
+            if self.dry_run:
+                created = dict.fromkeys(missing)
+            else:
+                categories = Category.objects.bulk_create(Category(name=name) for name in sorted(missing))
+                changes.categories_created(categories)
+                created = {c.name: c.id for c in categories}
+            self.category_ids.update(created)
+            self.result.categories_created += len(created)
+
+    def import_chunk(self, chunk):
+        with transaction.atomic():
+            self.resolve_categories({_text(fields, 'category') for _, fields in chunk if fields is not None})
+            events = []
+            for line, fields in chunk:
+                try:
+                    category = _text(fields, 'category', 100, required=True) if fields is not None else None
+                    if category is not None and category not in self.category_ids:
+                        raise ValueError(f'unknown category {category!r}')
+                    events.append(build_event(fields, self.category_ids.get(category)))
+                except ValueError as e:
+                    self.result.error(line, str(e))
+            if not self.dry_run:
+                Event.objects.bulk_create(events)
+                stats.events_changed(added=[stats.event_totals(event) for event in events])
+                changes.events_created(events, {pk: name for name, pk in self.category_ids.items()})
+            self.result.created += len(events)
+
+
+def import_events(stream, format='csv', chunk_size=CHUNK_SIZE, create_categories=False, dry_run=False):
+    """Import events from a text ``stream``, skipping invalid rows.
+
+    Unknown categories are created with ``create_categories`` and reported
+    as errors otherwise. A ``dry_run`` validates without writing anything.
+    Returns an :class:`ImportResult`.
+    """
+    if format not in FORMATS:
+        raise ValueError(f'Unknown format: {format}')
+    importer = _Importer(create_categories, dry_run)
+    chunk = []
+    for row in read_rows(stream, format):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            importer.import_chunk(chunk)
+            chunk = []
+    if chunk:
+        importer.import_chunk(chunk)
+    if importer.result.created and not dry_run:
+        bump_catalog_version()
+        timeline.touch()
+    return importer.result
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_events(queryset=None, format='csv', chunk_size=CHUNK_SIZE):
+    """Yield the events of ``queryset`` (default: all) as CSV or JSON Lines
+    text, one chunk of rows per item, in primary key order."""
+    if format not in FORMATS:
+        raise ValueError(f'Unknown format: {format}')
+    queryset = Event.objects.all() if queryset is None else queryset
+    lookups = [EXPORT_LOOKUPS.get(column, column) for column in EXPORT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == 'csv':
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list(*lookups)[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            row = [_export_value(value) for value in row]
+            if format == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), cls=DjangoJSONEncoder, separators=(',', ':')))
+                buffer.write('\n')
+        yield buffer.getvalue()
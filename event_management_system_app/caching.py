@@ -0,0 +1,147 @@
+"""Versioned caching for the catalog read views.
+
+Every catalog write bumps a single version number (a millisecond timestamp)
+once its transaction commits. Cache keys include that version, so a write
+invalidates every cached page, fragment and API response at once without
+having to know which keys exist. The version also serves as the ETag of
+the read views, letting pollers like the bot get a 304. There is no
+Last-Modified: HTTP dates have a resolution of one second, so a client
+revalidating by date alone would miss writes made within the same second.
+"""
+import functools
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+from .metrics import CACHE_REQUESTS
+
+VERSION_KEY = 'catalog:version'
+CACHE_TIMEOUT = 300
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def acatalog_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+async def _arequest_version(request):
+    # Async views read it ahead for the conditional GET; see catalog_condition.
+    version = getattr(request, '_catalog_version', None)
+    return await acatalog_version() if version is None else version
+
+
+def _request_version(request):
+    version = getattr(request, '_catalog_version', None)
+    return catalog_version() if version is None else version
+
+
+def _bump():
+    current = cache.get(VERSION_KEY) or 0
+    cache.set(VERSION_KEY, max(int(time.time() * 1000), current + 1), timeout=None)
+
+
+def bump_catalog_version():
+    """Invalidate cached catalog reads once the current transaction commits."""
+    transaction.on_commit(_bump)
+
+
+def cached(name, *parts, loader, timeout=CACHE_TIMEOUT):
+    """Return ``loader()``, cached under the current catalog version."""
+    key = ':'.join(['catalog', str(catalog_version()), name, *map(str, parts)])
+    value = cache.get(key)
+    if value is None:
+        CACHE_REQUESTS.labels(name, 'miss').inc()
+        value = loader()
+        cache.set(key, value, timeout)
+    else:
+        CACHE_REQUESTS.labels(name, 'hit').inc()
+    return value
+
+
+def cache_response(view):
+    """Cache a JSON view's successful responses under the catalog version.
+    Async views use the cache's async interface."""
+    hits, misses = CACHE_REQUESTS.labels(view.__name__, 'hit'), CACHE_REQUESTS.labels(view.__name__, 'miss')
+
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            key = f'catalog:{await _arequest_version(request)}:response:{request.get_full_path()}'
+            hit = await cache.aget(key)
+            if hit is not None:
+                hits.inc()
+                content, content_type = hit
+                return HttpResponse(content, content_type=content_type)
+            misses.inc()
+            response = await view(request, *args, **kwargs)
+            if response.status_code == 200:
+                await cache.aset(key, (response.content, response['Content-Type']), CACHE_TIMEOUT)
+            return response
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = f'catalog:{catalog_version()}:response:{request.get_full_path()}'
+        hit = cache.get(key)
+        if hit is not None:
+            hits.inc()
+            content, content_type = hit
+            return HttpResponse(content, content_type=content_type)
+        misses.inc()
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, (response.content, response['Content-Type']), CACHE_TIMEOUT)
+        return response
+    return wrapper
+
+
+def _has_messages(request):
+    # len() loads queued messages without marking them as read.
+    return hasattr(request, '_messages') and len(get_messages(request)) > 0
+
+
+def catalog_etag(request, *args, **kwargs):
+    """ETag for pages built from the catalog.
+
+    Pages carry a CSRF token tied to the client's CSRF cookie, so the cookie
+    is part of the tag; pages showing one-off messages are never tagged.
+    """
+    if _has_messages(request):
+        return None
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    return hashlib.md5(f'{_request_version(request)}:{csrf_cookie}'.encode()).hexdigest()
+
+
+def catalog_condition(view):
+    """``condition()`` with :func:`catalog_etag`.
+
+    Django calls it synchronously, even for async views, so for those the
+    version is read through the cache's async interface beforehand.
+    """
+    conditional = condition(etag_func=catalog_etag)(view)
+    if not iscoroutinefunction(view):
+        return conditional
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request._catalog_version = await acatalog_version()
+        return await conditional(request, *args, **kwargs)
+    return wrapper
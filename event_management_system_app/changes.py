@@ -0,0 +1,159 @@
+"""The catalog change log and its ``/api/changes/`` endpoint.
+
+Every catalog write appends a ``CatalogChange`` in its own transaction.
+Saves and deletes of categories and events are logged through signals, so
+the site's views and the admin are covered alike. Participant increments
+are logged by ``increment_participants``, and imports by
+:func:`categories_created` and :func:`events_created`.
+A change carries the object's API fields after the write (only the new
+count for a booking), so clients apply it without fetching anything.
+
+Change IDs increase monotonically and serve as catalog versions: a client
+asks for the changes after the last version it has seen. The log is pruned
+periodically (``prune_changes``). A client whose version has been pruned
+must start over from the current one.
+"""
+import asyncio
+import time
+from datetime import timedelta
+
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from .api import EVENT_FIELDS, api_error, api_response
+from .models import CatalogChange, Event
+
+MAX_CHANGES = 500
+# Well below the usual 30-second worker and proxy timeouts.
+MAX_WAIT = 20
+POLL_INTERVAL = 0.5
+RETENTION = timedelta(days=7)
+
+
+def _events(queryset):
+    lookups = list(EVENT_FIELDS.values())
+    return [dict(zip(EVENT_FIELDS, row)) for row in queryset.values_list(*lookups)]
+
+
+def category_saved(category, created):
+    CatalogChange.objects.record(
+        'category', 'created' if created else 'updated', category.pk, {'id': category.pk, 'name': category.name},
+    )
+
+
+def category_deleted(category_id):
+    # Clients drop the category's events with it; they are not logged one by one.
+    CatalogChange.objects.record('category', 'deleted', category_id)
+
+
+def event_saved(event, created):
+    data = _events(Event.objects.filter(pk=event.pk))
+    CatalogChange.objects.record('event', 'created' if created else 'updated', event.pk, data[0] if data else None)
+
+
+def event_deleted(event_id):
+    CatalogChange.objects.record('event', 'deleted', event_id)
+
+
+def categories_created(categories):
+    """Log categories inserted with ``bulk_create()``."""
+    CatalogChange.objects.record_many([
+        CatalogChange(kind='category', action='created', object_id=category.pk,
+                      data={'id': category.pk, 'name': category.name})
+        for category in categories
+    ])
+
+
+def events_created(events, category_names):
+    """Log events inserted with ``bulk_create()``, which sends no signals;
+    ``category_names`` maps their category IDs to names."""
+    data = [
+        {field: category_names[event.category_id] if lookup == 'category__name' else getattr(event, lookup)
+         for field, lookup in EVENT_FIELDS.items()}
+        for event in events
+    ]
+    CatalogChange.objects.record_many([
+        CatalogChange(kind='event', action='created', object_id=row['id'], data=row) for row in data
+    ])
+
+
+def current_version():
+    return CatalogChange.objects.aggregate(version=Max('pk'))['version'] or 0
+
+
+async def acurrent_version():
+    return (await CatalogChange.objects.aaggregate(version=Max('pk')))['version'] or 0
+
+
+class VersionGone(Exception):
+    """The changes after a version have been pruned."""
+
+
+async def changes_since(since, limit=MAX_CHANGES, wait=0):
+    """``(changes, more)``: up to ``limit`` changes after version ``since``,
+    oldest first, and whether there are more. With ``wait`` seconds, polls
+    until there is at least one change or the time is up.
+
+    Raises :class:`VersionGone` if the log no longer reaches back to ``since``.
+    """
+    deadline = time.monotonic() + min(wait, MAX_WAIT)
+    after = (
+        CatalogChange.objects.filter(pk__gt=since).order_by('pk')
+        .values('pk', 'kind', 'action', 'object_id', 'data')[:limit + 1]
+    )
+    while True:
+        rows = [row async for row in after.all()]
+        if rows or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(POLL_INTERVAL)
+    if not rows or rows[0]['pk'] > since + 1:
+        # Pruned, or just IDs lost to rolled back transactions? A version
+        # from the future means the log was reset.
+        log = await CatalogChange.objects.aaggregate(oldest=Min('pk'), latest=Max('pk'))
+        if since > (log['latest'] or 0) or (log['oldest'] or 1) > since + 1:
+            raise VersionGone(since)
+    changes = [
+        {'version': row['pk'], 'kind': row['kind'], 'action': row['action'], 'id': row['object_id'], 'data': row['data']}
+        for row in rows[:limit]
+    ]
+    return changes, len(rows) > limit
+
+
+def prune(older_than=RETENTION):
+    """Delete changes older than ``older_than``, keeping the latest so the
+    current version is never lost. Returns the number deleted."""
+    latest = current_version()
+    deleted, _ = CatalogChange.objects.filter(created_at__lt=timezone.now() - older_than).exclude(pk=latest).delete()
+    return deleted
+
+
+@require_GET
+async def api_changes(request):
+    """Changes after version ``since``, oldest first, up to ``limit``.
+
+    With ``wait`` (seconds, at most ``MAX_WAIT``) the request is held until
+    there is a change: a long poll. Without ``since`` it only returns the
+    current version to start from. A pruned ``since`` gets a 410 carrying
+    the current version; clients drop what they hold and continue from it.
+
+    Under ASGI a waiting poll only holds a coroutine. A WSGI server runs the
+    view on the request's thread, so every bot process keeps one thread
+    busy; give the server that many threads on top of its usual load.
+    """
+    since, limit, wait = (request.GET.get(name, '') for name in ('since', 'limit', 'wait'))
+    if not all(value.isdigit() for value in (since or '0', limit or '1', wait or '0')) or limit == '0':
+        return api_error('since, limit and wait must be whole numbers')
+    if not since:
+        return api_response({'version': await acurrent_version(), 'changes': [], 'more': False})
+    try:
+        changes, more = await changes_since(int(since), min(int(limit or MAX_CHANGES), MAX_CHANGES), int(wait or 0))
+    except VersionGone:
+        return api_response({
+            'status': 'error', 'message': 'Version is too old, start over', 'version': await acurrent_version(),
+        }, status=410)
+    return api_response({
+        'version': changes[-1]['version'] if changes else int(since),
+        'changes': changes,
+        'more': more,
+    })
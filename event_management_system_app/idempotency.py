@@ -0,0 +1,112 @@
+"""Idempotency keys for the booking writes.
+
+Clients that may retry a booking (the bots, after a timeout) send a key with
+it: an ``Idempotency-Key`` header on ``/increment_participants/<id>/``, or a
+``key`` per booking posted to ``/api/bookings/``. The first request with a
+key claims it, does the write and stores its result under the key; repeats
+get that stored result back with one read and no write. While the first
+request is still running, repeats are told to retry shortly.
+
+Keys are :class:`~.models.IdempotencyKey` rows. A claim inserts the row, and
+the unique constraint on scope and key lets only one of several concurrent
+requests have it, whatever the database; no cache backend needs an atomic
+``add()``. Results expire after ``KEY_TIMEOUT`` seconds, far longer than any
+client keeps retrying, and the ``prune_idempotency_keys`` command (run
+periodically) deletes expired rows.
+"""
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+KEY_TIMEOUT = 24 * 60 * 60
+# How long a claim survives a request that died before storing its result.
+CLAIM_TIMEOUT = 60
+MAX_KEY_LENGTH = 200
+IN_PROGRESS = 'in-progress'
+
+
+class InvalidKey(ValueError):
+    pass
+
+
+def clean_key(key):
+    """``key`` as sent, or ``None`` without one; raises :class:`InvalidKey`."""
+    if key is None:
+        return None
+    if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH or not key.isprintable():
+        raise InvalidKey(key)
+    return key
+
+
+def claim(scope, keys):
+    """Claim ``keys`` for one write in ``scope``.
+
+    Returns ``{key: result}`` for the keys already used: the stored result,
+    or :data:`IN_PROGRESS` while another request holds the key. The other
+    keys are claimed and must be passed to :func:`remember` or
+    :func:`release`.
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    now = timezone.now()
+    rows = IdempotencyKey.objects.filter(scope=scope, key__in=keys)
+    used, expired = {}, []
+    for key, result, expires_at in rows.values_list('key', 'result', 'expires_at'):
+        if expires_at > now:
+            used[key] = IN_PROGRESS if result is None else result
+        else:
+            expired.append(key)
+    free = [key for key in keys if key not in used]
+    if free:
+        if expired:
+            rows.filter(key__in=expired, expires_at__lte=now).delete()
+        token = uuid.uuid4().hex
+        IdempotencyKey.objects.bulk_create([
+            IdempotencyKey(scope=scope, key=key, token=token, expires_at=now + timedelta(seconds=CLAIM_TIMEOUT))
+            for key in free
+        ], ignore_conflicts=True)
+        # Keys another request inserted first are theirs.
+        for key, result in rows.filter(key__in=free).exclude(token=token).values_list('key', 'result'):
+            used[key] = IN_PROGRESS if result is None else result
+    return used
+
+
+def remember(scope, results):
+    """Store ``{key: result}`` for claimed keys."""
+    if not results:
+        return
+    expires_at = timezone.now() + timedelta(seconds=KEY_TIMEOUT)
+    rows = list(IdempotencyKey.objects.filter(scope=scope, key__in=results))
+    for row in rows:
+        row.result, row.expires_at = results[row.key], expires_at
+    IdempotencyKey.objects.bulk_update(rows, ['result', 'expires_at'])
+
+
+def release(scope, keys):
+    """Give up claimed keys whose write failed, so a retry can try again."""
+    keys = list(keys)
+    if keys:
+        IdempotencyKey.objects.filter(scope=scope, key__in=keys).delete()
+
+
+def prune():
+    """Delete expired keys and claims. Returns the number deleted."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+async def aclaim(scope, keys):
+    return await sync_to_async(claim)(scope, keys)
+
+
+async def aremember(scope, results):
+    await sync_to_async(remember)(scope, results)
+
+
+async def arelease(scope, keys):
+    await sync_to_async(release)(scope, keys)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from event_management_system_app.bulk import FORMATS, export_events, guess_format
+from event_management_system_app.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Export events as CSV or JSON Lines, to a file or standard output.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension, else csv.')
+        parser.add_argument('--category', type=int, help='Only export the events of this category ID.')
+
+    def handle(self, path='-', format=None, category=None, **options):
+        events = Event.objects.all() if category is None else Event.objects.filter(category_id=category)
+        chunks = export_events(events, format or guess_format(path))
+        if path == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            output.writelines(chunks)
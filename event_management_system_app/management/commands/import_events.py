@@ -0,0 +1,38 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from event_management_system_app.bulk import CHUNK_SIZE, FORMATS, guess_format, import_events
+
+
+class Command(BaseCommand):
+    help = 'Import events from a CSV or JSON Lines file ("-" reads standard input).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension, else csv.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Events per transaction.')
+        parser.add_argument('--create-categories', action='store_true', help='Create categories that do not exist yet.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without importing it.')
+
+    def handle(self, path, format=None, chunk_size=CHUNK_SIZE, create_categories=False, dry_run=False, **options):
+        format = format or guess_format(path)
+        try:
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='') if path == '-' \
+                else open(path, encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(e)
+        with stream:
+            result = import_events(
+                stream, format, chunk_size=chunk_size, create_categories=create_categories, dry_run=dry_run,
+            )
+        for line, message in result.errors:
+            self.stderr.write(f'line {line}: {message}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more invalid rows')
+        verb = 'Would import' if dry_run else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.created} events ({result.categories_created} new categories), '
+            f'skipped {result.error_count} invalid rows.'
+        ))
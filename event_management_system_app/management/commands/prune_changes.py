@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from event_management_system_app.changes import RETENTION, prune
+
+
+class Command(BaseCommand):
+    help = 'Delete catalog changes older than --days; bots further behind start over. Run periodically, e.g. daily.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=RETENTION.days)
+
+    def handle(self, days=RETENTION.days, **options):
+        deleted = prune(timedelta(days=days))
+        self.stdout.write(f'Deleted {deleted} change(s).')
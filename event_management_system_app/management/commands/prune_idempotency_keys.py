@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from event_management_system_app.idempotency import prune
+
+
+class Command(BaseCommand):
+    help = 'Delete expired booking idempotency keys. Run periodically, e.g. hourly.'
+
+    def handle(self, **options):
+        deleted = prune()
+        self.stdout.write(f'Deleted {deleted} key(s).')
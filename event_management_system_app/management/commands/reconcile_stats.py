@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from event_management_system_app.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the category statistics from the events and bookings. Run periodically, e.g. hourly.'
+
+    def handle(self, **options):
+        fixed = reconcile()
+        self.stdout.write(f'Reconciled statistics; {fixed} row(s) were missing or wrong.')
@@ -0,0 +1,95 @@
+"""Request metrics and the ``/metrics`` endpoint.
+
+:class:`MetricsMiddleware` records, per view, how long requests take and
+how many database queries they run. The endpoint renders every metric of
+the process in the Prometheus text format (see :mod:`eventease.metrics`),
+including the bot's when it is served from the same ASGI process.
+
+Scrapers authenticate with ``Authorization: Bearer <METRICS_TOKEN>``; with
+no token configured, only local clients are answered.
+"""
+import hmac
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+from eventease.metrics import CONTENT_TYPE, Counter, Histogram, render
+
+REQUEST_SECONDS = Histogram('eventease_http_request_duration_seconds', 'Time to respond, by view.', ['view'])
+REQUESTS = Counter('eventease_http_requests_total', 'Responses by view, method and status.', ['view', 'method', 'status'])
+REQUEST_QUERIES = Histogram(
+    'eventease_http_request_queries', 'Database queries per request, by view.', ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+CACHE_REQUESTS = Counter(
+    'eventease_site_cache_requests_total', 'Site cache lookups by result (hit or miss, timeline: local).',
+    ['cache', 'result'],
+)
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+class _QueryCounter:
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Sync and async capable, so that under ASGI it does not move every
+    request onto a thread. Async requests run their queries on threads of
+    their own, out of reach of the wrapper, so their queries are not
+    counted."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        queries = _QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        self._observe(request, response, time.perf_counter() - started, queries.count)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, time.perf_counter() - started)
+        return response
+
+    def _observe(self, request, response, elapsed, queries=None):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        REQUEST_SECONDS.labels(view).observe(elapsed)
+        if queries is not None:
+            REQUEST_QUERIES.labels(view).observe(queries)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+
+
+def _authorized(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    return request.META.get('REMOTE_ADDR') in LOCAL_ADDRESSES
+
+
+def metrics(request):
+    if not _authorized(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
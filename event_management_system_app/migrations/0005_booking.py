@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_management_system_app', '0004_event_capacity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Booking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(db_index=True)),
+                ('name', models.CharField(max_length=100)),
+                ('email', models.CharField(max_length=254)),
+                ('participant_number', models.IntegerField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='event_management_system_app.event')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'created_at'], name='event_manag_event_i_c76e94_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_management_system_app', '0005_booking'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['category', 'start_date', 'id'], name='event_category_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['start_date'], name='event_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['priority'], name='event_priority_idx'),
+        ),
+        # Dropped only after event_category_start_idx exists to cover it.
+        migrations.AlterField(
+            model_name='event',
+            name='category',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='event_management_system_app.category'),
+        ),
+    ]
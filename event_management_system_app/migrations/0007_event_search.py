@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# SQLite: an FTS5 index over the event table's own columns (external
+# content), kept in sync by triggers. Only edits to the indexed columns
+# touch it, so participant increments do not.
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE event_search USING fts5("
+    "name, description, location, organizer, "
+    "content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2', "
+    # Every search term is a prefix query; short prefixes get their own index.
+    "prefix='2 3')",
+    "CREATE TRIGGER event_search_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO event_search (rowid, name, description, location, organizer) "
+    "VALUES (new.id, new.name, new.description, new.location, new.organizer); END",
+    "CREATE TRIGGER event_search_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO event_search (event_search, rowid, name, description, location, organizer) "
+    "VALUES ('delete', old.id, old.name, old.description, old.location, old.organizer); END",
+    "CREATE TRIGGER event_search_update AFTER UPDATE OF name, description, location, organizer ON {table} BEGIN "
+    "INSERT INTO event_search (event_search, rowid, name, description, location, organizer) "
+    "VALUES ('delete', old.id, old.name, old.description, old.location, old.organizer); "
+    "INSERT INTO event_search (rowid, name, description, location, organizer) "
+    "VALUES (new.id, new.name, new.description, new.location, new.organizer); END",
+    "INSERT INTO event_search (event_search) VALUES ('rebuild')",
+]
+SQLITE_BACKWARDS = [
+    'DROP TRIGGER IF EXISTS event_search_insert',
+    'DROP TRIGGER IF EXISTS event_search_delete',
+    'DROP TRIGGER IF EXISTS event_search_update',
+    'DROP TABLE IF EXISTS event_search',
+]
+
+# PostgreSQL: a GIN index on the weighted document; being an expression
+# index it is always in sync. Must match search.POSTGRES_DOCUMENT.
+POSTGRES_FORWARDS = [
+    "CREATE INDEX event_search_idx ON {table} USING GIN (("
+    "setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(location, '') || ' ' || coalesce(organizer, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C')))",
+]
+POSTGRES_BACKWARDS = ['DROP INDEX IF EXISTS event_search_idx']
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        connection = schema_editor.connection
+        vendor_statements = statements.get(connection.vendor, [])
+        table = apps.get_model('event_management_system_app', 'Event')._meta.db_table
+        for statement in vendor_statements:
+            schema_editor.execute(statement.format(table=table))
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_management_system_app', '0006_event_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARDS, 'postgresql': POSTGRES_FORWARDS}),
+            run({'sqlite': SQLITE_BACKWARDS, 'postgresql': POSTGRES_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+
+def fill_stats(apps, schema_editor):
+    # The same totals as stats.reconcile(), with the historical models.
+    Category = apps.get_model('event_management_system_app', 'Category')
+    Booking = apps.get_model('event_management_system_app', 'Booking')
+    CategoryStats = apps.get_model('event_management_system_app', 'CategoryStats')
+    DailyBookings = apps.get_model('event_management_system_app', 'DailyBookings')
+    now = timezone.now()
+    totals = Category.objects.annotate(
+        event_count=Count('event'),
+        upcoming_count=Count('event', filter=Q(event__start_date__gt=now)),
+        participant_count=Coalesce(Sum('event__participants'), 0),
+    ).values_list('pk', 'event_count', 'upcoming_count', 'participant_count')
+    CategoryStats.objects.bulk_create(
+        CategoryStats(category_id=pk, events=events, upcoming=upcoming, participants=participants, as_of=now)
+        for pk, events, upcoming, participants in totals
+    )
+    days = (
+        Booking.objects.annotate(day=TruncDate('created_at'))
+        .values('event__category_id', 'day').annotate(count=Count('pk')).order_by()
+    )
+    DailyBookings.objects.bulk_create(
+        DailyBookings(category_id=row['event__category_id'], day=row['day'], bookings=row['count']) for row in days
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_management_system_app', '0008_event_end_start_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='event_management_system_app.category')),
+                ('events', models.IntegerField(default=0)),
+                ('upcoming', models.IntegerField(default=0)),
+                ('participants', models.IntegerField(default=0)),
+                ('as_of', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyBookings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='event_management_system_app.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'category'), name='daily_bookings_day_category')],
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,83 @@
-from django.db import models
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .caching import bump_catalog_version
+
+
+class EventQuerySet(models.QuerySet):
+	def increment_participants(self, event_id, by=1):
+		"""Add ``by`` participants to an event in a single UPDATE.
+
+		The increment happens in the database, so concurrent bookings can
+		never overwrite each other, and only the ``participants`` column is
+		written. Events with a ``capacity`` are only incremented while there
+		is room, which the same UPDATE checks.
+
+		Returns the new participant count, or ``None`` if the event is full.
+		Raises ``Event.DoesNotExist`` for an unknown event.
+		"""
+		with transaction.atomic():
+			event = self.filter(pk=event_id)
+			updated = event.filter(
+				Q(capacity__isnull=True) | Q(participants__lte=F('capacity') - by)
+			).update(participants=F('participants') + by)
+			# The row stays locked until commit, so this reads our own increment.
+			participants = event.values_list('participants', flat=True).first()
+			if updated:
+				CategoryStats.objects.filter(category__event=event_id).update(participants=F('participants') + by)
+				CatalogChange.objects.record('event', 'participants', event_id, {'participants': participants})
+				bump_catalog_version()
+		if participants is None:
+			raise self.model.DoesNotExist
+		return participants if updated else None
+
+	async def aincrement_participants(self, event_id, by=1):
+		# Transactions are only available to synchronous code.
+		return await sync_to_async(self.increment_participants)(event_id, by)
+
+
+class BookingQuerySet(models.QuerySet):
+	def create_batch(self, bookings):
+		"""Record a batch of unsaved ``Booking`` objects in one transaction.
+
+		Bookings for the same event share one participant UPDATE and all
+		accepted rows are written with a single INSERT. Returns one result
+		per booking, in order: the participant number it was given, or
+		``None`` if its event was full or no longer exists.
+		"""
+		by_event = {}
+		for booking in bookings:
+			booking.participant_number = None
+			by_event.setdefault(booking.event_id, []).append(booking)
+
+		accepted = []
+		with transaction.atomic():
+			for event_id, group in by_event.items():
+				try:
+					total = Event.objects.increment_participants(event_id, by=len(group))
+					if total is not None:
+						numbers = range(total - len(group) + 1, total + 1)
+					else:
+						# Not enough room for the whole group: take seats one
+						# at a time until the event is full.
+						numbers = []
+						for booking in group:
+							number = Event.objects.increment_participants(event_id)
+							if number is None:
+								break
+							numbers.append(number)
+				except Event.DoesNotExist:
+					continue
+				for booking, number in zip(group, numbers):
+					booking.participant_number = number
+					accepted.append(booking)
+			self.bulk_create(accepted)
+			DailyBookings.objects.add_bookings(accepted)
+		return [booking.participant_number for booking in bookings]
+
 
 class Category(models.Model):
 	name = models.CharField(max_length=100)
@@ -7,11 +85,137 @@ class Category(models.Model):
 class Event(models.Model):
 	id = models.AutoField(primary_key=True)
 	name = models.CharField(max_length=100)
-	category = models.ForeignKey(Category, on_delete=models.CASCADE)
+	# Indexed through the leading column of event_category_start_idx.
+	category = models.ForeignKey(Category, on_delete=models.CASCADE, db_index=False)
 	start_date = models.DateTimeField()
 	end_date = models.DateTimeField()
 	priority = models.IntegerField(default=1)
 	description = models.TextField(default='')
 	location = models.CharField(max_length=255, default='')
 	organizer = models.CharField(max_length=100, default='')
-	participants = models.IntegerField(default=0)
\ No newline at end of file
+	participants = models.IntegerField(default=0)
+	capacity = models.PositiveIntegerField(null=True, blank=True)
+
+	objects = EventQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			# Category listings, paged by (start_date, id).
+			models.Index(fields=['category', 'start_date', 'id'], name='event_category_start_idx'),
+			# Upcoming-event filters across all categories.
+			models.Index(fields=['start_date'], name='event_start_idx'),
+			# Events overlapping a time range: unfinished ones, start checked in the index.
+			models.Index(fields=['end_date', 'start_date'], name='event_end_start_idx'),
+			models.Index(fields=['priority'], name='event_priority_idx'),
+		]
+
+class Booking(models.Model):
+	event = models.ForeignKey(Event, on_delete=models.CASCADE)
+	user_id = models.BigIntegerField(db_index=True)
+	name = models.CharField(max_length=100)
+	email = models.CharField(max_length=254)
+	participant_number = models.IntegerField(null=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	objects = BookingQuerySet.as_manager()
+
+	class Meta:
+		indexes = [models.Index(fields=['event', 'created_at'])]
+
+
+class DailyBookingsQuerySet(models.QuerySet):
+	def add(self, counts):
+		"""Add ``{(category_id, day): bookings}`` to the daily totals;
+		negative counts only reduce existing rows."""
+		for (category_id, day), count in counts.items():
+			if not count:
+				continue
+			row = self.filter(category_id=category_id, day=day)
+			if row.update(bookings=F('bookings') + count) or count < 0:
+				continue
+			try:
+				with transaction.atomic():
+					self.create(category_id=category_id, day=day, bookings=count)
+			except IntegrityError:
+				# Created concurrently since our UPDATE.
+				row.update(bookings=F('bookings') + count)
+
+	def add_bookings(self, bookings):
+		"""Count saved ``Booking`` objects on the local day they were made."""
+		categories = dict(Event.objects.filter(pk__in={b.event_id for b in bookings}).values_list('id', 'category_id'))
+		counts = {}
+		for booking in bookings:
+			key = (categories[booking.event_id], timezone.localdate(booking.created_at))
+			counts[key] = counts.get(key, 0) + 1
+		self.add(counts)
+
+
+class CategoryStats(models.Model):
+	"""Running totals of a category's events, maintained by :mod:`.stats`."""
+	category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+	events = models.IntegerField(default=0)
+	# Events starting after ``as_of``; readers discount those started since.
+	upcoming = models.IntegerField(default=0)
+	participants = models.IntegerField(default=0)
+	as_of = models.DateTimeField()
+
+class DailyBookings(models.Model):
+	category = models.ForeignKey(Category, on_delete=models.CASCADE, db_index=False)
+	day = models.DateField()
+	bookings = models.IntegerField(default=0)
+
+	objects = DailyBookingsQuerySet.as_manager()
+
+	class Meta:
+		constraints = [
+			# Recent days across all categories, and the upsert key.
+			models.UniqueConstraint(fields=['day', 'category'], name='daily_bookings_day_category'),
+		]
+
+
+class CatalogChangeQuerySet(models.QuerySet):
+	def record(self, kind, action, object_id, data=None):
+		"""Append a change to the log, in the current transaction."""
+		return self.record_many([CatalogChange(kind=kind, action=action, object_id=object_id, data=data)])
+
+	def record_many(self, changes):
+		with transaction.atomic(savepoint=False):
+			connection = transaction.get_connection(self.db)
+			if connection.vendor == 'postgresql':
+				# IDs are handed out before commit; serialize appends so that
+				# they also become visible in ID order, or readers skip some.
+				with connection.cursor() as cursor:
+					cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CHANGE_LOG_LOCK])
+			return self.bulk_create(changes)
+
+
+CHANGE_LOG_LOCK = 0x43484e47
+
+class CatalogChange(models.Model):
+	"""One write to the catalog; the ID is the catalog version it made."""
+	kind = models.CharField(max_length=10)  # 'category' or 'event'
+	# 'created', 'updated' or 'deleted'; 'participants' for bookings
+	action = models.CharField(max_length=12)
+	object_id = models.IntegerField()
+	# The object's API fields after the write; only the count for bookings.
+	data = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	objects = CatalogChangeQuerySet.as_manager()
+
+
+class IdempotencyKey(models.Model):
+	"""A key claimed by one booking write, and then its result (see :mod:`.idempotency`)."""
+	scope = models.CharField(max_length=100)
+	key = models.CharField(max_length=200)
+	# Tells the request that inserted the row apart from concurrent ones.
+	token = models.CharField(max_length=32)
+	# The write's result; null while it is in progress.
+	result = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+	expires_at = models.DateTimeField(db_index=True)
+
+	class Meta:
+		constraints = [
+			# Claims are inserts, so only one request gets a key.
+			models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_key_scope_key'),
+		]
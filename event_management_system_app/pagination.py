@@ -0,0 +1,177 @@
+"""Keyset (cursor) pagination.
+
+Pages are addressed by the ordering key of the row just outside them rather
+than by an offset, so fetching any page costs one indexed range scan no
+matter how deep it is, and inserts do not shift later pages. Cursors are
+opaque URL-safe strings.
+
+Ranked results (search) have no such key and use offset cursors instead,
+with the same ``after``/``before`` meaning.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Page:
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _key_value(row, key):
+    return row[key] if isinstance(row, dict) else getattr(row, key)
+
+
+def _encode(values):
+    raw = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode(cursor, length):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    values = json.loads(raw)
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError
+    return values
+
+
+def encode_cursor(row, keys):
+    values = [_key_value(row, key) for key in keys]
+    return _encode([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+
+
+def decode_cursor(cursor, model, keys):
+    try:
+        values = _decode(cursor, len(keys))
+        return [model._meta.get_field(key).to_python(value) for key, value in zip(keys, values)]
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+
+def decode_offset(cursor):
+    try:
+        (offset,) = _decode(cursor, 1)
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError
+        return offset
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+
+def _seek(keys, values, op):
+    """``(k1, k2, ...) op (v1, v2, ...)`` as a lexicographic Q expression."""
+    condition = Q()
+    for i in range(len(keys) - 1, -1, -1):
+        step = Q(**{f'{keys[i]}__{op}': values[i]})
+        if i < len(keys) - 1:
+            step |= Q(**{keys[i]: values[i]}) & condition
+        condition = step
+    return condition
+
+
+def parse_page_size(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(request.GET.get('limit', default))
+    except ValueError:
+        raise InvalidCursor('Invalid limit')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def paginate(queryset, keys, after=None, before=None, size=DEFAULT_PAGE_SIZE):
+    """Return the page of ``queryset`` (ordered ascending by ``keys``) that
+    starts right after the ``after`` cursor, or ends right before the
+    ``before`` cursor, or the first page if neither is given.
+
+    ``keys`` must end with a unique field so that the order is total. The
+    key fields must be present on each row, whether rows are model
+    instances or ``values()`` dicts.
+    """
+    rows = list(_keyset_query(queryset, keys, after, before, size))
+    return _keyset_page(rows, keys, after, before, size)
+
+
+async def apaginate(queryset, keys, after=None, before=None, size=DEFAULT_PAGE_SIZE):
+    """:func:`paginate` through the async ORM interface."""
+    rows = [row async for row in _keyset_query(queryset, keys, after, before, size)]
+    return _keyset_page(rows, keys, after, before, size)
+
+
+def _keyset_query(queryset, keys, after, before, size):
+    model = queryset.model
+    if before:
+        seek = _seek(keys, decode_cursor(before, model, keys), 'lt')
+        return queryset.filter(seek).order_by(*[f'-{key}' for key in keys])[:size + 1]
+    if after:
+        queryset = queryset.filter(_seek(keys, decode_cursor(after, model, keys), 'gt'))
+    return queryset.order_by(*keys)[:size + 1]
+
+
+def _keyset_page(rows, keys, after, before, size):
+    if before:
+        more_before, more_after = len(rows) > size, True
+        rows = rows[:size][::-1]
+    else:
+        more_before, more_after = bool(after), len(rows) > size
+        rows = rows[:size]
+    if not rows:
+        return Page(rows, None, None)
+    return Page(
+        rows,
+        encode_cursor(rows[-1], keys) if more_after else None,
+        encode_cursor(rows[0], keys) if more_before else None,
+    )
+
+
+def paginate_offsets(fetch, after=None, before=None, size=DEFAULT_PAGE_SIZE):
+    """Page through ranked results with offset cursors.
+
+    ``fetch(offset, limit)`` returns up to ``limit`` items starting at
+    ``offset``. An ``after`` cursor is the offset the page starts at, a
+    ``before`` cursor the offset it ends before.
+    """
+    start, limit = _offset_window(after, before, size)
+    return _offset_page(fetch(start, limit), start, before, size)
+
+
+async def apaginate_offsets(fetch, after=None, before=None, size=DEFAULT_PAGE_SIZE):
+    """:func:`paginate_offsets` with an async ``fetch``."""
+    start, limit = _offset_window(after, before, size)
+    return _offset_page(await fetch(start, limit), start, before, size)
+
+
+def _offset_window(after, before, size):
+    """``(offset, limit)`` of the items to fetch for a page."""
+    if before:
+        end = decode_offset(before)
+        start = max(0, end - size)
+        return start, end - start
+    start = decode_offset(after) if after else 0
+    return start, size + 1
+
+
+def _offset_page(items, start, before, size):
+    if before:
+        more_after = True
+    else:
+        more_after = len(items) > size
+        items = items[:size]
+    if not items:
+        return Page(items, None, None)
+    return Page(
+        items,
+        _encode([start + len(items)]) if more_after else None,
+        _encode([start]) if start > 0 else None,
+    )
@@ -0,0 +1,83 @@
+"""Sampled request profiles and a slow-request log (opt-in).
+
+Add ``ProfilingMiddleware`` to ``MIDDLEWARE`` after the metrics middleware
+(production settings do this when ``PROFILE_SAMPLE_RATE`` is set). It
+profiles a ``PROFILE_SAMPLE_RATE`` fraction of requests with the sampling
+profiler of :mod:`eventease.profiling`. A profile records the SQL the
+request ran and is written to ``PROFILE_DIR``. Requests slower than
+``SLOW_REQUEST_THRESHOLD`` seconds are logged to ``eventease.slow``.
+Staff browse the profiles and their flame graphs at ``/admin/profiles/``.
+"""
+import asyncio
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from eventease.profiling import (
+    DEFAULT_INTERVAL, DEFAULT_MAX_PROFILES, DEFAULT_SLOW_THRESHOLD, Profiler,
+)
+
+
+def profile_directory():
+    return str(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def profiler_from_settings():
+    return Profiler(
+        profile_directory(),
+        sample_rate=getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0),
+        interval=getattr(settings, 'PROFILE_INTERVAL', DEFAULT_INTERVAL),
+        slow_threshold=getattr(settings, 'SLOW_REQUEST_THRESHOLD', DEFAULT_SLOW_THRESHOLD),
+        max_profiles=getattr(settings, 'PROFILE_MAX_FILES', DEFAULT_MAX_PROFILES),
+    )
+
+
+class ProfilingMiddleware:
+    """Sync and async capable, like the metrics middleware. An async request
+    is sampled on the event loop thread, so its profile also shows the other
+    requests it waited behind, and its queries, which run on threads of
+    their own, are not recorded."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.profiler = profiler_from_settings()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        run = self.profiler.begin('request')
+        if run.sampled:
+            with connection.execute_wrapper(run.record_query):
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        if run.stop().noteworthy:
+            self._describe(run, request, response)
+            self._add_profile_id(response, run.report())
+        return response
+
+    async def __acall__(self, request):
+        run = self.profiler.begin('request')
+        response = await self.get_response(request)
+        if run.stop().noteworthy:
+            self._describe(run, request, response)
+            # Writing the profile files would block the event loop.
+            self._add_profile_id(response, await asyncio.to_thread(run.report) if run.sampled else run.report())
+        return response
+
+    def _describe(self, run, request, response):
+        match = request.resolver_match
+        run.describe(
+            name=match.view_name if match else 'unmatched',
+            method=request.method, path=request.get_full_path(), status=response.status_code,
+        )
+
+    def _add_profile_id(self, response, profile_id):
+        if profile_id:
+            response['X-Profile-Id'] = profile_id
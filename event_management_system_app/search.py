@@ -0,0 +1,91 @@
+"""Full-text event search.
+
+Backed by the FTS5 table (SQLite) or GIN expression index (PostgreSQL)
+created in migration 0007; other databases fall back to ``icontains``
+scans. Results are ranked with name matches first, then location and
+organizer, then description. Every word of the query must match, as a
+prefix, so partial input like ``jazz ni`` already finds "Jazz Night".
+
+Note for SQLite: migrations that rebuild the event table (most field
+alterations do) drop its triggers, so such a migration must recreate them.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Event
+
+MAX_TERMS = 8
+
+# bm25 weights for name, description, location, organizer.
+SQLITE_RANK = 'bm25(event_search, 10.0, 1.0, 3.0, 3.0)'
+
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(location, '') || ' ' || coalesce(organizer, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C')"
+)
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+def _match(terms):
+    """Backend query string matching every term as a prefix."""
+    if connection.vendor == 'sqlite':
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _table():
+    return Event._meta.db_table
+
+
+def matching(text):
+    """``Q`` selecting the events that match ``text`` (unranked)."""
+    terms = search_terms(text)
+    if not terms:
+        return Q(pk__in=[])
+    if connection.vendor == 'sqlite':
+        return Q(pk__in=RawSQL('SELECT rowid FROM event_search WHERE event_search MATCH %s', [_match(terms)]))
+    if connection.vendor == 'postgresql':
+        return Q(pk__in=RawSQL(
+            f"SELECT id FROM {_table()} WHERE {POSTGRES_DOCUMENT} @@ to_tsquery('english', %s)",
+            [_match(terms)],
+        ))
+    condition = Q()
+    for term in terms:
+        condition &= (
+            Q(name__icontains=term) | Q(description__icontains=term)
+            | Q(location__icontains=term) | Q(organizer__icontains=term)
+        )
+    return condition
+
+
+def ranked_ids(text, offset=0, limit=20):
+    """IDs of the events matching ``text``, best match first."""
+    terms = search_terms(text)
+    if not terms:
+        return []
+    if connection.vendor == 'sqlite':
+        sql = (
+            f'SELECT rowid FROM event_search WHERE event_search MATCH %s '
+            f'ORDER BY {SQLITE_RANK}, rowid LIMIT %s OFFSET %s'
+        )
+    elif connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT id FROM {_table()}, to_tsquery('english', %s) query "
+            f"WHERE {POSTGRES_DOCUMENT} @@ query "
+            f"ORDER BY ts_rank({POSTGRES_DOCUMENT}, query) DESC, id LIMIT %s OFFSET %s"
+        )
+    else:
+        return list(
+            Event.objects.filter(matching(text)).order_by('start_date', 'id')
+            .values_list('id', flat=True)[offset:offset + limit]
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_match(terms), limit, offset])
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,111 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import changes, stats, timeline
+from .caching import bump_catalog_version
+from .models import Category, DailyBookings, Event
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def catalog_changed(sender, **kwargs):
+	bump_catalog_version()
+
+
+@receiver(pre_save, sender=Event)
+def remember_stored_event(sender, instance, raw=False, update_fields=None, **kwargs):
+	# The days an edited event covered before, whose buckets it leaves, and
+	# what it counted for in the statistics.
+	instance._previous_span = instance._previous_totals = None
+	if instance.pk is not None and not raw:
+		stored = Event.objects.filter(pk=instance.pk).values_list(
+			'start_date', 'end_date', 'category_id', 'participants').first()
+		if stored:
+			start_date, end_date, category_id, participants = stored
+			instance._previous_span = (start_date, end_date)
+			instance._previous_totals = (category_id, start_date, participants)
+			# A save that leaves the count alone keeps the stored one, which
+			# the statistics and the change feed then report.
+			if update_fields is not None and 'participants' not in update_fields:
+				instance.participants = participants
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_timeline_changed(sender, instance, **kwargs):
+	spans = [(instance.start_date, instance.end_date)]
+	if getattr(instance, '_previous_span', None):
+		spans.append(instance._previous_span)
+	timeline.touch(spans)
+
+
+@receiver(post_save, sender=Category)
+def category_timeline_changed(sender, instance, created, **kwargs):
+	# Bucket rows carry the category name; new categories have no events.
+	if not created:
+		timeline.touch()
+
+
+def _deleting_category(origin):
+	# Statistics rows go with their category.
+	return isinstance(origin, Category) or (isinstance(origin, QuerySet) and origin.model is Category)
+
+
+@receiver(post_save, sender=Category)
+def category_stats_created(sender, instance, created, raw=False, **kwargs):
+	if created and not raw:
+		stats.category_created(instance)
+
+
+@receiver(post_save, sender=Event)
+def event_stats_saved(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	added, removed = stats.event_totals(instance), getattr(instance, '_previous_totals', None)
+	if added != removed:
+		stats.events_changed(added=[added], removed=[removed] if removed else [])
+
+
+@receiver(pre_delete, sender=Event)
+def remember_deleted_event(sender, instance, origin=None, **kwargs):
+	# Read before the bookings are deleted along with the event; the
+	# instance may hold a stale participant count.
+	if not _deleting_category(origin):
+		instance._previous_totals = Event.objects.filter(pk=instance.pk).values_list(
+			'category_id', 'start_date', 'participants').first()
+		instance._bookings_by_day = stats.bookings_by_day(instance.pk)
+
+
+@receiver(post_delete, sender=Event)
+def event_stats_deleted(sender, instance, origin=None, **kwargs):
+	if _deleting_category(origin):
+		return
+	stats.events_changed(removed=[getattr(instance, '_previous_totals', None) or stats.event_totals(instance)])
+	bookings = getattr(instance, '_bookings_by_day', {})
+	DailyBookings.objects.add({key: -count for key, count in bookings.items()})
+
+
+@receiver(post_save, sender=Category)
+def log_category_saved(sender, instance, created, raw=False, **kwargs):
+	if not raw:
+		changes.category_saved(instance, created)
+
+
+@receiver(post_delete, sender=Category)
+def log_category_deleted(sender, instance, **kwargs):
+	changes.category_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Event)
+def log_event_saved(sender, instance, created, raw=False, **kwargs):
+	if not raw:
+		changes.event_saved(instance, created)
+
+
+@receiver(post_delete, sender=Event)
+def log_event_deleted(sender, instance, origin=None, **kwargs):
+	if not _deleting_category(origin):
+		changes.event_deleted(instance.pk)
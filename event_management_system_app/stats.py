@@ -0,0 +1,187 @@
+"""Precomputed per-category statistics for the dashboard.
+
+``CategoryStats`` holds one row per category (events, upcoming events and
+participants) and ``DailyBookings`` one per category and local day with
+bookings. Reads touch only those rows, however many events there are.
+
+The rows are kept up to date in the transaction of every write: event
+saves and deletes through signals, participant increments and booking
+batches in their queryset methods, and imports through
+:func:`events_changed`. Other queryset ``update()`` and ``bulk_create()``
+calls send no signals, so callers must report those changes themselves.
+
+An event stops being upcoming when it starts, without any write. Rows
+therefore count the events starting after their ``as_of`` time, and reads
+discount those that have started since, a range scan of the category
+index bounded by the time since the last reconciliation. :func:`reconcile`
+(the ``reconcile_stats`` command, run periodically) recomputes every row
+from the events and bookings, fixing any drift and moving ``as_of`` on.
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .caching import bump_catalog_version, catalog_etag
+from .models import Booking, Category, CategoryStats, DailyBookings, Event
+from .timeline import as_datetime
+
+# Upcoming counts change as events start, so dashboards built from the
+# rows are only reused within a window of this many seconds.
+WINDOW = 60
+DEFAULT_DAYS = 30
+MAX_DAYS = 366
+
+
+def window_etag(request, *args, **kwargs):
+    tag = catalog_etag(request)
+    return tag and f'{tag}-{int(time.time() // WINDOW)}'
+
+
+def event_totals(event):
+    """The ``(category_id, start_date, participants)`` an event adds to the totals."""
+    # Views may assign form strings.
+    return int(event.category_id), as_datetime(event.start_date), int(event.participants)
+
+
+def events_changed(added=(), removed=()):
+    """Apply events ``added`` to and ``removed`` from the totals, each given
+    as :func:`event_totals` triples. Categories without a row yet, such as
+    ones created by ``bulk_create()``, are reconciled instead."""
+    changes = [(totals, 1) for totals in added] + [(totals, -1) for totals in removed]
+    if not changes:
+        return
+    with transaction.atomic(savepoint=False):
+        category_ids = {category_id for (category_id, _, _), _ in changes}
+        as_of = dict(
+            CategoryStats.objects.select_for_update().filter(pk__in=category_ids).values_list('pk', 'as_of')
+        )
+        deltas = {}
+        for (category_id, start_date, participants), sign in changes:
+            if category_id in as_of:
+                delta = deltas.setdefault(category_id, [0, 0, 0])
+                delta[0] += sign
+                delta[1] += sign if start_date > as_of[category_id] else 0
+                delta[2] += sign * participants
+        deltas = {category_id: delta for category_id, delta in deltas.items() if any(delta)}
+        if deltas:
+            # One statement for the whole batch rather than one per category,
+            # with a branch per distinct delta rather than per category.
+            increments = {}
+            for i, field in enumerate(('events', 'upcoming', 'participants')):
+                by_delta = defaultdict(list)
+                for category_id, delta in deltas.items():
+                    if delta[i]:
+                        by_delta[delta[i]].append(category_id)
+                increments[field] = F(field) + Case(
+                    *(When(pk__in=ids, then=Value(delta)) for delta, ids in by_delta.items()), default=Value(0),
+                )
+            CategoryStats.objects.filter(pk__in=deltas).update(**increments)
+        missing = category_ids - as_of.keys()
+        if missing:
+            reconcile(missing)
+
+
+def category_created(category):
+    CategoryStats.objects.create(category=category, as_of=timezone.now())
+
+
+def bookings_by_day(event_id):
+    """``{(category_id, day): bookings}`` of one event, as counted in ``DailyBookings``."""
+    rows = (
+        Booking.objects.filter(event_id=event_id).annotate(day=TruncDate('created_at'))
+        .values('event__category_id', 'day').annotate(count=Count('pk')).order_by()
+    )
+    return {(row['event__category_id'], row['day']): row['count'] for row in rows}
+
+
+def reconcile(category_ids=None):
+    """Recompute the rows of ``category_ids`` (default: all) from the events
+    and bookings. Returns the number of rows that were missing or wrong."""
+    now = timezone.now()
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+    with transaction.atomic():
+        stored = {row.pk: row for row in CategoryStats.objects.select_for_update().filter(category__in=categories)}
+        totals = categories.annotate(
+            event_count=Count('event'),
+            upcoming_count=Count('event', filter=Q(event__start_date__gt=now)),
+            participant_count=Coalesce(Sum('event__participants'), 0),
+        ).values_list('pk', 'event_count', 'upcoming_count', 'participant_count')
+        created, corrected = [], 0
+        for category_id, events, upcoming, participants in totals:
+            row = stored.get(category_id)
+            if row is None:
+                row = CategoryStats(category_id=category_id)
+                created.append(row)
+            elif (row.events, row.participants) != (events, participants):
+                corrected += 1
+            row.events, row.upcoming, row.participants, row.as_of = events, upcoming, participants, now
+        CategoryStats.objects.bulk_update(stored.values(), ['events', 'upcoming', 'participants', 'as_of'])
+        CategoryStats.objects.bulk_create(created)
+
+        expected = {
+            (row['event__category_id'], row['day']): row['count']
+            for row in Booking.objects.filter(event__category__in=categories).annotate(day=TruncDate('created_at'))
+            .values('event__category_id', 'day').annotate(count=Count('pk')).order_by()
+        }
+        wrong = []
+        for row in DailyBookings.objects.select_for_update().filter(category__in=categories):
+            count = expected.pop((row.category_id, row.day), 0)
+            if row.bookings != count:
+                row.bookings = count
+                wrong.append(row)
+        DailyBookings.objects.bulk_update(wrong, ['bookings'])
+        DailyBookings.objects.bulk_create(
+            DailyBookings(category_id=category_id, day=day, bookings=count)
+            for (category_id, day), count in expected.items()
+        )
+        fixed = len(created) + corrected + len(wrong) + len(expected)
+        if fixed:
+            bump_catalog_version()
+    return fixed
+
+
+def category_totals(now=None):
+    """Every category's ``id``, ``name``, ``events``, ``upcoming`` and
+    ``participants``, in one query."""
+    now = now or timezone.now()
+    started = (
+        Event.objects.filter(category=OuterRef('pk'), start_date__gt=OuterRef('as_of'), start_date__lte=now)
+        .order_by().values('category').annotate(count=Count('pk')).values('count')
+    )
+    rows = CategoryStats.objects.annotate(started=Coalesce(Subquery(started), 0)).order_by('pk').values_list(
+        'pk', 'category__name', 'events', 'upcoming', 'started', 'participants',
+    )
+    return [
+        {'id': pk, 'name': name, 'events': events, 'upcoming': upcoming - started, 'participants': participants}
+        for pk, name, events, upcoming, started, participants in rows
+    ]
+
+
+def bookings_per_day(days=DEFAULT_DAYS, today=None):
+    """Bookings of the last ``days`` local days, oldest first, in total and
+    by category ID; days without bookings included."""
+    today = today or timezone.localdate()
+    first = today - timedelta(days=days - 1)
+    result = [{'day': first + timedelta(days=n), 'bookings': 0, 'by_category': {}} for n in range(days)]
+    rows = DailyBookings.objects.filter(day__gte=first, day__lte=today, bookings__gt=0)
+    for day, category_id, bookings in rows.values_list('day', 'category_id', 'bookings'):
+        entry = result[(day - first).days]
+        entry['bookings'] += bookings
+        entry['by_category'][str(category_id)] = bookings
+    return result
+
+
+def dashboard(days=DEFAULT_DAYS):
+    now = timezone.now()
+    return {
+        'as_of': now,
+        'categories': category_totals(now),
+        'bookings_per_day': bookings_per_day(days, timezone.localdate(now)),
+    }
@@ -1,3 +1,1004 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from . import api, async_api, changes, idempotency, stats
+from .bulk import export_events, import_events
+from .metrics import CACHE_REQUESTS, REQUEST_QUERIES, REQUEST_SECONDS
+from .models import Booking, CatalogChange, Category, CategoryStats, Event, IdempotencyKey
+from .profiling import ProfilingMiddleware
+from .timeline import time_range
+
+
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        # Cached catalog reads would otherwise leak between tests.
+        cache.clear()
+
+
+def make_event(category, **kwargs):
+    start = kwargs.pop('start_date', timezone.now() + timedelta(days=1))
+    return Event.objects.create(
+        name=kwargs.pop('name', 'Event'),
+        category=category,
+        start_date=start,
+        end_date=kwargs.pop('end_date', start + timedelta(hours=2)),
+        **kwargs
+    )
+
+
+class CatalogApiTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.music = Category.objects.create(name='Music')
+        cls.comedy = Category.objects.create(name='Comedy')
+        cls.gig = make_event(cls.music, name='Gig', location='Hall', organizer='Band')
+        make_event(cls.comedy, name='Stand-up')
+
+    def test_categories(self):
+        response = self.client.get(reverse('api_categories'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'categories': [
+            {'id': self.music.id, 'name': 'Music'},
+            {'id': self.comedy.id, 'name': 'Comedy'},
+        ], 'next': None, 'prev': None})
+
+    def test_category_events_field_selection(self):
+        url = reverse('api_category_events', args=[self.music.id])
+        response = self.client.get(url, {'fields': 'id,name,category'})
+        self.assertEqual(response.json(), {
+            'category': {'id': self.music.id, 'name': 'Music'},
+            'events': [{'id': self.gig.id, 'name': 'Gig', 'category': 'Music'}],
+            'next': None,
+            'prev': None,
+        })
+
+    def test_compact_serialization(self):
+        response = self.client.get(reverse('api_categories'))
+        self.assertNotIn(b', ', response.content)
+        self.assertNotIn(b': ', response.content)
+
+    def test_event_detail(self):
+        response = self.client.get(reverse('api_event', args=[self.gig.id]))
+        event = response.json()['event']
+        self.assertEqual(event['location'], 'Hall')
+        self.assertEqual(event['category_id'], self.music.id)
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('api_categories'), {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'error')
+
+    def test_missing_objects(self):
+        self.assertEqual(self.client.get(reverse('api_event', args=[0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_category_events', args=[0])).status_code, 404)
+
+    def test_read_only(self):
+        self.assertEqual(self.client.post(reverse('api_categories')).status_code, 405)
+
+
+class PaginationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Music')
+        start = timezone.now()
+        # Several events share a start date, so the id tiebreaker matters.
+        cls.events = [
+            make_event(cls.category, name=f'Event {i}', start_date=start + timedelta(days=i // 3))
+            for i in range(10)
+        ]
+
+    def get_page(self, **params):
+        url = reverse('api_category_events', args=[self.category.id])
+        return self.client.get(url, {'fields': 'id', 'limit': 4, **params}).json()
+
+    def test_walk_forward_and_back(self):
+        pages, page = [], self.get_page()
+        while True:
+            pages.append([event['id'] for event in page['events']])
+            if not page['next']:
+                break
+            page = self.get_page(after=page['next'])
+        self.assertEqual(sum(pages, []), [event.id for event in self.events])
+        self.assertEqual([len(ids) for ids in pages], [4, 4, 2])
+
+        back = self.get_page(before=page['prev'])
+        self.assertEqual([event['id'] for event in back['events']], pages[1])
+        first = self.get_page(before=back['prev'])
+        self.assertEqual([event['id'] for event in first['events']], pages[0])
+        self.assertIsNone(first['prev'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(reverse('api_categories'), {'after': 'nonsense'}).status_code, 400)
+        url = reverse('category_events', args=[self.category.id])
+        self.assertEqual(self.client.get(url, {'after': 'nonsense'}).status_code, 404)
+
+    def test_html_listing(self):
+        url = reverse('category_events', args=[self.category.id])
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['events'].items), 10)
+        self.assertNotContains(response, 'Next &raquo;')
+
+
+class CatalogCacheTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Music')
+        cls.event = make_event(cls.category, name='Gig')
+
+    def test_not_modified(self):
+        url = reverse('api_categories')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_no_last_modified(self):
+        # Dates have a resolution of a second; a write within it would be missed.
+        url = reverse('api_categories')
+        self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Comedy')
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertContains(response, 'Comedy')
+
+    def test_writes_invalidate(self):
+        url = reverse('category_events', args=[self.category.id])
+        etag = self.client.get(url)['ETag']
+        self.assertContains(self.client.get(url), 'Gig')
+        writes = [
+            lambda: self.client.post(reverse('update_event', args=[self.event.id]), {
+                'name': 'Renamed', 'category': self.category.id, 'priority': 1,
+                'start_date': '2030-01-01T10:00', 'end_date': '2030-01-01T12:00',
+                'description': '', 'location': '', 'organizer': '',
+            }),
+            lambda: self.client.post(reverse('increment_participants', args=[self.event.id])),
+            lambda: self.client.post(reverse('create_category'), {'name': 'Comedy'}),
+        ]
+        for write in writes:
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+        self.assertContains(response, 'Renamed')
+
+    def test_messages_are_not_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('delete_category', args=[self.category.id]), follow=True)
+        self.assertContains(response, 'You cannot delete this category')
+        self.assertFalse(response.has_header('ETag'))
+
+
+class SearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.music = Category.objects.create(name='Music')
+        cls.jazz_night = make_event(cls.music, name='Jazz Night', description='Live music')
+        cls.blues = make_event(cls.music, name='Blues Evening', description='Jazz and blues standards')
+        cls.theatre = make_event(cls.music, name='Hamlet', location='Jazz Club Theatre')
+        make_event(cls.music, name='Comedy Hour')
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('api_search'), {'q': q, 'fields': 'id,name', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_name_matches_rank_first(self):
+        names = [event['name'] for event in self.search('jazz')['events']]
+        self.assertEqual(names[0], 'Jazz Night')
+        self.assertCountEqual(names, ['Jazz Night', 'Blues Evening', 'Hamlet'])
+
+    def test_every_term_matches_as_a_prefix(self):
+        self.assertEqual(self.search('jaz ni')['events'], [{'id': self.jazz_night.id, 'name': 'Jazz Night'}])
+        self.assertEqual(self.search('jazz comedy')['events'], [])
+
+    def test_index_follows_writes(self):
+        Event.objects.filter(pk=self.blues.pk).update(name='Soul Evening', description='Soul standards')
+        make_event(self.music, name='Jazz Brunch')
+        self.theatre.delete()
+        names = [event['name'] for event in self.search('jazz')['events']]
+        self.assertCountEqual(names, ['Jazz Night', 'Jazz Brunch'])
+
+    def test_paging(self):
+        first = self.search('jazz', limit=2)
+        self.assertEqual(len(first['events']), 2)
+        self.assertIsNone(first['prev'])
+        second = self.search('jazz', limit=2, after=first['next'])
+        self.assertEqual(len(second['events']), 1)
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.search('jazz', limit=2, before=second['prev'])['events'], first['events'])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('api_search')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_search'), {'q': 'jazz', 'after': '!'}).status_code, 400)
+
+    def test_query_text_is_not_search_syntax(self):
+        self.assertEqual(self.search('"jazz*" (^')['events'][0]['name'], 'Jazz Night')
+
+
+# A Wednesday noon, in the (UTC) project time zone.
+NOW = datetime(2030, 1, 2, 12, tzinfo=dt_timezone.utc)
+
+
+@mock.patch('django.utils.timezone.now', lambda: NOW)
+class WhatsOnTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.music = Category.objects.create(name='Music')
+        cls.ongoing = make_event(cls.music, name='Exhibition', start_date=NOW - timedelta(days=3), end_date=NOW + timedelta(days=3))
+        cls.tonight = make_event(cls.music, name='Gig', start_date=NOW + timedelta(hours=8))
+        cls.saturday = make_event(cls.music, name='Market', start_date=NOW + timedelta(days=3))
+        make_event(cls.music, name='Matinee', start_date=NOW - timedelta(hours=4))
+
+    def whats_on(self, when, **params):
+        response = self.client.get(reverse('api_whats_on'), {'when': when, 'fields': 'id,name', **params})
+        self.assertEqual(response.status_code, 200)
+        return [event['name'] for event in response.json()['events']]
+
+    def test_ranges(self):
+        self.assertEqual(time_range('tonight'), (NOW + timedelta(hours=6), NOW + timedelta(hours=12)))
+        self.assertEqual(time_range('weekend'), (NOW + timedelta(days=2, hours=12), NOW + timedelta(days=4, hours=12)))
+        sunday = NOW + timedelta(days=4)
+        self.assertEqual(time_range('weekend', now=sunday), (sunday, sunday + timedelta(hours=12)))
+        self.assertEqual(time_range('days', days=2), (NOW, NOW + timedelta(days=2)))
+
+    def test_whats_on(self):
+        self.assertEqual(self.whats_on('today'), ['Exhibition', 'Gig'])
+        self.assertEqual(self.whats_on('tonight'), ['Exhibition', 'Gig'])
+        self.assertEqual(self.whats_on('ongoing'), ['Exhibition'])
+        self.assertEqual(self.whats_on('weekend'), ['Exhibition', 'Market'])
+        self.assertEqual(self.whats_on('days', days=1), ['Exhibition', 'Gig'])
+        self.assertEqual(self.whats_on('days', days=7, limit=2), ['Exhibition', 'Gig'])
+
+    def test_bookings_do_not_reload_buckets(self):
+        self.whats_on('days', days=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            Event.objects.increment_participants(self.tonight.id)
+        with self.assertNumQueries(0):
+            self.whats_on('days', days=7)
+
+    def test_writes_update_only_their_days(self):
+        self.assertEqual(self.whats_on('days', days=7), ['Exhibition', 'Gig', 'Market'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.saturday.start_date = NOW + timedelta(days=1)
+            self.saturday.end_date = NOW + timedelta(days=1, hours=2)
+            self.saturday.save()
+            make_event(self.music, name='Late Show', start_date=NOW + timedelta(hours=10))
+        self.assertEqual(self.whats_on('today'), ['Exhibition', 'Gig', 'Late Show'])
+        self.assertEqual(self.whats_on('weekend'), ['Exhibition'])
+        self.assertEqual(self.whats_on('days', days=2), ['Exhibition', 'Gig', 'Late Show', 'Market'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tonight.delete()
+            self.music.name = 'Live Music'
+            self.music.save()
+        response = self.client.get(reverse('api_whats_on'), {'when': 'today', 'fields': 'name,category'})
+        self.assertEqual(response.json()['events'], [
+            {'name': 'Exhibition', 'category': 'Live Music'},
+            {'name': 'Late Show', 'category': 'Live Music'},
+        ])
+
+    def test_bad_requests(self):
+        url = reverse('api_whats_on')
+        for params in ({'when': 'someday'}, {'when': 'days', 'days': '0'}, {'when': 'days', 'days': 'x'}, {'fields': 'participants'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class IncrementParticipantsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Music')
+
+    def post(self, event_id):
+        return self.client.post(reverse('increment_participants', args=[event_id]))
+
+    def test_increment(self):
+        event = make_event(self.category, participants=4)
+        response = self.post(event.id)
+        self.assertEqual(response.json(), {'status': 'success', 'participants': 5})
+        event.refresh_from_db()
+        self.assertEqual(event.participants, 5)
+
+    def test_capacity(self):
+        event = make_event(self.category, participants=1, capacity=2)
+        self.assertEqual(self.post(event.id).json()['participants'], 2)
+        response = self.post(event.id)
+        self.assertEqual(response.status_code, 409)
+        event.refresh_from_db()
+        self.assertEqual(event.participants, 2)
+
+    def test_unknown_event(self):
+        self.assertEqual(self.post(0).status_code, 404)
+
+    def test_update_event_leaves_participants_alone(self):
+        # A booking between the form view's read and its save must survive.
+        event = make_event(self.category, participants=4)
+        start = timezone.localtime(event.start_date)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('update_event', args=[event.id]), {
+                'name': 'Renamed', 'category': str(self.category.id), 'priority': '2',
+                'start_date': start.strftime('%Y-%m-%d %H:%M'),
+                'end_date': (start + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M'),
+                'description': '', 'location': 'Hall', 'organizer': 'Ann',
+            })
+        [update] = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "event_management')
+                    and 'SET "name"' in query['sql']]
+        self.assertNotIn('"participants"', update)
+        event.refresh_from_db()
+        self.assertEqual((event.name, event.participants), ('Renamed', 4))
+
+    def test_idempotency_key(self):
+        event = make_event(self.category, participants=4)
+        url = reverse('increment_participants', args=[event.id])
+        first = self.client.post(url, headers={'Idempotency-Key': '7:1:a'})
+        with self.assertNumQueries(1):  # Reading the stored result.
+            repeat = self.client.post(url, headers={'Idempotency-Key': '7:1:a'})
+        self.assertEqual(repeat.json(), first.json())
+        self.assertEqual(repeat['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.client.post(url, headers={'Idempotency-Key': '7:1:b'}).json()['participants'], 6)
+        event.refresh_from_db()
+        self.assertEqual(event.participants, 6)
+
+    def test_idempotency_key_in_progress(self):
+        event = make_event(self.category)
+        idempotency.claim(f'increment_participants:{event.id}', ['7:1:a'])
+        response = self.client.post(
+            reverse('increment_participants', args=[event.id]), headers={'Idempotency-Key': '7:1:a'},
+        )
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '1'))
+        event.refresh_from_db()
+        self.assertEqual(event.participants, 0)
+
+    def test_idempotency_claims(self):
+        scope = 'increment_participants:1'
+        self.assertEqual(idempotency.claim(scope, ['a', 'b']), {})
+        bulk_create = IdempotencyKey.objects.bulk_create
+
+        def racing_bulk_create(rows, **kwargs):
+            # Another request inserts 'c' between the read and the insert.
+            IdempotencyKey.objects.create(scope=scope, key='c', token='other', expires_at=rows[0].expires_at)
+            return bulk_create(rows, **kwargs)
+        with mock.patch.object(IdempotencyKey.objects, 'bulk_create', racing_bulk_create):
+            self.assertEqual(idempotency.claim(scope, ['a', 'c', 'd']), {'a': 'in-progress', 'c': 'in-progress'})
+        idempotency.remember(scope, {'a': ({'status': 'success'}, 200)})
+        idempotency.release(scope, ['b'])
+        self.assertEqual(idempotency.claim(scope, ['a', 'b']), {'a': [{'status': 'success'}, 200]})
+
+        # A claim whose request died expires, and is then free again.
+        later = timezone.now() + timedelta(seconds=idempotency.CLAIM_TIMEOUT + 1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(idempotency.claim(scope, ['a', 'b', 'c']), {'a': [{'status': 'success'}, 200]})
+            self.assertEqual(idempotency.claim(scope, ['b']), {'b': 'in-progress'})
+            out = io.StringIO()
+            call_command('prune_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1 key(s)', out.getvalue())  # 'd'
+
+    def test_invalid_idempotency_key(self):
+        event = make_event(self.category)
+        response = self.client.post(
+            reverse('increment_participants', args=[event.id]), headers={'Idempotency-Key': 'x' * 201},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_participants_column_written(self):
+        event = make_event(self.category, name='Original')
+        Event.objects.filter(pk=event.id).update(name='Renamed')
+        # A stale in-memory copy must not be written back.
+        Event.objects.increment_participants(event.id)
+        event.refresh_from_db()
+        self.assertEqual(event.name, 'Renamed')
+
+
+class IncrementParticipantsConcurrencyTests(TransactionTestCase):
+    BOOKINGS = 2000
+    WORKERS = 16
+
+    def book(self, event_id):
+        try:
+            return Event.objects.increment_participants(event_id)
+        finally:
+            connection.close()
+
+    def run_bookings(self, event):
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            return list(pool.map(self.book, [event.id] * self.BOOKINGS))
+
+    def test_parallel_bookings_are_not_lost(self):
+        event = make_event(Category.objects.create(name='Music'))
+        results = self.run_bookings(event)
+        event.refresh_from_db()
+        self.assertEqual(event.participants, self.BOOKINGS)
+        # Every booking saw its own, distinct participant number.
+        self.assertEqual(sorted(results), list(range(1, self.BOOKINGS + 1)))
+
+    def test_parallel_bookings_respect_capacity(self):
+        event = make_event(Category.objects.create(name='Music'), capacity=500)
+        results = self.run_bookings(event)
+        event.refresh_from_db()
+        self.assertEqual(event.participants, 500)
+        self.assertEqual(sum(result is not None for result in results), 500)
+
+
+SCHEDULE_CSV = '''name,category,start_date,end_date,priority,location,capacity
+Jazz Night,Music,2030-01-01T20:00:00+00:00,2030-01-01T23:00:00+00:00,2,Hall,
+Hamlet,Theatre,2030-01-02T19:00,2030-01-02T22:00,,,50
+Broken,Music,not a date,2030-01-02T22:00,,,
+Backwards,Music,2030-01-03T19:00,2030-01-02T22:00,,,
+Ghost,,2030-01-03T19:00,2030-01-03T22:00,,,
+'''
+
+
+class BulkImportExportTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.music = Category.objects.create(name='Music')
+
+    def test_csv_import_skips_invalid_rows(self):
+        result = import_events(io.StringIO(SCHEDULE_CSV), 'csv', create_categories=True)
+        self.assertEqual((result.created, result.categories_created, result.error_count), (2, 1, 3))
+        self.assertEqual([line for line, _ in result.errors], [4, 5, 6])
+        self.assertIn('start_date', result.errors[0][1])
+        jazz, hamlet = Event.objects.order_by('start_date')
+        self.assertEqual((jazz.category, jazz.priority, jazz.location, jazz.capacity), (self.music, 2, 'Hall', None))
+        self.assertEqual((hamlet.category.name, hamlet.priority, hamlet.capacity), ('Theatre', 1, 50))
+        self.assertEqual(hamlet.start_date, datetime(2030, 1, 2, 19, tzinfo=dt_timezone.utc))
+
+    def test_unknown_categories_and_dry_run(self):
+        result = import_events(io.StringIO(SCHEDULE_CSV), 'csv')
+        self.assertEqual((result.created, result.error_count), (1, 4))
+        self.assertIn("unknown category 'Theatre'", dict(result.errors)[3])
+        result = import_events(io.StringIO(SCHEDULE_CSV), 'csv', create_categories=True, dry_run=True)
+        self.assertEqual((result.created, result.categories_created), (2, 1))
+        self.assertEqual(Event.objects.count(), 1)
+        self.assertFalse(Category.objects.filter(name='Theatre').exists())
+
+    def test_chunks_share_category_lookups_and_inserts(self):
+        lines = [json.dumps({'name': f'Gig {i}', 'category': 'Music', 'start_date': '2030-01-01T20:00',
+                             'end_date': '2030-01-01T22:00'}) for i in range(10)]
+        stream = io.StringIO('\n'.join(lines[:5] + ['[1, 2]', ''] + lines[5:]))
+        # One category lookup; per chunk of four, a savepoint, one INSERT,
+        # the statistics row read and its UPDATE, the change log INSERT and
+        # the release.
+        with self.assertNumQueries(1 + 3 * 6):
+            result = import_events(stream, 'jsonl', chunk_size=4)
+        self.assertEqual((result.created, result.errors), (10, [(6, 'not a JSON object')]))
+
+    def test_import_invalidates_cached_reads(self):
+        url = reverse('api_category_events', args=[self.music.id])
+        self.assertEqual(self.client.get(url).json()['events'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            import_events(io.StringIO(SCHEDULE_CSV), 'csv')
+        self.assertEqual([event['name'] for event in self.client.get(url).json()['events']], ['Jazz Night'])
+
+    def test_export_round_trip(self):
+        import_events(io.StringIO(SCHEDULE_CSV), 'csv', create_categories=True)
+        for format in ('csv', 'jsonl'):
+            with self.subTest(format=format):
+                exported = ''.join(export_events(format=format, chunk_size=1))
+                Event.objects.all().delete()
+                result = import_events(io.StringIO(exported), format)
+                self.assertEqual((result.created, result.error_count), (2, 0))
+                self.assertEqual(
+                    list(Event.objects.order_by('start_date').values_list('name', 'category__name', 'capacity')),
+                    [('Jazz Night', 'Music', None), ('Hamlet', 'Theatre', 50)],
+                )
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'season.csv')
+            with open(path, 'w') as schedule:
+                schedule.write(SCHEDULE_CSV)
+            out, err = io.StringIO(), io.StringIO()
+            call_command('import_events', path, '--create-categories', stdout=out, stderr=err)
+            self.assertIn('Imported 2 events (1 new categories), skipped 3 invalid rows.', out.getvalue())
+            self.assertIn('line 4: start_date', err.getvalue())
+            out = io.StringIO()
+            call_command('export_events', '--format', 'jsonl', '--category', str(self.music.id), stdout=out)
+            self.assertEqual([json.loads(line)['name'] for line in out.getvalue().splitlines()], ['Jazz Night'])
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10)
+    def test_admin_upload_and_export(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        upload = SimpleUploadedFile('season.csv', SCHEDULE_CSV.encode())
+        response = self.client.post(reverse('admin:event_import'), {'file': upload, 'create_categories': 'on'}, follow=True)
+        self.assertContains(response, 'Imported 2 events (1 new categories).')
+        self.assertContains(response, 'Skipped 3 invalid rows')
+        response = self.client.get(reverse('admin:event_export'))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="events.csv"')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,category,start_date,end_date,priority,description,location,organizer,capacity,participants')
+        self.assertEqual(len(lines), 3)
+
+    def test_admin_import_requires_staff(self):
+        self.client.force_login(User.objects.create_user('visitor', password='password'))
+        response = self.client.get(reverse('admin:event_import'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(response.url.startswith(reverse('admin:event_import')))
+
+
+class CreateBookingsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Music')
+        cls.gig = make_event(category, participants=3)
+        cls.small = make_event(category, capacity=1)
+
+    def post(self, bookings):
+        return self.client.post(
+            reverse('create_bookings'), json.dumps({'bookings': bookings}),
+            content_type='application/json',
+        )
+
+    def booking(self, event_id, user_id=1):
+        return {'event_id': event_id, 'user_id': user_id, 'name': 'Ann', 'email': 'ann@example.com'}
+
+    def test_batch(self):
+        response = self.post([
+            self.booking(self.gig.id, 1),
+            self.booking(self.small.id, 2),
+            self.booking(self.gig.id, 3),
+            self.booking(self.small.id, 4),
+            self.booking(0, 5),
+        ])
+        self.assertEqual(response.json()['results'], [
+            {'status': 'success', 'participants': 4},
+            {'status': 'success', 'participants': 1},
+            {'status': 'success', 'participants': 5},
+            {'status': 'error', 'message': 'Event is full'},
+            {'status': 'error', 'message': 'Event not found'},
+        ])
+        self.assertEqual(
+            list(Booking.objects.order_by('user_id').values_list('user_id', 'participant_number')),
+            [(1, 4), (2, 1), (3, 5)],
+        )
+        self.gig.refresh_from_db()
+        self.assertEqual(self.gig.participants, 5)
+
+    def test_batch_shares_writes(self):
+        bookings = [self.booking(self.gig.id, user_id) for user_id in range(100)]
+        with CaptureQueriesContext(connection) as ctx:
+            self.post(bookings)
+        statements = [' '.join(query['sql'].split()[:3]) for query in ctx.captured_queries]
+        self.assertEqual(statements.count('UPDATE "event_management_system_app_event" SET'), 1)
+        self.assertEqual(statements.count('INSERT INTO "event_management_system_app_booking"'), 1)
+        self.assertEqual(statements.count('UPDATE "event_management_system_app_categorystats" SET'), 1)
+        self.assertEqual(Booking.objects.count(), 100)
+
+    def test_idempotency_keys(self):
+        keyed = [{**self.booking(self.gig.id, 1), 'key': '1:a'}, {**self.booking(self.small.id, 2), 'key': '2:a'}]
+        first = self.post(keyed + [self.booking(self.gig.id, 3)]).json()['results']
+        with self.assertNumQueries(1):
+            repeat = self.post(keyed).json()['results']
+        self.assertEqual(repeat, first[:2])
+        # A repeat within one batch shares the first booking's write.
+        results = self.post([{**self.booking(self.gig.id, 4), 'key': '4:a'}] * 2).json()['results']
+        self.assertEqual(results, [{'status': 'success', 'participants': 6}] * 2)
+        self.assertEqual(Booking.objects.count(), 4)
+
+    def test_idempotency_key_in_progress(self):
+        idempotency.claim('bookings', ['1:a'])
+        results = self.post([
+            {**self.booking(self.gig.id, 1), 'key': '1:a'}, {**self.booking(self.gig.id, 2), 'key': '2:a'},
+        ]).json()['results']
+        self.assertEqual(results, [
+            {'status': 'pending', 'message': 'Booking in progress, retry shortly'},
+            {'status': 'success', 'participants': 4},
+        ])
+
+    def test_invalid(self):
+        self.assertEqual(self.post([{'event_id': self.gig.id}]).status_code, 400)
+        self.assertEqual(self.post([{**self.booking(self.gig.id), 'key': 5}]).status_code, 400)
+        self.assertEqual(self.client.get(reverse('create_bookings')).status_code, 400)
+
+
+class AsyncApiTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.music = Category.objects.create(name='Music')
+        cls.events = [make_event(cls.music, name=f'Jazz Night {n}', participants=n) for n in range(3)]
+
+    async def test_reads_match_the_sync_views(self):
+        event_id = self.events[0].id
+        for name, path, args in (
+            ('api_categories', '/api/categories/?limit=1', ()),
+            ('api_category_events', '/api/categories/1/events/?fields=id,name&limit=2', (self.music.id,)),
+            ('api_category_events', '/api/categories/0/events/', (0,)),
+            ('api_event', '/api/events/1/?fields=name,category,participants', (event_id,)),
+            ('api_event', '/api/events/0/', (0,)),
+            ('api_search', '/api/search/?q=jazz&limit=2', ()),
+            ('api_search', '/api/search/?q=jazz&fields=nope', ()),
+        ):
+            with self.subTest(view=name, path=path):
+                expected = await sync_to_async(getattr(api, name))(RequestFactory().get(path), *args)
+                # Both views would otherwise share a cached response.
+                cache.clear()
+                response = await getattr(async_api, name)(AsyncRequestFactory().get(path), *args)
+                cache.clear()
+                self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content))
+
+    async def test_increment_participants(self):
+        event = self.events[0]
+        post = AsyncRequestFactory().post
+        first = await async_api.increment_participants(post('/', headers={'Idempotency-Key': '7:1:a'}), event.id)
+        repeat = await async_api.increment_participants(post('/', headers={'Idempotency-Key': '7:1:a'}), event.id)
+        self.assertEqual(json.loads(first.content), {'status': 'success', 'participants': 1})
+        self.assertEqual((repeat.content, repeat['Idempotent-Replayed']), (first.content, 'true'))
+        self.assertEqual((await async_api.increment_participants(post('/'), 0)).status_code, 404)
+        self.assertEqual((await Event.objects.aget(pk=event.id)).participants, 1)
+
+    async def test_conditional_gets_read_the_version_asynchronously(self):
+        request = AsyncRequestFactory().get('/api/categories/')
+        with mock.patch('event_management_system_app.caching.catalog_version', side_effect=AssertionError):
+            response = await async_api.api_categories(request)
+            self.assertEqual(response.status_code, 200)
+            request = AsyncRequestFactory().get('/api/categories/', headers={'If-None-Match': response['ETag']})
+            self.assertEqual((await async_api.api_categories(request)).status_code, 304)
+        self.assertEqual(response['ETag'], api.api_categories(RequestFactory().get('/api/categories/'))['ETag'])
+
+    async def test_metrics_middleware_times_async_requests(self):
+        timing = REQUEST_SECONDS.labels('api_categories')
+        before = sum(timing.counts)
+        response = await self.async_client.get(reverse('api_categories'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(timing.counts), before + 1)
+
+
+class StatsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.music = Category.objects.create(name='Music')
+        cls.theatre = Category.objects.create(name='Theatre')
+
+    def totals(self, now=None):
+        return {row['name']: (row['events'], row['upcoming'], row['participants'])
+                for row in stats.category_totals(now)}
+
+    def assertConsistent(self):
+        # Nothing for the reconciliation to fix.
+        self.assertEqual(stats.reconcile(), 0)
+
+    def test_follows_event_writes(self):
+        gig = make_event(self.music, participants=3)
+        make_event(self.music, start_date=timezone.now() - timedelta(days=1), participants=2)
+        self.assertEqual(self.totals(), {'Music': (2, 1, 5), 'Theatre': (0, 0, 0)})
+
+        gig.category = self.theatre
+        gig.participants = 4
+        gig.save()
+        self.assertEqual(self.totals(), {'Music': (1, 0, 2), 'Theatre': (1, 1, 4)})
+        Event.objects.increment_participants(gig.id, by=2)
+        self.assertEqual(self.totals()['Theatre'], (1, 1, 6))
+        gig.delete()  # The instance's participant count is stale.
+        self.assertEqual(self.totals()['Theatre'], (0, 0, 0))
+        self.assertConsistent()
+
+    def test_follows_event_form_views(self):
+        # The views assign the posted strings as they are.
+        start = timezone.localtime() + timedelta(days=1)
+        form = {
+            'name': 'Gig', 'category': str(self.music.id), 'priority': '1',
+            'start_date': start.strftime('%Y-%m-%d %H:%M'),
+            'end_date': (start + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M'),
+            'description': '', 'location': 'Hall', 'organizer': 'Ann',
+        }
+        self.client.post(reverse('create_event'), form)
+        gig = Event.objects.get(name='Gig')
+        self.assertEqual(self.totals(), {'Music': (1, 1, 0), 'Theatre': (0, 0, 0)})
+
+        Event.objects.increment_participants(gig.id, by=2)
+        self.client.post(reverse('update_event', args=[gig.id]), {**form, 'category': str(self.theatre.id)})
+        self.assertEqual(self.totals(), {'Music': (0, 0, 0), 'Theatre': (1, 1, 2)})
+        self.assertConsistent()
+
+    def test_events_stop_being_upcoming_as_they_start(self):
+        make_event(self.music, start_date=timezone.now() + timedelta(hours=1))
+        self.assertEqual(self.totals()['Music'], (1, 1, 0))
+        self.assertEqual(self.totals(timezone.now() + timedelta(hours=2))['Music'], (1, 0, 0))
+
+    def test_bookings_per_day(self):
+        gig = make_event(self.music)
+        other = make_event(self.theatre)
+        self.client.post(reverse('create_bookings'), json.dumps({'bookings': [
+            {'event_id': event.id, 'user_id': 1, 'name': 'Ann', 'email': 'ann@example.com'}
+            for event in (gig, gig, other)
+        ]}), content_type='application/json')
+        today = stats.bookings_per_day(7)[-1]
+        self.assertEqual(today, {
+            'day': timezone.localdate(), 'bookings': 3,
+            'by_category': {str(self.music.id): 2, str(self.theatre.id): 1},
+        })
+        self.assertEqual(self.totals()['Music'], (1, 1, 2))
+        self.assertConsistent()
+
+        gig.delete()
+        self.assertEqual(stats.bookings_per_day(7)[-1]['bookings'], 1)
+        self.assertConsistent()
+
+    def test_imports_and_category_deletes(self):
+        # Opera is created by the import, without a statistics row.
+        import_events(io.StringIO(SCHEDULE_CSV.replace('Theatre', 'Opera')), 'csv', create_categories=True)
+        self.assertEqual(self.totals(), {'Music': (1, 1, 0), 'Theatre': (0, 0, 0), 'Opera': (1, 1, 0)})
+        self.assertConsistent()
+        Category.objects.filter(name='Opera').delete()
+        self.music.delete()
+        self.assertEqual(self.totals(), {'Theatre': (0, 0, 0)})
+        self.assertConsistent()
+
+    def test_batches_are_applied_in_one_statement(self):
+        now = timezone.now()
+        later, earlier = now + timedelta(days=1), now - timedelta(days=1)
+        jazz = Category.objects.create(name='Jazz')
+        added = [(self.music.id, later, 2), (self.music.id, earlier, 3), (self.theatre.id, later, 2), (jazz.id, later, 7)]
+        with self.assertNumQueries(2):  # Lock the rows, then update them.
+            stats.events_changed(added=added, removed=[(jazz.id, later, 7)])
+        self.assertEqual(self.totals(), {'Music': (2, 1, 5), 'Theatre': (1, 1, 2), 'Jazz': (0, 0, 0)})
+
+    def test_reconcile_fixes_drift(self):
+        make_event(self.music, participants=5)
+        CategoryStats.objects.filter(pk=self.music.id).update(events=0, participants=0)
+        CategoryStats.objects.filter(pk=self.theatre.id).delete()
+        out = io.StringIO()
+        call_command('reconcile_stats', stdout=out)
+        self.assertIn('2 row(s)', out.getvalue())
+        self.assertEqual(self.totals(), {'Music': (1, 1, 5), 'Theatre': (0, 0, 0)})
+
+    def test_api(self):
+        make_event(self.music, participants=3)
+        response = self.client.get(reverse('api_stats'), {'days': 3})
+        data = response.json()
+        self.assertEqual(data['categories'][0], {
+            'id': self.music.id, 'name': 'Music', 'events': 1, 'upcoming': 1, 'participants': 3,
+        })
+        self.assertEqual([entry['bookings'] for entry in data['bookings_per_day']], [0, 0, 0])
+        self.assertEqual(self.client.get(reverse('api_stats'), {'days': 0}).status_code, 400)
+        self.assertContains(self.client.get(reverse('event_chart')), '<td>Music</td>')
+
+
+class ChangeFeedTests(CatalogTestCase):
+    def changes(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        return self.client.get(reverse('api_changes'), params)
+
+    def test_every_write_is_logged_in_order(self):
+        start = self.changes().json()['version']
+        self.client.post(reverse('create_category'), {'name': 'Comedy'})
+        category = Category.objects.get(name='Comedy')
+        form = {
+            'name': 'Open Mic', 'category': category.id, 'priority': 1, 'start_date': '2030-01-01T20:00',
+            'end_date': '2030-01-01T22:00', 'description': '', 'location': 'Cellar', 'organizer': '',
+        }
+        self.client.post(reverse('create_event'), form)
+        event = Event.objects.get(name='Open Mic')
+        self.client.post(reverse('update_event', args=[event.id]), {**form, 'name': 'Late Mic'})
+        self.client.post(reverse('increment_participants', args=[event.id]))
+        self.client.post(reverse('delete_event', args=[event.id]))
+        self.client.post(reverse('delete_category', args=[category.id]))
+
+        data = self.changes(start).json()
+        self.assertEqual([(c['kind'], c['action'], c['id']) for c in data['changes']], [
+            ('category', 'created', category.id),
+            ('event', 'created', event.id),
+            ('event', 'updated', event.id),
+            ('event', 'participants', event.id),
+            ('event', 'deleted', event.id),
+            ('category', 'deleted', category.id),
+        ])
+        created = data['changes'][1]['data']
+        self.assertEqual((created['name'], created['category'], created['start_date']),
+                         ('Open Mic', 'Comedy', '2030-01-01T20:00:00Z'))
+        self.assertEqual(data['changes'][2]['data']['name'], 'Late Mic')
+        self.assertEqual(data['changes'][3]['data'], {'participants': 1})
+        self.assertEqual((data['version'], data['more']), (data['changes'][-1]['version'], False))
+
+    def test_paging_and_waiting(self):
+        start = self.changes().json()['version']
+        music = Category.objects.create(name='Music')
+        make_event(music)
+        first = self.changes(start, limit=1).json()
+        self.assertEqual((len(first['changes']), first['more']), (1, True))
+        second = self.changes(first['version'], limit=1).json()
+        self.assertEqual((second['changes'][0]['kind'], second['more']), ('event', False))
+        with mock.patch('event_management_system_app.changes.POLL_INTERVAL', 0.01):
+            started = time.monotonic()
+            waited = self.changes(second['version'], wait=1).json()
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+        self.assertEqual((waited['version'], waited['changes']), (second['version'], []))
+
+    async def test_waiting_polls_share_the_event_loop(self):
+        # Under ASGI a long poll waits on the event loop rather than on a thread.
+        request = AsyncRequestFactory().get(reverse('api_changes'), {'since': await changes.acurrent_version(), 'wait': 1})
+        with mock.patch('event_management_system_app.changes.POLL_INTERVAL', 0.01):
+            started = time.monotonic()
+            responses = await asyncio.gather(*(changes.api_changes(request) for _ in range(3)))
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual([json.loads(response.content)['changes'] for response in responses], [[], [], []])
+
+    def test_bulk_imports_are_logged(self):
+        Category.objects.create(name='Theatre')
+        start = self.changes().json()['version']
+        import_events(io.StringIO(SCHEDULE_CSV), 'csv', create_categories=True)
+        logged = self.changes(start).json()['changes']
+        # Only the new category; the changes come before its events'.
+        music = Category.objects.get(name='Music')
+        self.assertEqual([(c['kind'], c['action'], c['data']['name']) for c in logged], [
+            ('category', 'created', 'Music'), ('event', 'created', 'Jazz Night'), ('event', 'created', 'Hamlet'),
+        ])
+        self.assertEqual((logged[0]['id'], logged[0]['data']), (music.id, {'id': music.id, 'name': 'Music'}))
+        self.assertEqual([c['data']['category'] for c in logged[1:]], ['Music', 'Theatre'])
+
+    def test_pruned_versions_start_over(self):
+        music = Category.objects.create(name='Music')
+        start = self.changes().json()['version']
+        make_event(music)
+        make_event(music)
+        CatalogChange.objects.update(created_at=timezone.now() - timedelta(days=30))
+        out = io.StringIO()
+        call_command('prune_changes', stdout=out)
+        self.assertIn('Deleted 2 change(s)', out.getvalue())
+        response = self.changes(start - 1)
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.json()['version'], start + 2)
+        self.assertEqual(self.changes(start + 2).json()['changes'], [])
+        self.assertEqual(self.changes(start + 3).status_code, 410)  # From a reset log.
+        self.assertEqual(self.changes('x').status_code, 400)
+
+
+class MetricsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_event(Category.objects.create(name='Music'), name='Jazz Night')
+
+    def test_records_time_queries_and_cache_results_per_view(self):
+        timing, queries = REQUEST_SECONDS.labels('category_list'), REQUEST_QUERIES.labels('category_list')
+        hits, misses = CACHE_REQUESTS.labels('category_list', 'hit'), CACHE_REQUESTS.labels('category_list', 'miss')
+        before = (sum(timing.counts), queries.sum, hits.value, misses.value)
+        self.client.get(reverse('category_list'))
+        self.client.get(reverse('category_list'))
+
+        # One query on the cold request, none on the cached one.
+        self.assertEqual(
+            (sum(timing.counts), queries.sum, hits.value, misses.value),
+            (before[0] + 2, before[1] + 1, before[2] + 1, before[3] + 1),
+        )
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'eventease_http_requests_total{view="category_list",method="GET",status="200"}', response.content.decode(),
+        )
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_endpoint_requires_the_token_when_one_is_set(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_endpoint_only_answers_local_clients_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5').status_code, 403)
+
+
+class ProfilingTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Music')
+        make_event(cls.category, name='Jazz Night')
+        cls.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        profiling = override_settings(
+            PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=1.0, PROFILE_INTERVAL=0.001, SLOW_REQUEST_THRESHOLD=0,
+            MIDDLEWARE=['event_management_system_app.profiling.ProfilingMiddleware', *settings.MIDDLEWARE],
+        )
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+
+    def test_sampled_request_is_logged_and_saved_with_its_sql(self):
+        with self.assertLogs('eventease.slow', 'WARNING') as logs:
+            response = self.client.get(reverse('category_events', args=[self.category.id]))
+        profile_id = response['X-Profile-Id']
+
+        self.assertIn('Slow request category_events', logs.output[0])
+        with open(os.path.join(self.directory, f'{profile_id}.json')) as stored:
+            profile = json.load(stored)
+        self.assertEqual((profile['name'], profile['details']['status']), ('category_events', 200))
+        self.assertTrue(any('event_management_system_app_event' in query['sql'] for query in profile['queries']))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, f'{profile_id}.folded')))
+
+    async def test_async_requests_are_profiled_on_the_event_loop(self):
+        async def view(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(ProfilingMiddleware(view)))
+        with self.assertLogs('eventease.slow', 'WARNING') as logs:
+            response = await self.async_client.get(reverse('api_categories'))
+        self.assertIn('Slow request api_categories', logs.output[0])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, f"{response['X-Profile-Id']}.json")))
+
+    def test_admin_pages_are_staff_only(self):
+        with self.assertLogs('eventease.slow', 'WARNING'):
+            profile_id = self.client.get(reverse('category_list'))['X-Profile-Id']
+            self.assertEqual(self.client.get(reverse('admin_profiles')).status_code, 302)
+
+            self.client.login(username='staff', password='secret')
+            self.assertContains(self.client.get(reverse('admin_profiles')), profile_id)
+            self.assertContains(self.client.get(reverse('admin_profile', args=[profile_id])), '<svg')
+            download = self.client.get(reverse('admin_profile_download', args=[profile_id, 'folded']))
+            self.assertEqual(download.status_code, 200)
+            self.assertEqual(self.client.get(reverse('admin_profile', args=['..'])).status_code, 404)
+
+
+class QueryCountTests(CatalogTestCase):
+    """Pin the number of SQL statements per view, independent of data size."""
+
+    def grow(self, categories, events_per_category):
+        for i in range(categories):
+            category = Category.objects.create(name=f'Category {Category.objects.count()}')
+            for j in range(events_per_category):
+                make_event(category, name=f'Event {j}')
+        return category
+
+    def assertQueriesAtEverySize(self, num, url_for):
+        for size in (1, 5, 20):
+            url = url_for(self.grow(size, size))
+            cache.clear()
+            with self.subTest(size=size, cache='cold'), self.assertNumQueries(num):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+            with self.subTest(size=size, cache='warm'), self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_category_list(self):
+        self.assertQueriesAtEverySize(1, lambda category: reverse('category_list'))
+
+    def test_category_events(self):
+        # The category, then its events; event.category comes from the
+        # reverse relation cache rather than a query per row.
+        self.assertQueriesAtEverySize(2, lambda category: reverse('category_events', args=[category.id]))
+
+    def test_event_chart(self):
+        # The statistics rows, then the daily bookings.
+        self.assertQueriesAtEverySize(2, lambda category: reverse('event_chart'))
+
+    def test_api_stats(self):
+        self.assertQueriesAtEverySize(2, lambda category: reverse('api_stats'))
+
+    def test_api_categories(self):
+        self.assertQueriesAtEverySize(1, lambda category: reverse('api_categories'))
+
+    def test_api_category_events(self):
+        self.assertQueriesAtEverySize(2, lambda category: reverse('api_category_events', args=[category.id]))
+
+    def test_api_event(self):
+        self.assertQueriesAtEverySize(1, lambda category: reverse('api_event', args=[category.event_set.first().id]))
+
+    def test_api_search(self):
+        # The ranked IDs, then their rows.
+        self.assertQueriesAtEverySize(2, lambda category: reverse('api_search') + '?q=event')
+
+    def test_api_whats_on(self):
+        # The events of every day bucket in the range, then their categories.
+        self.assertQueriesAtEverySize(2, lambda category: reverse('api_whats_on') + '?when=days&days=7')
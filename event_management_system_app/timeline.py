@@ -0,0 +1,202 @@
+"""Events by time range ("what's on"), served from day buckets.
+
+A bucket holds the compact rows of every event overlapping one local
+calendar day. Buckets are loaded on first use, all missing days of a
+request at once, and then kept in the cache. Writes do not clear them wholesale: saving or deleting an event
+bumps the generation of only the days it covered before and after the
+write, and renaming a category bumps one global generation. Bucket keys
+include both generations, so each process also keeps the buckets it
+read last in memory: a warm read only fetches the generation numbers.
+
+Buckets leave out ``participants``, so bookings never touch them. This is
+unlike the catalog version, which every booking bumps. Queryset
+``update()`` and ``bulk_create()`` send no signals, so callers of those
+must call :func:`touch` themselves.
+"""
+import threading
+import time as _time
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import CACHE_REQUESTS
+from .models import Category, Event
+
+# Fields of a bucket row.
+BUCKET_FIELDS = (
+    'id', 'name', 'category', 'category_id', 'start_date', 'end_date', 'priority', 'location', 'organizer',
+)
+
+RANGES = ('today', 'tonight', 'weekend', 'days', 'ongoing')
+MAX_DAYS = 31
+EVENING = time(18)
+BUCKET_TIMEOUT = 60 * 60 * 24
+LOCAL_BUCKETS = 128
+
+GENERATION_KEY = 'timeline:generation'
+
+_LOCAL_HITS, _HITS, _MISSES = (CACHE_REQUESTS.labels('timeline', result) for result in ('local', 'hit', 'miss'))
+
+_local = OrderedDict()  # bucket key -> rows, least recently used first
+_local_lock = threading.Lock()
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _days(start, end, zone=None):
+    """Local dates of the buckets an interval ``[start, end)`` overlaps."""
+    zone = zone or timezone.get_current_timezone()
+    first = start.astimezone(zone).date()
+    last = max(start, end - timedelta(microseconds=1)).astimezone(zone).date()
+    return [first + timedelta(days=n) for n in range((last - first).days + 1)]
+
+
+def time_range(name, days=7, now=None):
+    """``(start, end)`` of a named range; events overlapping it are on.
+
+    ``today`` and ``tonight`` run to midnight, ``weekend`` to Monday and
+    ``days`` for ``days`` days; all start no earlier than ``now``.
+    ``ongoing`` is the instant ``now``. Raises ``ValueError``.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    midnight = _day_start(today + timedelta(days=1))
+    if name == 'today':
+        return now, midnight
+    if name == 'tonight':
+        return max(now, timezone.make_aware(datetime.combine(today, EVENING))), midnight
+    if name == 'weekend':
+        # This Saturday, or yesterday's on a Sunday.
+        saturday = today + timedelta(days=5 - today.weekday())
+        return max(now, _day_start(saturday)), _day_start(saturday + timedelta(days=2))
+    if name == 'days':
+        if not 1 <= days <= MAX_DAYS:
+            raise ValueError(f'days must be between 1 and {MAX_DAYS}')
+        return now, now + timedelta(days=days)
+    if name == 'ongoing':
+        return now, now + timedelta(microseconds=1)
+    raise ValueError(f"Unknown range: {name} (expected one of {', '.join(RANGES)})")
+
+
+def _generation_key(day):
+    return f'timeline:{day.isoformat()}:generation'
+
+
+def _generations(keys):
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Time-based, so a generation lost to eviction never comes back.
+            cache.add(key, int(_time.time() * 1000), timeout=None)
+            generations[key] = cache.get(key)
+    return generations
+
+
+def _load(days):
+    """Bucket rows of ``days`` (sorted dates)."""
+    start, end = _day_start(days[0]), _day_start(days[-1] + timedelta(days=1))
+    wanted = set(days)
+    buckets = {day: [] for day in days}
+    zone = timezone.get_current_timezone()
+    # Scans event_end_start_idx over unfinished events only; ordering or
+    # joining the category in SQL would make SQLite pick a worse index.
+    rows = sorted(
+        Event.objects.filter(end_date__gt=start, start_date__lt=end).order_by()
+        .values(*(field for field in BUCKET_FIELDS if field != 'category')),
+        key=lambda row: (row['start_date'], row['id']),
+    )
+    categories = dict(
+        Category.objects.filter(pk__in={row['category_id'] for row in rows}).values_list('id', 'name')
+    ) if rows else {}
+    for row in rows:
+        row['category'] = categories.get(row['category_id'])
+        for day in _days(max(row['start_date'], start), min(row['end_date'], end), zone):
+            if day in wanted:
+                buckets[day].append(row)
+    return buckets
+
+
+def buckets(days):
+    """``{day: rows}`` for ``days``, loading only the missing buckets."""
+    generation_keys = {day: _generation_key(day) for day in days}
+    generations = _generations([GENERATION_KEY, *generation_keys.values()])
+    keys = {
+        day: f'timeline:{generations[GENERATION_KEY]}:{day.isoformat()}:{generations[generation_keys[day]]}'
+        for day in days
+    }
+    with _local_lock:
+        result = {day: _local[keys[day]] for day in days if keys[day] in _local}
+    shared = [keys[day] for day in days if day not in result]
+    found = cache.get_many(shared) if shared else {}
+    fetched = {day: found[keys[day]] for day in days if keys[day] in found}
+    missing = [day for day in days if day not in result and day not in fetched]
+    _LOCAL_HITS.inc(len(result))
+    _HITS.inc(len(fetched))
+    _MISSES.inc(len(missing))
+    if missing:
+        fetched.update(_load(missing))
+        cache.set_many({keys[day]: fetched[day] for day in missing}, BUCKET_TIMEOUT)
+    with _local_lock:
+        for day, rows in fetched.items():
+            _local[keys[day]] = rows
+        for day in days:
+            _local.move_to_end(keys[day])
+        while len(_local) > LOCAL_BUCKETS:
+            _local.popitem(last=False)
+    result.update(fetched)
+    return result
+
+
+def events_between(start, end):
+    """Rows of the events overlapping ``[start, end)``, by start date."""
+    days = _days(start, end)
+    seen, rows = set(), []
+    for day_rows in buckets(days).values():
+        for row in day_rows:
+            if row['id'] not in seen and row['start_date'] < end and row['end_date'] > start:
+                seen.add(row['id'])
+                rows.append(row)
+    rows.sort(key=lambda row: (row['start_date'], row['id']))
+    return rows
+
+
+def as_datetime(value):
+    # Views may assign form strings; read them as DateTimeField saves them.
+    value = Event._meta.get_field('start_date').to_python(value)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+def _touch(spans):
+    if spans is None:
+        keys = {GENERATION_KEY}
+    else:
+        # Only days from yesterday to the end of the longest range can
+        # have buckets that will still be read.
+        today = timezone.localdate()
+        low, high = _day_start(today - timedelta(days=1)), _day_start(today + timedelta(days=MAX_DAYS + 2))
+        keys = {
+            _generation_key(day)
+            for start, end in spans if start < high and end > low
+            for day in _days(max(start, low), min(end, high))
+        }
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass  # No generation, so nothing was cached under it.
+
+
+def touch(spans=None):
+    """Invalidate the buckets of the days ``(start, end)`` ``spans`` cover,
+    or every bucket, once the current transaction commits."""
+    if spans is not None:
+        spans = [tuple(map(as_datetime, span)) for span in spans]
+        spans = [span for span in spans if None not in span]
+    transaction.on_commit(lambda: _touch(spans))
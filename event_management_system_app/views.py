@@ -1,10 +1,22 @@
+import json
+import time
+
 from django.shortcuts import render
-from django.utils import timezone
 from django.shortcuts import render, get_object_or_404
 from django.contrib import messages
-from .models import Category, Event
+from .models import Booking, Category, Event
 from django.shortcuts import render, redirect
 from django.urls import reverse
+from django.http import Http404
+from django.views.decorators.http import condition
+from . import idempotency, stats
+from .caching import cached, catalog_condition
+from .pagination import InvalidCursor, paginate
+
+LISTING_PAGE_SIZE = 50
+LISTED_EVENT_FIELDS = (
+	'id', 'name', 'start_date', 'end_date', 'priority', 'participants', 'description', 'location', 'organizer',
+)
 
 
 def delete_event(request, event_id):
@@ -16,18 +28,132 @@ def delete_event(request, event_id):
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def replay_response(result):
+    """The response to a repeated request, from what its key holds."""
+    if result == idempotency.IN_PROGRESS:
+        response = JsonResponse(
+            {'status': 'error', 'message': f'A request with this {IDEMPOTENCY_HEADER} is in progress'}, status=429,
+        )
+        response['Retry-After'] = '1'
+        return response
+    body, status = result
+    response = JsonResponse(body, status=status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
 @csrf_exempt
 def increment_participants(request, event_id):
+    """Take one seat at an event.
+
+    With an ``Idempotency-Key`` header, repeats of the request return the
+    first one's response instead of taking another seat (see
+    :mod:`.idempotency`).
+    """
     if request.method == 'POST':
         try:
-            event = Event.objects.get(pk=event_id)
-            event.participants += 1
-            event.save()
-            return JsonResponse({'status': 'success', 'participants': event.participants})
-        except Event.DoesNotExist:
-            return JsonResponse({'status': 'error', 'message': 'Event not found'}, status=404)
+            key = idempotency.clean_key(request.headers.get(IDEMPOTENCY_HEADER))
+        except idempotency.InvalidKey:
+            return JsonResponse({'status': 'error', 'message': f'Invalid {IDEMPOTENCY_HEADER}'}, status=400)
+        scope = f'increment_participants:{event_id}'
+        if key is not None:
+            used = idempotency.claim(scope, [key])
+            if key in used:
+                return replay_response(used[key])
+        try:
+            body, status = _increment_participants(event_id)
+        except BaseException:
+            if key is not None:
+                idempotency.release(scope, [key])
+            raise
+        if key is not None:
+            idempotency.remember(scope, {key: (body, status)})
+        return JsonResponse(body, status=status)
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 
+
+def _increment_participants(event_id):
+    try:
+        participants = Event.objects.increment_participants(event_id)
+    except Event.DoesNotExist:
+        return {'status': 'error', 'message': 'Event not found'}, 404
+    if participants is None:
+        return {'status': 'error', 'message': 'Event is full'}, 409
+    return {'status': 'success', 'participants': participants}, 200
+
+MAX_BOOKING_BATCH = 500
+BOOKING_IN_PROGRESS = {'status': 'pending', 'message': 'Booking in progress, retry shortly'}
+
+@csrf_exempt
+def create_bookings(request):
+    """Record a batch of bookings posted as ``{"bookings": [...]}``.
+
+    Each booking is ``{"event_id", "user_id", "name", "email"}``, plus an
+    optional idempotency ``key``. The whole batch is written in one
+    transaction and the response carries one result per booking, in the
+    order they were sent. A booking whose key was seen before is not
+    written again: its result is the first booking's, or ``pending`` while
+    that one is still being written (see :mod:`.idempotency`).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+    try:
+        items = json.loads(request.body)['bookings']
+        bookings = [
+            Booking(event_id=int(item['event_id']), user_id=int(item['user_id']),
+                    name=str(item['name'])[:100], email=str(item['email'])[:254])
+            for item in items
+        ]
+        keys = [idempotency.clean_key(item.get('key')) for item in items]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid booking data'}, status=400)
+    if len(bookings) > MAX_BOOKING_BATCH:
+        return JsonResponse({'status': 'error', 'message': f'At most {MAX_BOOKING_BATCH} bookings per batch'}, status=400)
+
+    used = idempotency.claim('bookings', dict.fromkeys(key for key in keys if key is not None))
+    first = {}  # claimed key -> index of the booking written for it
+    written = []
+    for index, key in enumerate(keys):
+        if key is None or (key not in used and key not in first):
+            if key is not None:
+                first[key] = index
+            written.append(index)
+    try:
+        results = dict(zip(written, _book([bookings[index] for index in written])))
+    except BaseException:
+        idempotency.release('bookings', first)
+        raise
+    idempotency.remember('bookings', {key: results[index] for key, index in first.items()})
+
+    for index, key in enumerate(keys):
+        if index not in results:
+            result = used.get(key, results.get(first.get(key)))
+            results[index] = BOOKING_IN_PROGRESS if result == idempotency.IN_PROGRESS else result
+    return JsonResponse({'status': 'success', 'results': [results[index] for index in range(len(bookings))]})
+
+
+def _book(bookings):
+    """Write ``bookings``; one result dict per booking, in order."""
+    if not bookings:
+        return []
+    existing = set(Event.objects.filter(pk__in={b.event_id for b in bookings}).values_list('id', flat=True))
+    numbers = Booking.objects.create_batch([b for b in bookings if b.event_id in existing])
+    numbers = iter(numbers)
+    results = []
+    for booking in bookings:
+        if booking.event_id not in existing:
+            results.append({'status': 'error', 'message': 'Event not found'})
+            continue
+        participants = next(numbers)
+        if participants is None:
+            results.append({'status': 'error', 'message': 'Event is full'})
+        else:
+            results.append({'status': 'success', 'participants': participants})
+    return results
+
 from django.shortcuts import render, redirect, get_object_or_404
 from .models import Category, Event
 
@@ -75,13 +201,28 @@ def update_event(request, event_id):
         event.description = request.POST.get('description')
         event.location = request.POST.get('location')
         event.organizer = request.POST.get('organizer')
-        event.save()
+        # Leave participants alone: bookings may have changed it since the read.
+        event.save(update_fields=[
+            'name', 'category', 'start_date', 'end_date', 'priority', 'description', 'location', 'organizer',
+        ])
         return redirect('category_list')
     else:
         categories = Category.objects.all()
         return render(request, 'update_event.html', {'event': event, 'categories': categories})
+def keyset_page(request, queryset, keys):
+	try:
+		return paginate(queryset, keys, after=request.GET.get('after'),
+			before=request.GET.get('before'), size=LISTING_PAGE_SIZE)
+	except InvalidCursor:
+		raise Http404('Invalid page cursor')
+
+def page_cursors(request):
+	return request.GET.get('after'), request.GET.get('before')
+
+@catalog_condition
 def category_list(request):
-	categories = Category.objects.all()
+	categories = cached('category_list', *page_cursors(request),
+		loader=lambda: keyset_page(request, Category.objects.values('id', 'name'), ('id',)))
 	return render(request, 'category_list.html', {'categories': categories})
 
 def create_category(request):
@@ -102,17 +243,30 @@ def delete_category(request, category_id):
 		messages.success(request, "Category deleted successfully.")
 	return redirect('category_list')
 
+@catalog_condition
 def category_events(request, category_id):
-	category = get_object_or_404(Category, pk=category_id)
-	events = category.event_set.all()
-	return render(request, 'category_events.html', {'category': category, 'events': events})
+	# Cached as plain rows, which are cheaper to pickle than model instances.
+	category = cached('category', category_id,
+		loader=lambda: get_object_or_404(Category.objects.values('id', 'name'), pk=category_id))
+	events = cached('category_events', category_id, *page_cursors(request),
+		loader=lambda: keyset_page(request, Event.objects.filter(category_id=category_id).values(*LISTED_EVENT_FIELDS),
+			('start_date', 'id')))
+	return render(request, 'category_events.html', {
+		'category': category,
+		'events': events,
+	})
 
+@condition(etag_func=stats.window_etag)
 def event_chart(request):
-	categories = Category.objects.all()
-	pending_counts = {}
-	for category in categories:
-		pending_counts[category.name] = Event.objects.filter(
-			category=category,
-			start_date__gt=timezone.now()
-		).count()
-	return render(request, 'event_chart.html', {'pending_counts': pending_counts})
\ No newline at end of file
+	dashboard = cached('event_chart', int(time.time() // stats.WINDOW),
+		loader=stats.dashboard, timeout=stats.WINDOW)
+	return render(request, 'event_chart.html', {
+		'categories': dashboard['categories'],
+		'bookings_per_day': dashboard['bookings_per_day'],
+		'chart': {
+			'categories': [category['name'] for category in dashboard['categories']],
+			'upcoming': [category['upcoming'] for category in dashboard['categories']],
+			'days': [entry['day'] for entry in dashboard['bookings_per_day']],
+			'bookings': [entry['bookings'] for entry in dashboard['bookings_per_day']],
+		},
+	})
\ No newline at end of file
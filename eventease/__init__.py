@@ -0,0 +1 @@
+"""Support code shared by the EventEase Telegram bots."""
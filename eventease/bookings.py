@@ -0,0 +1,119 @@
+"""Batched booking writes.
+
+Confirmed bookings are queued and posted to ``/api/bookings/`` together,
+either once ``max_batch`` bookings are waiting or ``max_delay`` seconds
+after the first one arrived, whichever comes first. Each submitter awaits
+its own result, so handlers still reply with the participant number.
+
+Bookings carry an idempotency key made from the chat, the event and the
+booking conversation, so a batch that timed out can be sent again, and a
+user who retries the same booking gets its first result back instead of a
+second seat.
+"""
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def new_conversation_id():
+    """An ID for one booking conversation, stored with the user's data."""
+    return uuid.uuid4().hex
+
+
+def booking_key(chat_id, event_id, conversation_id):
+    """The idempotency key shared by every attempt at one booking."""
+    return f'{chat_id}:{event_id}:{conversation_id}'
+
+
+class BookingQueue:
+    """Batches bookings and posts up to ``max_in_flight`` batches at a time,
+    so one slow batch does not hold up the bookings queued after it."""
+
+    def __init__(self, client, max_batch=100, max_delay=0.05, max_in_flight=4):
+        self.client = client
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []  # (booking, future)
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._sending = set()
+        self._task = None
+        self._closing = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Send whatever is still queued, then stop the flusher."""
+        self._closing = True
+        self._wakeup.set()
+        self._full.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self._sending:
+            await asyncio.gather(*self._sending)
+
+    async def submit(self, event_id, user_id, name, email, key=None):
+        """Queue a booking and wait for its result from the server.
+
+        Returns ``{'status': 'success', 'participants': n}`` or
+        ``{'status': 'error', 'message': ...}`` (``'pending'`` if an earlier
+        attempt with the same ``key`` is still being written); raises
+        :data:`~eventease.catalog.CatalogError` if the batch could not be sent.
+        """
+        future = asyncio.get_running_loop().create_future()
+        booking = {'event_id': event_id, 'user_id': user_id, 'name': name, 'email': email}
+        if key is not None:
+            booking['key'] = key
+        self._pending.append((booking, future))
+        self._wakeup.set()
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            # With every slot taken, bookings keep queueing into fuller batches.
+            await self._slots.acquire()
+            batch = self._take()
+            if batch:
+                task = asyncio.create_task(self._send(batch))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+            else:
+                self._slots.release()
+            if self._closing and not self._pending:
+                return
+
+    def _take(self):
+        batch = self._pending[:self.max_batch]
+        del self._pending[:self.max_batch]
+        if len(self._pending) < self.max_batch and not self._closing:
+            self._full.clear()
+        if not self._pending and not self._closing:
+            self._wakeup.clear()
+        return batch
+
+    async def _send(self, batch):
+        try:
+            results = await self.client.create_bookings([booking for booking, _ in batch])
+        except Exception as e:
+            logger.error(f"Error posting {len(batch)} bookings: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
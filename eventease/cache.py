@@ -0,0 +1,270 @@
+"""Process-wide catalog cache shared by every user of a bot process.
+
+Entries are fresh for ``ttl`` seconds. After that, and for up to
+``stale_ttl`` more seconds, the stale value is served immediately while a
+single background task reloads it (stale-while-revalidate). Concurrent
+misses for the same key share one load, and the least recently used entries
+are evicted once ``maxsize`` is reached.
+
+With a change feed (see :mod:`eventease.sync`), entries are instead kept
+up to date as the catalog changes: records are updated in place and only
+the pages a change affects are dropped. What's-on pages also depend on
+the time ("tonight" moves on without any change), so they are kept in a
+cache of their own that the feed does not keep fresh for longer.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from .metrics import CACHE_REQUESTS
+from .records import EventRecord
+
+logger = logging.getLogger(__name__)
+
+# Event fields that decide which listing pages an event is on, and where.
+LISTED_FIELDS = ('name', 'category_id', 'start_date', 'end_date')
+# Event fields that search matches.
+SEARCHED_FIELDS = ('name', 'description', 'location', 'organizer')
+
+
+class _Entry:
+    __slots__ = ('value', 'loaded_at')
+
+    def __init__(self, value, loaded_at):
+        self.value = value
+        self.loaded_at = loaded_at
+
+
+class TTLCache:
+    def __init__(self, ttl=30.0, stale_ttl=300.0, maxsize=256, clock=time.monotonic, name='cache'):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._loading = {}  # key -> Future shared by concurrent loaders
+        self._refreshing = {}  # key -> background refresh Task
+        self._hits, self._stale, self._misses = (
+            CACHE_REQUESTS.labels(name, result) for result in ('hit', 'stale', 'miss')
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, key, loader):
+        """Return the cached value for ``key``, calling ``loader()`` if needed."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = self.clock() - entry.loaded_at
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                if age < self.ttl:
+                    self._hits.inc()
+                else:
+                    self._stale.inc()
+                    if key not in self._refreshing:
+                        self._refreshing[key] = asyncio.create_task(self._refresh(key, loader))
+                return entry.value
+        self._misses.inc()
+        return await self._load(key, loader)
+
+    async def _load(self, key, loader):
+        future = self._loading.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader()
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure is not logged as lost.
+            future.exception()
+            raise
+        else:
+            # Unless invalidated meanwhile: it may have read an older catalog.
+            if self._loading.get(key) is future:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+
+    async def _refresh(self, key, loader):
+        try:
+            await self._load(key, loader)
+        except Exception as e:
+            logger.warning(f"Background refresh of {key!r} failed, serving stale value: {e}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def set(self, key, value):
+        self._entries[key] = _Entry(value, self.clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def peek(self, key):
+        """The cached value for ``key``, stale or not, or ``None``; not a lookup."""
+        entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+
+    def values(self):
+        """Cached values, least recently used first, stale ones included."""
+        return [entry.value for entry in self._entries.values()]
+
+    def invalidate(self, key=None):
+        self.invalidate_where(lambda cached: key is None or cached == key)
+
+    def invalidate_where(self, predicate):
+        """Drop the entries whose key matches ``predicate``. Loads in flight
+        for them may have read the catalog before the change, so their
+        results are returned to their callers but not stored."""
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+        for key in [key for key in self._loading if predicate(key)]:
+            del self._loading[key]
+
+
+class EventIndex:
+    """Event details shared by every user, keyed by event ID.
+
+    Handlers keep only event IDs per user and look the details up here.
+    """
+
+    def __init__(self, client, ttl=30.0, stale_ttl=300.0, maxsize=50_000):
+        self.client = client
+        self.cache = TTLCache(ttl=ttl, stale_ttl=stale_ttl, maxsize=maxsize, name='events')
+
+    def __len__(self):
+        return len(self.cache)
+
+    def add(self, data):
+        record = EventRecord.from_api(data)
+        self.cache.set(record.id, record)
+        return record
+
+    def records(self):
+        """Indexed records, least recently used first."""
+        return self.cache.values()
+
+    def peek(self, event_id):
+        return self.cache.peek(event_id)
+
+    def discard(self, event_id):
+        self.cache.invalidate(event_id)
+
+    async def get(self, event_id):
+        """Return the :class:`~eventease.records.EventRecord` for ``event_id``."""
+        return await self.cache.get(event_id, lambda: self._load(event_id))
+
+    async def _load(self, event_id):
+        return EventRecord.from_api(await self.client.event(event_id))
+
+
+class CatalogCache:
+    """Read-through cache in front of a :class:`~eventease.catalog.CatalogClient`.
+
+    Category and what's-on pages are returned as the API sends them; event
+    and search pages list :class:`~eventease.records.EventRecord` objects
+    from the shared :attr:`index` instead of dicts.
+    """
+
+    def __init__(self, client, ttl=30.0, stale_ttl=300.0, maxsize=256):
+        self.client = client
+        self.cache = TTLCache(ttl=ttl, stale_ttl=stale_ttl, maxsize=maxsize, name='catalog')
+        self.whats_on_cache = TTLCache(ttl=ttl, stale_ttl=stale_ttl, maxsize=maxsize, name='whats_on')
+        self.index = EventIndex(client, ttl=ttl, stale_ttl=stale_ttl)
+
+    async def categories(self, after=None, before=None):
+        return await self.cache.get(
+            ('categories', after, before),
+            lambda: self.client.categories(after=after, before=before),
+        )
+
+    async def all_categories(self, max_pages=20):
+        """Every category (up to ``max_pages`` pages), via the cached pages."""
+        categories, after = [], None
+        for _ in range(max_pages):
+            page = await self.categories(after=after)
+            categories += page['categories']
+            after = page['next']
+            if not after:
+                break
+        return categories
+
+    async def events(self, category_id, after=None, before=None):
+        return await self.cache.get(
+            ('events', category_id, after, before),
+            lambda: self._load_events(category_id, after, before),
+        )
+
+    async def _load_events(self, category_id, after, before):
+        page = await self.client.events(category_id, after=after, before=before)
+        # Pages carry the detail fields, so opening a listed event is a hit.
+        return {**page, 'events': [self.index.add(event) for event in page['events']]}
+
+    async def search(self, text, after=None, before=None):
+        text = ' '.join(text.lower().split())
+        return await self.cache.get(
+            ('search', text, after, before),
+            lambda: self._load_search(text, after, before),
+        )
+
+    async def _load_search(self, text, after, before):
+        page = await self.client.search(text, after=after, before=before)
+        return {**page, 'events': [self.index.add(event) for event in page['events']]}
+
+    async def whats_on(self, when, days=None, after=None, before=None):
+        # Listing fields only, so these events stay out of the index.
+        return await self.whats_on_cache.get(
+            (when, days, after, before),
+            lambda: self.client.whats_on(when, days=days, after=after, before=before),
+        )
+
+    async def event(self, event_id):
+        return await self.index.get(event_id)
+
+    def apply(self, change):
+        """Bring cached pages and records up to date with one change from
+        the catalog's change feed (see :mod:`eventease.sync`)."""
+        kind, action, object_id, data = change['kind'], change['action'], change['id'], change['data'] or {}
+        if kind == 'category':
+            self.cache.invalidate_where(lambda key: (
+                key[0] == 'categories' or key[:2] == ('events', object_id)
+                or (action == 'deleted' and key[0] == 'search')
+            ))
+            if action == 'deleted':
+                self.whats_on_cache.invalidate()
+            for record in self.index.records():
+                if record.category_id == object_id:
+                    if action == 'deleted':
+                        self.index.discard(record.id)
+                    else:
+                        record.update({'category': data.get('name')})
+            return
+        record = self.index.peek(object_id)
+        if action != 'participants':
+            # Pages list events by category and start date; search ranks by
+            # text, and what's on shows names and dates.
+            if record is None or action != 'updated':
+                changed = {*LISTED_FIELDS, *SEARCHED_FIELDS}
+            else:
+                changed = {field for field in data if getattr(record, field, None) != data[field]}
+            listed, searched = bool(changed & set(LISTED_FIELDS)), bool(changed & set(SEARCHED_FIELDS))
+            categories = {data.get('category_id'), record.category_id if record else None} - {None}
+            self.cache.invalidate_where(lambda key: (
+                # Without the category (an unindexed event deleted), any page could list it.
+                (listed and key[0] == 'events' and (key[1] in categories or not categories))
+                or (searched and key[0] == 'search')
+            ))
+            if listed:
+                self.whats_on_cache.invalidate()
+        if record is None:
+            return
+        if action == 'deleted':
+            self.index.discard(object_id)
+        else:
+            record.update(data)
@@ -0,0 +1,224 @@
+"""Async client for the Django JSON catalog API (``/api/...``).
+
+One :class:`CatalogClient` is created per bot ``Application`` (see
+``post_init`` in the bots) so that every handler shares the same pool of
+keep-alive connections instead of opening a new TCP connection per call.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import httpx
+
+from .metrics import CATALOG_SECONDS, endpoint
+
+# Fields the bots render; anything else is left on the server.
+CATEGORY_FIELDS = ('id', 'name')
+EVENT_LIST_FIELDS = ('id', 'name')
+WHATS_ON_FIELDS = ('id', 'name', 'start_date')
+EVENT_DETAIL_FIELDS = (
+    'id', 'name', 'category', 'category_id', 'start_date', 'end_date',
+    'priority', 'participants', 'description', 'location', 'organizer',
+)
+
+# Buttons per keyboard page; keeps messages well inside Telegram's limits.
+PAGE_SIZE = 10
+
+DEFAULT_TIMEOUT = httpx.Timeout(5.0, connect=2.0)
+DEFAULT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=20)
+DEFAULT_MAX_CONCURRENCY = 50
+# Responses remembered for conditional GETs.
+MAX_VALIDATED = 512
+
+# Booking writes that carry an idempotency key are safe to repeat, so they
+# get a tight timeout and are retried instead of waiting out a slow server.
+WRITE_TIMEOUT = httpx.Timeout(2.0, connect=1.0)
+WRITE_RETRIES = 3
+RETRY_BACKOFF = 0.25
+
+# Raised for transport failures, timeouts and non-2xx responses.
+CatalogError = httpx.HTTPError
+
+
+class VersionGone(Exception):
+    """The change log no longer reaches back to the version asked for;
+    ``version`` is the current one to start over from."""
+
+    def __init__(self, version):
+        super().__init__(version)
+        self.version = version
+
+
+def _retry_delay(error, attempt):
+    """Seconds to wait before retrying after ``error``, or ``None`` if the
+    request should not be retried."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        if status == 429:
+            try:
+                return float(error.response.headers['Retry-After'])
+            except (KeyError, ValueError):
+                pass
+        elif status < 500:
+            return None
+    elif not isinstance(error, httpx.TransportError):
+        return None
+    return RETRY_BACKOFF * 2 ** attempt
+
+
+def format_datetime(value):
+    """Render an ISO 8601 timestamp from the API the way the site does."""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')
+    except (AttributeError, ValueError):
+        return value
+
+
+class CatalogClient:
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, transport=None):
+        self.http = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'), timeout=timeout, limits=limits, transport=transport,
+        )
+        # Bounds the requests in flight so a burst of users queues here
+        # instead of piling up on the Django workers.
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # (path, params) -> (ETag, parsed body) of recent GETs
+        self._validated = OrderedDict()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def _send(self, method, path, timeout=None, **kwargs):
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        async with self._slots:
+            started, status = time.perf_counter(), 'error'
+            try:
+                response = await self.http.request(method, path, **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                CATALOG_SECONDS.labels(method, endpoint(path), status).observe(time.perf_counter() - started)
+
+    async def _request(self, method, path, **kwargs):
+        response = await self._send(method, path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def _idempotent(self, method, path, retries, done=None, **kwargs):
+        """``_request`` for a write carrying an idempotency key: retried
+        after timeouts, server errors and 429s, and while ``done(data)`` is
+        false, up to ``retries`` times."""
+        kwargs.setdefault('timeout', WRITE_TIMEOUT)
+        for attempt in range(retries + 1):
+            try:
+                data = await self._request(method, path, **kwargs)
+            except CatalogError as e:
+                delay = _retry_delay(e, attempt)
+                if attempt == retries or delay is None:
+                    raise
+            else:
+                if attempt == retries or done is None or done(data):
+                    return data
+                delay = RETRY_BACKOFF * 2 ** attempt
+            await asyncio.sleep(delay)
+
+    async def _get(self, path, fields, params=None, **kwargs):
+        """GET with conditional revalidation: unchanged pages come back as
+        an empty 304 and the previously parsed body is reused."""
+        params = {key: value for key, value in (params or {}).items() if value is not None}
+        params['fields'] = ','.join(fields)
+        key = (path, tuple(sorted(params.items())))
+        validated = self._validated.get(key)
+        headers = {'If-None-Match': validated[0]} if validated else None
+        response = await self._send('GET', path, params=params, headers=headers, **kwargs)
+        if response.status_code == 304 and validated:
+            self._validated.move_to_end(key)
+            return validated[1]
+        response.raise_for_status()
+        data = response.json()
+        etag = response.headers.get('ETag')
+        if etag:
+            self._validated[key] = (etag, data)
+            self._validated.move_to_end(key)
+            while len(self._validated) > MAX_VALIDATED:
+                self._validated.popitem(last=False)
+        return data
+
+    async def categories(self, after=None, before=None, limit=PAGE_SIZE, **kwargs):
+        """Return one page: ``{'categories': [...], 'next': cursor, 'prev': cursor}``."""
+        params = {'after': after, 'before': before, 'limit': limit}
+        return await self._get('/api/categories/', CATEGORY_FIELDS, params, **kwargs)
+
+    async def events(self, category_id, after=None, before=None, limit=PAGE_SIZE,
+                     fields=EVENT_DETAIL_FIELDS, **kwargs):
+        """Return one page: ``{'category': {...}, 'events': [...], 'next': ..., 'prev': ...}``."""
+        params = {'after': after, 'before': before, 'limit': limit}
+        return await self._get(f'/api/categories/{category_id}/events/', fields, params, **kwargs)
+
+    async def search(self, text, after=None, before=None, limit=PAGE_SIZE,
+                     fields=EVENT_DETAIL_FIELDS, **kwargs):
+        """Return one page of matches, best first: ``{'query': ..., 'events': [...], 'next': ..., 'prev': ...}``."""
+        params = {'q': text, 'after': after, 'before': before, 'limit': limit}
+        return await self._get('/api/search/', fields, params, **kwargs)
+
+    async def whats_on(self, when, days=None, after=None, before=None, limit=PAGE_SIZE,
+                       fields=WHATS_ON_FIELDS, **kwargs):
+        """Return one page of the events on ``when`` (``today``, ``tonight``,
+        ``weekend``, ``days`` or ``ongoing``), by start date:
+        ``{'when': ..., 'start': ..., 'end': ..., 'events': [...], 'next': ..., 'prev': ...}``."""
+        params = {'when': when, 'days': days, 'after': after, 'before': before, 'limit': limit}
+        return await self._get('/api/whats-on/', fields, params, **kwargs)
+
+    async def event(self, event_id, fields=EVENT_DETAIL_FIELDS, **kwargs):
+        return (await self._get(f'/api/events/{event_id}/', fields, **kwargs))['event']
+
+    async def changes(self, since=None, wait=0, **kwargs):
+        """Catalog changes after version ``since``, waiting up to ``wait``
+        seconds for one: ``{'version': ..., 'changes': [...], 'more': ...}``.
+        Without ``since``, only the current version. Raises :class:`VersionGone`.
+        """
+        kwargs.setdefault('timeout', httpx.Timeout(DEFAULT_TIMEOUT.read + wait, connect=DEFAULT_TIMEOUT.connect))
+        params = {'since': since, 'wait': wait} if since is not None else {}
+        try:
+            return await self._request('GET', '/api/changes/', params=params, **kwargs)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 410:
+                raise VersionGone(e.response.json()['version']) from None
+            raise
+
+    async def increment_participants(self, event_id, key=None, retries=WRITE_RETRIES, **kwargs):
+        """Return the new participant count, or ``None`` if the event is full.
+
+        With an idempotency ``key``, the request is retried on failure and
+        every attempt takes at most one seat.
+        """
+        path = f'/increment_participants/{event_id}/'
+        try:
+            if key is None:
+                data = await self._request('POST', path, **kwargs)
+            else:
+                data = await self._idempotent('POST', path, retries, headers={'Idempotency-Key': key}, **kwargs)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 409:
+                return None
+            raise
+        return data['participants']
+
+    async def create_bookings(self, bookings, retries=WRITE_RETRIES, **kwargs):
+        """Post a batch of bookings; returns one result dict per booking, in order.
+
+        If every booking has an idempotency ``key``, the batch is sent again
+        on failure, and while some bookings are ``pending`` because an
+        earlier attempt is still writing them. Bookings already written are
+        not written twice; their first results come back instead.
+        """
+        if not all(booking.get('key') for booking in bookings):
+            return (await self._request('POST', '/api/bookings/', json={'bookings': bookings}, **kwargs))['results']
+        data = await self._idempotent(
+            'POST', '/api/bookings/', retries, json={'bookings': bookings},
+            done=lambda data: all(result['status'] != 'pending' for result in data['results']), **kwargs
+        )
+        return data['results']
@@ -0,0 +1,89 @@
+"""Labeled messages for the intent model.
+
+``TRAINING`` builds the model. ``EVALUATION`` is held out: its phrasings
+do not appear in ``TRAINING`` and it includes messages that match no intent
+(label ``None``). The tests and ``benchmarks.intents`` score against it.
+"""
+
+TRAINING = {
+    'greeting': [
+        'hi', 'hello', 'hey', 'hey there', 'hello bot', 'good morning', 'good evening',
+        'start', 'start over', 'menu', 'main menu', 'show me the menu', 'help',
+        'what can you do', 'what are my options', 'how does this work', 'hi there, what can I do here',
+    ],
+    'book': [
+        'book a comedy show', 'i want to book tickets', 'book tickets', 'book an event',
+        'show me events', 'list the events', 'list categories', 'event categories',
+        'what events do you have', 'find me a concert', "i'd like to reserve a seat",
+        'book jazz night', 'get tickets for the opera', 'browse events', 'any theatre shows',
+        'reserve two tickets', 'sign me up for the workshop', 'i want to go to a concert',
+        'buy a ticket', 'show categories', 'book a table at the food market',
+        'tickets for the festival please', 'can i book the cinema screening', 'find a dance class',
+    ],
+    'whats_on': [
+        "what's on this weekend", 'anything happening tonight', 'events today',
+        "what's happening tomorrow", 'upcoming events', "what's on next week",
+        'anything on this friday', 'events this month', 'what can i go to on saturday',
+        "what's on", 'whats on tonight', 'anything going on this evening', 'events coming up soon',
+        'what is happening this weekend', 'shows on sunday', 'what is on later today',
+    ],
+    'company_info': [
+        'tell me about eventease', 'who are you', 'about the company', 'what is eventease',
+        'company info', 'about us', 'what does your company do', "what's your mission",
+        'tell me about yourselves', 'who runs this service', 'company background',
+        'what kind of company are you', 'more about eventease',
+    ],
+    'contact_us': [
+        'contact', 'how can i contact you', 'phone number', 'email address', 'support',
+        'customer service', 'talk to a human', 'i need help with my booking', 'call you',
+        'how do i reach support', 'what are your opening hours', 'contact details',
+        'send you an email', 'i have a complaint', 'speak to someone', 'your phone',
+    ],
+}
+
+EVALUATION = [
+    ('hello there', 'greeting'),
+    ('hiya', 'greeting'),
+    ('good afternoon', 'greeting'),
+    ('back to the menu', 'greeting'),
+    ('what options do i have', 'greeting'),
+    ('how do i use this bot', 'greeting'),
+    ('i would like to book a ticket', 'book'),
+    ('book me a seat for the comedy night', 'book'),
+    ('can you find me a jazz concert', 'book'),
+    ('show me the event list', 'book'),
+    ('which categories are there', 'book'),
+    ('reserve tickets for the opera', 'book'),
+    ('i want tickets for a show', 'book'),
+    ('book the poetry workshop', 'book'),
+    ('get me into the festival', 'book'),
+    ('browse the categories', 'book'),
+    ('list all events', 'book'),
+    ('buy tickets', 'book'),
+    ("what's on tonight", 'whats_on'),
+    ('what is on this saturday', 'whats_on'),
+    ('anything happening this weekend?', 'whats_on'),
+    ('events tomorrow', 'whats_on'),
+    ("what's happening next weekend", 'whats_on'),
+    ('upcoming shows', 'whats_on'),
+    ('what events are on today', 'whats_on'),
+    ('anything on next friday', 'whats_on'),
+    ('whats happening this evening', 'whats_on'),
+    ('who is eventease', 'company_info'),
+    ('tell me about your company', 'company_info'),
+    ('what is this company', 'company_info'),
+    ('about eventease', 'company_info'),
+    ('info about the company', 'company_info'),
+    ('what do you do', 'company_info'),
+    ('how can i reach you', 'contact_us'),
+    ('give me your email', 'contact_us'),
+    ("what's your phone number", 'contact_us'),
+    ('i need to speak to support', 'contact_us'),
+    ('contact customer service', 'contact_us'),
+    ('i want to complain', 'contact_us'),
+    ('when are you open', 'contact_us'),
+    ('asdfghjkl', None),
+    ('the weather is nice', None),
+    ('my cat is sleeping', None),
+    ('42', None),
+]
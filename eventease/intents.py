@@ -0,0 +1,169 @@
+"""Offline intent classification for free-text bot messages.
+
+Messages are turned into hashed TF-IDF vectors of words, word pairs and
+character n-grams (so typos and inflections still overlap). The model is
+one matrix of L2-normalized example vectors, built once from
+:mod:`eventease.intent_data`. Classifying a message scores it against
+every example with a single NumPy product over the message's few non-zero
+features, and the intent of the best example wins if it is close enough.
+
+:class:`NameIndex` uses the same features to find catalog names
+(categories, events) mentioned in a message; :class:`CatalogNames` keeps
+one up to date with a :class:`~eventease.cache.CatalogCache`.
+"""
+import re
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from .intent_data import TRAINING
+
+DIMENSIONS = 1 << 14
+CHAR_NGRAMS = (3, 4, 5)
+# Below this cosine similarity to every example a message has no intent.
+MIN_SCORE = 0.25
+# Share of a name's feature weight a message must contain to mention it.
+MIN_NAME_SCORE = 0.75
+
+_WORD = re.compile(r"[\w']+")
+
+
+def tokenize(text):
+    return [word.replace("'", '') for word in _WORD.findall(text.lower())]
+
+
+def features(text, pairs=True):
+    """Hashed feature counts of ``text`` as ``{bucket: count}``."""
+    words = tokenize(text)
+    grams = [f'w:{word}' for word in words]
+    if pairs:
+        grams += [f'p:{a} {b}' for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f' {word} '
+        for n in CHAR_NGRAMS:
+            grams += [f'c:{padded[i:i + n]}' for i in range(len(padded) - n + 1)]
+    return Counter(zlib.crc32(gram.encode()) & (DIMENSIONS - 1) for gram in grams)
+
+
+def _weighted(counts, idf):
+    buckets = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * idf[buckets]
+    return buckets, values
+
+
+def _idf(documents):
+    document_frequency = np.zeros(DIMENSIONS, dtype=np.float32)
+    for counts in documents:
+        document_frequency[list(counts)] += 1
+    return (np.log((1 + len(documents)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+
+class IntentModel:
+    def __init__(self, examples=TRAINING, min_score=MIN_SCORE):
+        documents, labels = [], []
+        for intent, messages in examples.items():
+            for message in messages:
+                documents.append(features(message))
+                labels.append(intent)
+        self.intents = sorted(examples)
+        self.labels = np.array([self.intents.index(label) for label in labels])
+        self.min_score = min_score
+        self.idf = _idf(documents)
+        # Stored feature-major so a message's buckets select whole rows.
+        self.matrix = np.zeros((DIMENSIONS, len(documents)), dtype=np.float32)
+        for column, counts in enumerate(documents):
+            buckets, values = _weighted(counts, self.idf)
+            self.matrix[buckets, column] = values / np.linalg.norm(values)
+
+    def scores(self, text):
+        """Best cosine similarity per intent, in :attr:`intents` order."""
+        counts = features(text)
+        per_intent = np.zeros(len(self.intents), dtype=np.float32)
+        if not counts:
+            return per_intent
+        buckets, values = _weighted(counts, self.idf)
+        similarity = (values / np.linalg.norm(values)) @ self.matrix[buckets]
+        np.maximum.at(per_intent, self.labels, similarity)
+        return per_intent
+
+    def classify(self, text):
+        """Return ``(intent, score)``; ``intent`` is ``None`` below ``min_score``."""
+        scores = self.scores(text)
+        best = int(scores.argmax())
+        score = float(scores[best])
+        return (self.intents[best] if score >= self.min_score else None), score
+
+
+class NameIndex:
+    """Finds which of a set of names a message mentions.
+
+    ``entries`` are ``(key, name)`` pairs. A name is mentioned when the
+    message contains most of its (IDF-weighted) features, so "book a
+    comedy show" mentions "Comedy" and "the hamlet tickets" mentions
+    "Hamlet". Of equally good matches the longest name wins.
+    """
+
+    def __init__(self, entries, min_score=MIN_NAME_SCORE):
+        entries = list(entries)
+        self.keys = [key for key, _ in entries]
+        self.min_score = min_score
+        documents = [features(name, pairs=False) for _, name in entries]
+        self.idf = _idf(documents)
+        self._sizes = np.array([len(counts) for counts in documents])
+        rows, buckets, weights = [], [], []
+        for row, counts in enumerate(documents):
+            document_buckets, values = _weighted(counts, self.idf)
+            rows.append(np.full(len(document_buckets), row))
+            buckets.append(document_buckets)
+            weights.append(values / values.sum())
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        buckets = np.concatenate(buckets) if buckets else np.zeros(0, dtype=np.int64)
+        weights = np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32)
+        # Postings sorted by bucket: rows and weights of every name per feature.
+        order = np.argsort(buckets, kind='stable')
+        self._rows, self._weights = rows[order], weights[order]
+        self._starts = np.searchsorted(buckets[order], np.arange(DIMENSIONS + 1))
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def match(self, text):
+        """Return ``(key, score)`` of the best mentioned name, or ``None``."""
+        if not self.keys:
+            return None
+        present = np.fromiter(features(text, pairs=False).keys(), dtype=np.int64)
+        starts, ends = self._starts[present], self._starts[present + 1]
+        postings = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] or [[]]).astype(np.int64)
+        if not len(postings):
+            return None
+        scores = np.bincount(self._rows[postings], weights=self._weights[postings], minlength=len(self.keys))
+        candidates = np.flatnonzero(scores >= scores.max() - 1e-6)
+        best = int(candidates[self._sizes[candidates].argmax()])
+        if scores[best] < self.min_score:
+            return None
+        return self.keys[best], float(scores[best])
+
+
+class CatalogNames:
+    """A :class:`NameIndex` of the categories and recently indexed events
+    of ``catalog``, rebuilt at most every ``ttl`` seconds."""
+
+    def __init__(self, catalog, ttl=60.0, max_events=2000):
+        self.catalog = catalog
+        self.ttl = ttl
+        # Bounds the rebuild, which runs on the event loop.
+        self.max_events = max_events
+        self._index = None
+
+    async def match(self, text):
+        """Return ``(('category' or 'event', id), score)`` or ``None``."""
+        if self._index is None or time.monotonic() - self._index.built_at > self.ttl:
+            entries = [(('category', category['id']), category['name'])
+                       for category in await self.catalog.all_categories()]
+            entries += [(('event', record.id), record.name)
+                        for record in self.catalog.index.records()[-self.max_events:]]
+            self._index = NameIndex(entries)
+        return self._index.match(text)
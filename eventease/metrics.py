@@ -0,0 +1,369 @@
+"""Counters, gauges and histograms in the Prometheus text format.
+
+A minimal, dependency-free take on ``prometheus_client``: metrics are
+declared once at module level, register themselves in :data:`REGISTRY`, and
+:func:`render` produces the text a Prometheus server scrapes. Updating a
+metric costs a dict lookup and an uncontended lock (about a
+microsecond), so instrumentation stays on in production. Values are per
+process; with several workers, scrape each of them.
+
+For the bots, :func:`instrument_application` times every handler and
+reports open conversations, and :func:`serve_from_env` starts a small
+listener that serves ``/metrics`` (``BOT_METRICS_PORT``, off by default,
+on ``BOT_METRICS_LISTEN``, ``127.0.0.1`` by default). Django serves the
+same registry itself (see ``event_management_system_app.metrics``).
+"""
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import os
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; from a cache hit to a slow page.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _sample(name, labelnames, values, value, extra=()):
+    pairs = [*zip(labelnames, values), *extra]
+    labels = ','.join(f'{label}="{_escape(v)}"' for label, v in pairs)
+    return f'{name}{{{labels}}} {_number(value)}' if labels else f'{name} {_number(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def render(registry=REGISTRY):
+    return registry.render()
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """The child for one combination of label values; keep it around
+        on hot paths to skip the lookup."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} takes labels {self.labelnames}, got {values}')
+            with self._lock:
+                child = self._children.setdefault(tuple(map(str, values)), self._child())
+                self._children.setdefault(values, child)
+        return child
+
+    def _items(self):
+        with self._lock:
+            # Children are also stored under their unconverted label values.
+            return list({id(child): (key, child) for key, child in self._children.items()}.values())
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    type = 'counter'
+    _child = _Value
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        return [_sample(self.name, self.labelnames, key, child.value) for key, child in self._items()]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down; or, with ``function``, one read at
+    scrape time: ``function()`` returns a number, or ``{label values:
+    number}`` for a labelled gauge."""
+
+    type = 'gauge'
+    _child = _Value
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, function=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.function = function
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def samples(self):
+        if self.function is None:
+            values = {key: child.value for key, child in self._items()}
+        else:
+            try:
+                values = self.function()
+            except Exception:
+                logger.exception(f"Reading {self.name} failed")
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        return [_sample(self.name, self.labelnames, key, value) for key, value in values.items()]
+
+
+class _Timer:
+    __slots__ = ('_child', '_started')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """``with histogram.labels(...).time():`` observes the block's duration."""
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        lines = []
+        for key, child in self._items():
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                lines.append(_sample(f'{self.name}_bucket', self.labelnames, key, cumulative, [('le', _number(bound))]))
+            lines.append(_sample(f'{self.name}_sum', self.labelnames, key, total))
+            lines.append(_sample(f'{self.name}_count', self.labelnames, key, cumulative))
+        return lines
+
+
+# Bot metrics
+
+HANDLER_SECONDS = Histogram(
+    'eventease_bot_handler_duration_seconds', 'Time handlers take to process an update.', ['handler'],
+)
+HANDLER_ERRORS = Counter('eventease_bot_handler_errors_total', 'Handlers that raised.', ['handler'])
+CACHE_REQUESTS = Counter(
+    'eventease_bot_cache_requests_total', 'Bot catalog cache lookups by result (hit, stale or miss).',
+    ['cache', 'result'],
+)
+CATALOG_SECONDS = Histogram(
+    'eventease_catalog_request_duration_seconds', 'Catalog API requests made by the bot.',
+    ['method', 'endpoint', 'status'],
+)
+CATALOG_CHANGES = Counter(
+    'eventease_bot_catalog_changes_total', 'Catalog changes applied from the change feed.', ['kind', 'action'],
+)
+TELEGRAM_SECONDS = Histogram(
+    'eventease_telegram_request_duration_seconds', 'Bot API requests, by Bot API method.', ['method', 'status'],
+)
+TELEGRAM_SEND_QUEUE = Gauge('eventease_telegram_send_queue', 'Bot API requests waiting for their turn to be sent.')
+TELEGRAM_SENDS = Counter(
+    'eventease_telegram_sends_total', 'Queued Bot API requests by outcome (sent, coalesced, retried or failed).',
+    ['outcome'],
+)
+
+# Application -> [(ConversationHandler, {state: name})]
+_applications = weakref.WeakKeyDictionary()
+
+
+def _conversation_counts():
+    counts = {}
+    for conversations in list(_applications.values()):
+        for handler, names in conversations:
+            # The handler's (private) mapping of conversation key to state.
+            for state in list(handler._conversations.values()):
+                name = names.get(state, str(state)) if isinstance(state, int) else 'pending'
+                key = (handler.name or 'conversation', name)
+                counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+CONVERSATIONS = Gauge(
+    'eventease_bot_conversations', 'Conversations in progress, by state.', ['conversation', 'state'],
+    function=_conversation_counts,
+)
+UPDATE_QUEUE = Gauge(
+    'eventease_bot_update_queue_size', 'Updates waiting to be processed.',
+    function=lambda: sum(application.update_queue.qsize() for application in list(_applications)),
+)
+
+
+def timed(callback, name=None):
+    """Wrap a handler callback to record its duration and failures."""
+    if getattr(callback, '_timed', False):
+        return callback
+    name = name or callback.__name__
+    duration, errors = HANDLER_SECONDS.labels(name), HANDLER_ERRORS.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - started)
+
+    wrapper._timed = True
+    return wrapper
+
+
+def walk_handlers(handler):
+    """``handler`` and, for a conversation, every handler nested in it."""
+    yield handler
+    if hasattr(handler, 'states'):
+        for child in [*handler.entry_points, *handler.fallbacks, *(h for hs in handler.states.values() for h in hs)]:
+            yield from walk_handlers(child)
+
+
+def instrument_application(application, state_names=None):
+    """Time every handler of ``application`` by callback name, and report
+    its open conversations (states named by ``state_names``) and queue."""
+    conversations = _applications.setdefault(application, [])
+    for group in application.handlers.values():
+        for top in group:
+            for handler in walk_handlers(top):
+                if hasattr(handler, 'states'):
+                    conversations.append((handler, dict(state_names or {})))
+                elif hasattr(handler, 'callback'):
+                    handler.callback = timed(handler.callback)
+
+
+def endpoint(path):
+    """A path with its numeric segments replaced, for use as a label."""
+    return '/'.join('{id}' if part.isdigit() else part for part in path.split('/'))
+
+
+# Listener
+
+async def _serve(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+            status, body = '200 OK', render().encode()
+        else:
+            status, body = '404 Not Found', b''
+        writer.write(
+            f'HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=9100):
+    """Serve ``GET /metrics`` on ``host:port``; returns the ``asyncio.Server``."""
+    return await asyncio.start_server(_serve, host, port)
+
+
+async def serve_from_env():
+    """Start the listener if ``BOT_METRICS_PORT`` is set; returns the server or ``None``."""
+    port = os.environ.get('BOT_METRICS_PORT')
+    if not port:
+        return None
+    server = await serve(os.environ.get('BOT_METRICS_LISTEN', '127.0.0.1'), int(port))
+    logger.info(f"Serving metrics on port {port}")
+    return server
@@ -0,0 +1,338 @@
+"""Conversation state and user data kept outside the bot process.
+
+:class:`StatePersistence` is a ``BasePersistence`` that stores the states
+of persistent ``ConversationHandler``\\ s and a whitelist of small
+``user_data`` keys (IDs, cursors, what the user typed) as JSON. Anything
+else in ``user_data``, and all of ``bot_data``, stays in memory only, so a
+stored user costs a few hundred bytes no matter what handlers cache.
+
+The application hands over changed data every ``update_interval`` seconds;
+all changes of one round are written together in a single transaction
+(SQLite) or one command per hash (Redis).
+
+Backends:
+
+* :class:`SQLitePersistence` -- a local file; survives restarts.
+* :class:`RedisPersistence` -- any ``redis.asyncio``-compatible client, or
+  :class:`MemoryRedis` in tests and local runs. It is ``shared``: every
+  update reloads the user's data and conversation state first, and writes
+  its changes before it is done, so several bot workers can serve the same
+  users (see :func:`share_conversations`).
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+
+from telegram import Update
+from telegram.ext import BasePersistence, PersistenceInput, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+DEFAULT_UPDATE_INTERVAL = 1.0
+
+
+def _conversation_table(name):
+    return f'conversation:{name}'
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class StatePersistence(BasePersistence, ABC):
+    """Base class of the backends; subclasses implement ``_load``,
+    ``_load_all`` and ``_write``."""
+
+    shared = False
+
+    def __init__(self, user_keys, update_interval=DEFAULT_UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.user_keys = frozenset(user_keys)
+        self._pending = {}  # (table, key) -> JSON text, or None to delete
+        self._writing = None  # the task that will take the next batch
+        self._writes = set()  # batches being written
+
+    # Backend interface
+
+    @abstractmethod
+    async def _load(self, table, key):
+        """The stored value of ``key`` in ``table``, or ``None``."""
+
+    @abstractmethod
+    async def _load_all(self, table):
+        """``{key: value}`` of everything stored in ``table``."""
+
+    @abstractmethod
+    async def _write(self, changes):
+        """Apply ``{(table, key): value or None}`` in one batch."""
+
+    # Batching
+
+    def _stage(self, table, key, value):
+        self._pending[(table, key)] = value
+        # The application updates every changed user and conversation
+        # concurrently; writing on the next loop iteration batches them.
+        if self._writing is None:
+            self._writing = asyncio.get_running_loop().create_task(self._write_pending())
+            self._writes.add(self._writing)
+            self._writing.add_done_callback(self._writes.discard)
+
+    async def _write_pending(self):
+        await asyncio.sleep(0)
+        changes, self._pending = self._pending, {}
+        self._writing = None
+        if changes:
+            try:
+                await self._write(changes)
+            except Exception:
+                logger.exception("Writing bot state failed, retrying with the next batch")
+                # Keep the batch unless newer changes replaced it.
+                self._pending = {**changes, **self._pending}
+
+    async def write_staged(self):
+        """Write every staged change now, after the batches in flight."""
+        # Earlier batches may still be in flight after _writing moved on.
+        while self._writes:
+            await asyncio.gather(*self._writes)
+        if self._pending:
+            changes, self._pending = self._pending, {}
+            await self._write(changes)
+
+    async def flush(self):
+        await self.write_staged()
+
+    # User data
+
+    def _small(self, data):
+        return {key: value for key, value in data.items() if key in self.user_keys}
+
+    async def get_user_data(self):
+        stored = await self._load_all(USER_DATA)
+        return {int(user_id): json.loads(value) for user_id, value in stored.items()}
+
+    async def update_user_data(self, user_id, data):
+        small = self._small(data)
+        self._stage(USER_DATA, str(user_id), json.dumps(small) if small else None)
+
+    async def drop_user_data(self, user_id):
+        self._stage(USER_DATA, str(user_id), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        if not self.shared or (USER_DATA, str(user_id)) in self._pending:
+            return
+        value = await self._load(USER_DATA, str(user_id))
+        stored = json.loads(value) if value else {}
+        for key in self.user_keys:
+            if key in stored:
+                user_data[key] = stored[key]
+            else:
+                user_data.pop(key, None)
+
+    # Conversations
+
+    async def get_conversations(self, name):
+        stored = await self._load_all(_conversation_table(name))
+        return {tuple(json.loads(key)): json.loads(value) for key, value in stored.items()}
+
+    async def update_conversation(self, name, key, new_state):
+        self._stage(
+            _conversation_table(name), json.dumps(list(key)),
+            None if new_state is None else json.dumps(new_state),
+        )
+
+    async def load_conversation(self, name, key):
+        """Return the stored state for ``key``, or ``None`` if it has none."""
+        table, key = _conversation_table(name), json.dumps(list(key))
+        if (table, key) in self._pending:
+            value = self._pending[(table, key)]
+        else:
+            value = await self._load(table, key)
+        return None if value is None else json.loads(value)
+
+    # Not stored
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+
+class SQLitePersistence(StatePersistence):
+    def __init__(self, path, user_keys, update_interval=DEFAULT_UPDATE_INTERVAL):
+        super().__init__(user_keys, update_interval)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS bot_state ('
+            'tbl TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (tbl, key))'
+        )
+        self._lock = threading.Lock()
+
+    def _run(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    async def _load(self, table, key):
+        rows = await asyncio.to_thread(self._run, 'SELECT value FROM bot_state WHERE tbl = ? AND key = ?', (table, key))
+        return rows[0][0] if rows else None
+
+    async def _load_all(self, table):
+        rows = await asyncio.to_thread(self._run, 'SELECT key, value FROM bot_state WHERE tbl = ?', (table,))
+        return dict(rows)
+
+    def _write_batch(self, changes):
+        upserts = [(table, key, value) for (table, key), value in changes.items() if value is not None]
+        deletes = [(table, key) for (table, key), value in changes.items() if value is None]
+        with self._lock:
+            with self._db:
+                self._db.execute('BEGIN')
+                self._db.executemany(
+                    'INSERT INTO bot_state (tbl, key, value) VALUES (?, ?, ?) '
+                    'ON CONFLICT (tbl, key) DO UPDATE SET value = excluded.value',
+                    upserts,
+                )
+                self._db.executemany('DELETE FROM bot_state WHERE tbl = ? AND key = ?', deletes)
+
+    async def _write(self, changes):
+        await asyncio.to_thread(self._write_batch, changes)
+
+    async def flush(self):
+        await super().flush()
+        with self._lock:
+            self._db.close()
+
+
+class RedisPersistence(StatePersistence):
+    """Stores each table as a Redis hash named ``<prefix><table>``."""
+
+    shared = True
+
+    def __init__(self, client, user_keys, prefix='eventease:', update_interval=DEFAULT_UPDATE_INTERVAL):
+        super().__init__(user_keys, update_interval)
+        self.client = client
+        self.prefix = prefix
+
+    async def _load(self, table, key):
+        return _decode(await self.client.hget(self.prefix + table, key))
+
+    async def _load_all(self, table):
+        stored = await self.client.hgetall(self.prefix + table)
+        return {_decode(key): _decode(value) for key, value in stored.items()}
+
+    async def _write(self, changes):
+        upserts, deletes = {}, {}
+        for (table, key), value in changes.items():
+            if value is None:
+                deletes.setdefault(table, []).append(key)
+            else:
+                upserts.setdefault(table, {})[key] = value
+        for table, mapping in upserts.items():
+            await self.client.hset(self.prefix + table, mapping=mapping)
+        for table, keys in deletes.items():
+            await self.client.hdel(self.prefix + table, *keys)
+
+
+class MemoryRedis:
+    """In-process stand-in for the few ``redis.asyncio`` hash commands used above."""
+
+    def __init__(self):
+        self.hashes = {}
+
+    async def hget(self, name, key):
+        return self.hashes.get(name, {}).get(key)
+
+    async def hgetall(self, name):
+        return dict(self.hashes.get(name, {}))
+
+    async def hset(self, name, key=None, value=None, mapping=None):
+        fields = dict(mapping or {})
+        if key is not None:
+            fields[key] = value
+        self.hashes.setdefault(name, {}).update(fields)
+        return len(fields)
+
+    async def hdel(self, name, *keys):
+        stored = self.hashes.get(name, {})
+        return sum(stored.pop(key, None) is not None for key in keys)
+
+
+def share_conversations(application, *handlers):
+    """Reload each update's conversation state from a shared store before
+    ``handlers`` look at it, and write the update's changes back once they
+    are done, so a conversation can move between workers.
+
+    ``ConversationHandler`` only reads persisted states at startup, so this
+    refreshes its (private) state mapping from a handler in group -1. The
+    application only hands changes over every ``update_interval`` seconds,
+    so a handler in the last group does that for each update and waits for
+    the write. Updates stopped early (``ApplicationHandlerStop``) and states
+    of non-blocking handlers still pending are left to the interval.
+    """
+    persistence = application.persistence
+
+    async def refresh(update, context):
+        for handler in handlers:
+            try:
+                key = handler._get_key(update)
+            except RuntimeError:
+                continue
+            state = await persistence.load_conversation(handler.name, key)
+            # Untracked, so the refresh itself is not written back.
+            conversations = handler._conversations
+            if state is None:
+                conversations.data.pop(key, None)
+            else:
+                conversations.update_no_track({key: state})
+
+    async def write_through(update, context):
+        if update.effective_user:
+            application.mark_data_for_update_persistence(user_ids=update.effective_user.id)
+        await application.update_persistence()
+        await persistence.write_staged()
+
+    application.add_handler(TypeHandler(Update, refresh), group=-1)
+    application.add_handler(TypeHandler(Update, write_through), group=sys.maxsize)
+
+
+def persistence_from_env(user_keys):
+    """Redis when ``BOT_STATE_REDIS_URL`` is set, otherwise an SQLite file
+    at ``BOT_STATE_PATH``."""
+    update_interval = float(os.environ.get('BOT_STATE_UPDATE_INTERVAL', DEFAULT_UPDATE_INTERVAL))
+    redis_url = os.environ.get('BOT_STATE_REDIS_URL')
+    if redis_url:
+        import redis.asyncio
+
+        return RedisPersistence(redis.asyncio.from_url(redis_url), user_keys, update_interval=update_interval)
+    path = os.environ.get('BOT_STATE_PATH', 'bot_state.sqlite3')
+    return SQLitePersistence(path, user_keys, update_interval=update_interval)
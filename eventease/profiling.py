@@ -0,0 +1,370 @@
+"""Sampled profiles of individual requests and bot handlers.
+
+A :class:`Profiler` picks a random ``sample_rate`` fraction of the units
+of work it is told about. While a picked unit runs, a background thread
+records the stack of the thread running it every ``interval`` seconds.
+That is wall-clock sampling, so time spent waiting on the database or
+the network shows up too. Units that are not picked only pay for a
+random number and two clock reads.
+
+A finished profile is written to ``directory`` as two files:
+
+* ``<id>.json`` holds what ran, how long it took, the SQL it issued with
+  timings, and the sample counts;
+* ``<id>.folded`` holds the stacks in collapsed form, one
+  ``frame;frame;... count`` line per stack, for flamegraph.pl or
+  speedscope. :func:`flamegraph_svg` draws one directly.
+
+Only the newest ``max_profiles`` are kept. Any unit slower than
+``slow_threshold`` seconds is logged to ``eventease.slow``, sampled or
+not.
+
+For the bots, :func:`profile_application` profiles every handler. It is
+configured by ``BOT_PROFILE_SAMPLE_RATE``, ``BOT_PROFILE_DIR``,
+``BOT_PROFILE_INTERVAL`` and ``BOT_SLOW_HANDLER_THRESHOLD``, and off
+unless the sample rate or the threshold is set. Django has
+``event_management_system_app.profiling``; point both at one directory to
+browse the bot's profiles in the admin as well. The event loop thread is
+shared, so a handler's profile also shows the other handlers it waited
+behind.
+"""
+import asyncio
+import functools
+import html
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+slow_logger = logging.getLogger('eventease.slow')
+
+PROFILE_ID = re.compile(r'^\d{8}-\d{12}-[0-9a-f]{6}$')
+DEFAULT_INTERVAL = 0.005
+DEFAULT_SLOW_THRESHOLD = 1.0
+DEFAULT_MAX_PROFILES = 200
+
+# Longest first, so frames are labelled by their shortest import path.
+_PATH_PREFIXES = sorted({os.path.join(os.path.abspath(p), '') for p in sys.path if p}, key=len, reverse=True)
+
+
+@functools.lru_cache(maxsize=8192)
+def _label(code):
+    filename = code.co_filename
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    return f'{code.co_qualname} ({filename}:{code.co_firstlineno})'
+
+
+class _Sampler(threading.Thread):
+    """One daemon thread sampling the threads of every running profile."""
+
+    def __init__(self, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.runs = set()
+        self.active = threading.Event()
+
+    def add(self, run):
+        with self.lock:
+            self.runs.add(run)
+            self.active.set()
+
+    def remove(self, run):
+        with self.lock:
+            self.runs.discard(run)
+            if not self.runs:
+                self.active.clear()
+
+    def run(self):
+        while True:
+            self.active.wait()
+            frames = sys._current_frames()
+            with self.lock:
+                for run in self.runs:
+                    frame = frames.get(run.thread_id)
+                    if frame is not None:
+                        run.add_sample(frame)
+            del frames
+            time.sleep(self.interval)
+
+
+class Run:
+    """One unit of work; call :meth:`stop` when it is done, then
+    :meth:`report` (after :meth:`describe`, if :attr:`noteworthy`)."""
+
+    def __init__(self, profiler, kind, name, sampled, thread_id):
+        self.profiler = profiler
+        self.kind = kind
+        self.name = name
+        self.sampled = sampled
+        self.thread_id = thread_id
+        self.samples = {}  # stack (code objects, outermost first) -> count
+        self.queries = []  # (sql, seconds)
+        self.details = {}
+        self.duration = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+
+    def add_sample(self, frame):
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        stack = tuple(reversed(codes))
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def record_query(self, execute, sql, params, many, context):
+        """A ``connection.execute_wrapper`` recording each statement's time."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def stop(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+            if self.sampled:
+                self.profiler.sampler.remove(self)
+        return self
+
+    def describe(self, name=None, **details):
+        """Name the run and add details to show with it."""
+        if name is not None:
+            self.name = name
+        self.details.update(details)
+        return self
+
+    @property
+    def noteworthy(self):
+        """Whether :meth:`report` will save or log anything."""
+        return self.sampled or self.duration >= self.profiler.slow_threshold
+
+    def report(self):
+        """Save the profile if sampled and log the run if slow; returns the
+        profile ID or ``None``."""
+        profile_id = self.profiler.save(self) if self.sampled else None
+        if self.duration >= self.profiler.slow_threshold:
+            details = ' '.join(f'{key}={value}' for key, value in self.details.items())
+            slow_logger.warning(
+                f"Slow {self.kind} {self.name}: {self.duration * 1000:.0f} ms {details}"
+                + (f" profile={profile_id}" if profile_id else '')
+            )
+        return profile_id
+
+
+class Profiler:
+    def __init__(self, directory, sample_rate=0.0, interval=DEFAULT_INTERVAL,
+                 slow_threshold=DEFAULT_SLOW_THRESHOLD, max_profiles=DEFAULT_MAX_PROFILES):
+        self.directory = str(directory)
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.max_profiles = max_profiles
+        self._sampler = None
+        self._lock = threading.Lock()
+
+    @property
+    def sampler(self):
+        if self._sampler is None:
+            with self._lock:
+                if self._sampler is None:
+                    self._sampler = _Sampler(self.interval)
+                    self._sampler.start()
+        return self._sampler
+
+    def begin(self, kind, name=None, sample=None):
+        """Start a :class:`Run` in the current thread; ``sample`` overrides
+        the random pick."""
+        sampled = random.random() < self.sample_rate if sample is None else sample
+        run = Run(self, kind, name, sampled, threading.get_ident())
+        if sampled:
+            self.sampler.add(run)
+        return run
+
+    def save(self, run):
+        # Sortable by time, to the microsecond.
+        profile_id = f'{datetime.now():%Y%m%d-%H%M%S%f}-{secrets.token_hex(3)}'
+        folded = {}
+        for stack, count in run.samples.items():
+            line = ';'.join(map(_label, stack))
+            folded[line] = folded.get(line, 0) + count
+        profile = {
+            'id': profile_id,
+            'kind': run.kind,
+            'name': run.name,
+            'started_at': datetime.fromtimestamp(run.started_at, timezone.utc).isoformat(),
+            'duration': run.duration,
+            'interval': self.interval,
+            'samples': sum(folded.values()),
+            'details': run.details,
+            'queries': [{'sql': sql, 'seconds': seconds} for sql, seconds in run.queries],
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile_id)
+        with open(path + '.folded', 'w') as output:
+            output.writelines(f'{line} {count}\n' for line, count in folded.items())
+        with open(path + '.json', 'w') as output:
+            json.dump(profile, output)
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        ids = sorted(
+            name[:-5] for name in os.listdir(self.directory) if name.endswith('.json') and PROFILE_ID.match(name[:-5])
+        )
+        for old in ids[:max(0, len(ids) - self.max_profiles)]:
+            for suffix in ('.json', '.folded'):
+                try:
+                    os.remove(os.path.join(self.directory, old + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+# Reading profiles back
+
+def list_profiles(directory):
+    """Summaries of the saved profiles, newest first."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in sorted(names, reverse=True):
+        if name.endswith('.json') and PROFILE_ID.match(name[:-5]):
+            profile = load_profile(directory, name[:-5])
+            if profile is not None:
+                profile['query_count'] = len(profile.pop('queries'))
+                profiles.append(profile)
+    return profiles
+
+
+def load_profile(directory, profile_id):
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(directory, profile_id + '.json')) as stored:
+            return json.load(stored)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def load_folded(directory, profile_id):
+    """``{stack line: count}`` of a saved profile, or ``None``."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(directory, profile_id + '.folded')) as stored:
+            return {line: int(count) for line, count in (row.rsplit(' ', 1) for row in stored if row.strip())}
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def flamegraph_svg(folded, width=1200, row_height=16, min_width=0.5):
+    """An SVG flame graph of collapsed stacks; hover a frame for its share."""
+    root = {'count': 0, 'children': {}}
+    for line, count in folded.items():
+        node = root
+        node['count'] += count
+        for frame in line.split(';'):
+            node = node['children'].setdefault(frame, {'count': 0, 'children': {}})
+            node['count'] += count
+    total = root['count'] or 1
+    scale = width / total
+    rects, depth = [], 0
+
+    def draw(node, x, level):
+        nonlocal depth
+        for frame, child in sorted(node['children'].items()):
+            child_width = child['count'] * scale
+            if child_width >= min_width:
+                depth = max(depth, level + 1)
+                rects.append((x, level, child_width, frame, child['count']))
+                draw(child, x, level + 1)
+            x += child_width
+
+    draw(root, 0.0, 0)
+    height = (depth + 1) * row_height
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+    ]
+    for x, level, rect_width, frame, count in rects:
+        y = height - (level + 1) * row_height
+        # Warm colours, stable per frame.
+        hue = zlib.crc32(frame.encode()) % 50
+        label = html.escape(frame)
+        chars = int(rect_width / 7)
+        text = html.escape(frame[:chars - 2] + '..' if len(frame) > chars else frame) if chars > 3 else ''
+        parts.append(
+            f'<g><title>{label}: {count} samples ({count / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{rect_width:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue},85%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{text}</text></g>'
+        )
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+# Bots
+
+def profiled(callback, profiler, name=None):
+    """Wrap a handler callback to profile it with ``profiler``."""
+    if getattr(callback, '_profiled', False):
+        return callback
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        run = profiler.begin('handler', name)
+        try:
+            return await callback(update, context)
+        finally:
+            if run.stop().noteworthy:
+                run.describe(user=update.effective_user.id if update.effective_user else None)
+                if run.sampled:
+                    await asyncio.to_thread(run.report)
+                else:
+                    run.report()
+
+    wrapper._profiled = True
+    return wrapper
+
+
+def profiler_from_env():
+    """A profiler configured from the environment, or ``None`` if neither
+    sampling nor the slow handler log is enabled."""
+    if not (os.environ.get('BOT_PROFILE_SAMPLE_RATE') or os.environ.get('BOT_SLOW_HANDLER_THRESHOLD')):
+        return None
+    return Profiler(
+        os.environ.get('BOT_PROFILE_DIR', 'profiles'),
+        sample_rate=float(os.environ.get('BOT_PROFILE_SAMPLE_RATE', 0)),
+        interval=float(os.environ.get('BOT_PROFILE_INTERVAL', DEFAULT_INTERVAL)),
+        slow_threshold=float(os.environ.get('BOT_SLOW_HANDLER_THRESHOLD', DEFAULT_SLOW_THRESHOLD)),
+    )
+
+
+def profile_application(application, profiler=None):
+    """Profile every handler callback of ``application``, if a profiler
+    is given or configured; returns the profiler."""
+    from .metrics import walk_handlers
+
+    profiler = profiler or profiler_from_env()
+    if profiler is None:
+        return None
+    for group in application.handlers.values():
+        for top in group:
+            for handler in walk_handlers(top):
+                if hasattr(handler, 'callback') and not hasattr(handler, 'states'):
+                    handler.callback = profiled(handler.callback, profiler, getattr(handler.callback, '__name__', None))
+    return profiler
@@ -0,0 +1,58 @@
+"""Compact in-memory records of catalog API objects.
+
+A bot process holds each listed event once, in the shared
+:class:`~eventease.cache.EventIndex`, however many users are browsing it.
+Records use ``__slots__`` and intern the strings that repeat across events.
+"""
+import sys
+from dataclasses import dataclass, field
+
+
+_INTERNED = ('category', 'location', 'organizer')
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True)
+class EventRecord:
+    id: int
+    name: str
+    category: str | None = None
+    category_id: int | None = None
+    start_date: str | None = None
+    end_date: str | None = None
+    priority: int | None = None
+    participants: int | None = None
+    description: str | None = None
+    location: str | None = None
+    organizer: str | None = None
+    # Bumped by every update(), so renders of the record can be reused until it changes.
+    revision: int = field(default=0, compare=False)
+
+    @classmethod
+    def from_api(cls, data):
+        """Build a record from an API event dict; fields it lacks stay ``None``."""
+        return cls(
+            data['id'],
+            data['name'],
+            _intern(data.get('category')),
+            data.get('category_id'),
+            data.get('start_date'),
+            data.get('end_date'),
+            data.get('priority'),
+            data.get('participants'),
+            data.get('description'),
+            _intern(data.get('location')),
+            _intern(data.get('organizer')),
+        )
+
+    def update(self, data):
+        """Set the fields present in the API dict ``data``, in place, so
+        every page listing this record shows the change."""
+        for name in self.__slots__:
+            if name in data:
+                value = data[name]
+                setattr(self, name, _intern(value) if name in _INTERNED else value)
+        self.revision += 1
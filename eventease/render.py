@@ -0,0 +1,48 @@
+"""Rendered bot messages and keyboards, built once and reused.
+
+Handlers render catalog pages and event records into message texts and
+``InlineKeyboardMarkup`` objects (which are immutable, so one object can be
+sent to any number of users). :class:`RenderCache` keeps the results keyed
+by template and by the object rendered, in the version the render saw.
+
+The :class:`~eventease.cache.CatalogCache` replaces a page whenever its
+content may have changed, so a page object is its own version. Records are
+updated in place and count their updates in ``revision``. A render is
+therefore reused until its page is reloaded or its record changes, and
+every user browsing it meanwhile gets the same objects. Renders that never
+change, like the main menu, are module constants in the bots instead.
+"""
+from collections import OrderedDict
+
+from .metrics import CACHE_REQUESTS
+
+
+class RenderCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # (template, id(source)) -> (source, revision, value)
+        self._hits, self._misses = (CACHE_REQUESTS.labels('renders', result) for result in ('hit', 'miss'))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, template, source, build, revision=0):
+        """What ``build()`` renders from ``source``, a cached page or record,
+        with ``template``; built again once ``source`` is replaced or its
+        ``revision`` changes."""
+        key = (template, id(source))
+        entry = self._entries.get(key)
+        # Entries hold their source, so its id() cannot be reused meanwhile.
+        if entry is not None and entry[0] is source and entry[1] == revision:
+            self._entries.move_to_end(key)
+            self._hits.inc()
+            return entry[2]
+        self._misses.inc()
+        value = build()
+        if self.maxsize:
+            self._entries[key] = (source, revision, value)
+            self._entries.move_to_end(key)
+            # Renders of replaced pages are never asked for again and age out.
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
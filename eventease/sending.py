@@ -0,0 +1,294 @@
+"""Outbound Bot API scheduling: rate limits, coalescing and flood retries.
+
+:class:`SendScheduler` is the ``Application``'s rate limiter (set by
+:func:`eventease.webhook.application_builder`), so every message the
+handlers send or edit goes through it; handlers keep calling
+``reply_text``/``edit_message_text`` and simply wait their turn.
+
+* Token buckets: one for the bot (Telegram allows about 30 messages a
+  second) and one per chat (about one a second in a private chat, 20 a
+  minute in a group), each with a small burst.
+* Coalescing: an edit of a message that still has an edit waiting replaces
+  that edit, so only the last one is sent; every caller gets its result.
+* Priority: calls made with ``rate_limit_args={'priority': HIGH}``, like
+  booking confirmations, go before waiting ``NORMAL`` ones.
+* Flood control: a 429 (``RetryAfter``) pauses all sending for the time
+  Telegram asks plus a growing backoff, then the request is retried, up to
+  ``max_retries`` times.
+
+Requests outside any chat (``getMe``, ``answerCallbackQuery``, webhook
+calls) are not queued.
+
+Settings, read from the environment by :meth:`SendScheduler.from_env`:
+``BOT_SEND_RATE`` (messages a second for the bot, default 30),
+``BOT_CHAT_SEND_RATE`` (per private chat, default 1) and
+``BOT_GROUP_SEND_RATE`` (per group, default 20 a minute).
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+import warnings
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from telegram.warnings import PTBDeprecationWarning
+
+from .metrics import TELEGRAM_SEND_QUEUE, TELEGRAM_SENDS
+
+logger = logging.getLogger(__name__)
+
+HIGH, NORMAL, LOW = 0, 1, 2
+
+DEFAULT_RATE = 30.0
+DEFAULT_CHAT_RATE = 1.0
+DEFAULT_GROUP_RATE = 20 / 60
+DEFAULT_CHAT_BURST = 3
+DEFAULT_MAX_RETRIES = 3
+# Added to Telegram's retry_after, doubling with every retry of a request.
+BACKOFF = 0.5
+# How long shutdown waits for queued messages to go out.
+DRAIN_TIMEOUT = 5.0
+COALESCED_ENDPOINTS = frozenset({
+    'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup', 'editMessageMedia',
+})
+
+_SENT, _COALESCED, _RETRIED, _FAILED = (
+    TELEGRAM_SENDS.labels(outcome) for outcome in ('sent', 'coalesced', 'retried', 'failed')
+)
+
+
+def _retry_seconds(error):
+    with warnings.catch_warnings():
+        # An int now, a timedelta in a future major version.
+        warnings.simplefilter('ignore', PTBDeprecationWarning)
+        value = error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+class TokenBucket:
+    """``rate`` tokens a second, holding at most ``capacity``."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'chat', 'key', 'callback', 'args', 'kwargs', 'future', 'attempts', 'started')
+
+    def __init__(self, priority, seq, chat, key, callback, args, kwargs, future, attempts=0):
+        self.priority = priority
+        self.seq = seq
+        self.chat = chat
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = attempts
+        self.started = False
+
+
+class SendScheduler(BaseRateLimiter):
+    def __init__(self, rate=DEFAULT_RATE, chat_rate=DEFAULT_CHAT_RATE, group_rate=DEFAULT_GROUP_RATE,
+                 chat_burst=DEFAULT_CHAT_BURST, max_retries=DEFAULT_MAX_RETRIES, clock=time.monotonic):
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.clock = clock
+        self._global = TokenBucket(rate, max(1, rate), clock())
+        self._buckets = {}  # chat -> TokenBucket
+        self._queues = {}  # chat -> heap of (priority, seq, job)
+        self._edits = {}  # (endpoint, chat, message) -> waiting edit
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._pending = 0
+        self._sending = set()
+        self._dispatcher = None
+        self._wakeup = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            rate=float(os.environ.get('BOT_SEND_RATE', DEFAULT_RATE)),
+            chat_rate=float(os.environ.get('BOT_CHAT_SEND_RATE', DEFAULT_CHAT_RATE)),
+            group_rate=float(os.environ.get('BOT_GROUP_SEND_RATE', DEFAULT_GROUP_RATE)),
+        )
+
+    @property
+    def pending(self):
+        """Requests waiting to be sent."""
+        return self._pending
+
+    async def initialize(self):
+        if self._dispatcher is not None:
+            return  # The bot calls this on every initialize().
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is None:
+            return
+        deadline = self.clock() + DRAIN_TIMEOUT
+        while (self._pending or self._sending) and self.clock() < deadline:
+            await asyncio.sleep(0.05)
+        self._dispatcher.cancel()
+        for task in list(self._sending):
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._sending, return_exceptions=True)
+        for queue in self._queues.values():
+            for _, _, job in queue:
+                if not job.future.done():
+                    job.future.cancel()
+        self._queues.clear()
+        self._edits.clear()
+        TELEGRAM_SEND_QUEUE.dec(self._pending)
+        self._pending = 0
+        self._dispatcher = None
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat = data.get('chat_id', data.get('inline_message_id'))
+        if chat is None or self._dispatcher is None:
+            return await callback(*args, **kwargs)
+        priority = rate_limit_args.get('priority', NORMAL) if isinstance(rate_limit_args, dict) else NORMAL
+        key = (endpoint, chat, data.get('message_id')) if endpoint in COALESCED_ENDPOINTS else None
+        job = self._edits.get(key) if key else None
+        if job is not None:
+            # Not sent yet: send this edit in its place.
+            job.callback, job.args, job.kwargs = callback, args, kwargs
+            _COALESCED.inc()
+            if priority < job.priority:
+                job.priority = priority
+                heapq.heappush(self._queues[chat], (priority, job.seq, job))
+                self._wakeup.set()
+        else:
+            future = asyncio.get_running_loop().create_future()
+            job = _Job(priority, next(self._seq), chat, key, callback, args, kwargs, future)
+            self._push(job)
+        # Shielded: a caller giving up must not cancel the result for the
+        # others sharing a coalesced edit.
+        return await asyncio.shield(job.future)
+
+    def _push(self, job):
+        heapq.heappush(self._queues.setdefault(job.chat, []), (job.priority, job.seq, job))
+        if job.key:
+            self._edits[job.key] = job
+        self._pending += 1
+        TELEGRAM_SEND_QUEUE.inc()
+        self._wakeup.set()
+
+    def _bucket(self, chat, now):
+        bucket = self._buckets.get(chat)
+        if bucket is None:
+            # Group and channel chat IDs are negative.
+            group = isinstance(chat, int) and chat < 0
+            bucket = self._buckets[chat] = TokenBucket(
+                self.group_rate if group else self.chat_rate, self.chat_burst, now,
+            )
+        return bucket
+
+    def _next(self, now):
+        """The most urgent job whose chat may send now, or ``None`` and how
+        long until one may (``None``: until a new job arrives)."""
+        best, wait, idle = None, None, []
+        for chat, queue in self._queues.items():
+            while queue and queue[0][2].started:
+                heapq.heappop(queue)  # Superseded by a priority bump.
+            if not queue:
+                idle.append(chat)
+                continue
+            delay = self._bucket(chat, now).delay(now)
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+            elif best is None or queue[0][:2] < best[:2]:
+                best = queue[0]
+        for chat in idle:
+            del self._queues[chat]
+        if best is None:
+            return None, wait
+        heapq.heappop(self._queues[best[2].chat])
+        return best[2], None
+
+    def _forget_idle_chats(self, now):
+        for chat in [chat for chat, bucket in self._buckets.items() if chat not in self._queues and bucket.full(now)]:
+            del self._buckets[chat]
+
+    async def _sleep(self, seconds):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self):
+        while True:
+            now = self.clock()
+            wait = max(self._paused_until - now, self._global.delay(now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            job, wait = self._next(now)
+            if job is None:
+                self._forget_idle_chats(now)
+                await self._sleep(wait)
+                continue
+            self._global.take(now)
+            self._bucket(job.chat, now).take(now)
+            job.started = True
+            if job.key:
+                del self._edits[job.key]
+            self._pending -= 1
+            TELEGRAM_SEND_QUEUE.dec()
+            task = asyncio.create_task(self._send(job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, job):
+        try:
+            result = await job.callback(*job.args, **job.kwargs)
+        except RetryAfter as e:
+            if job.attempts >= self.max_retries:
+                _FAILED.inc()
+                job.future.set_exception(e)
+                return
+            delay = _retry_seconds(e) + BACKOFF * 2 ** job.attempts
+            logger.warning(f"Telegram flood control, pausing sends for {delay:.1f}s")
+            _RETRIED.inc()
+            self._paused_until = max(self._paused_until, self.clock() + delay)
+            # A new job: the old one may still sit in its queue behind a priority bump.
+            self._push(_Job(
+                job.priority, job.seq, job.chat, None, job.callback, job.args, job.kwargs, job.future, job.attempts + 1,
+            ))
+        except Exception as e:
+            _FAILED.inc()
+            job.future.set_exception(e)
+        else:
+            _SENT.inc()
+            job.future.set_result(result)
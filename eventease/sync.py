@@ -0,0 +1,98 @@
+"""Keeps a bot's catalog cache in step with the catalog's change feed.
+
+:class:`CatalogSync` long-polls the site's ``/api/changes/`` in the
+background and applies each change to the
+:class:`~eventease.cache.CatalogCache`: records are updated in place and
+only the pages a change affects are dropped. Sync traffic therefore
+follows what changed, and bookings, the most common change, leave every
+page cached.
+
+While the feed is connected, cached entries stay fresh for ``synced_ttl``
+instead of the cache's own TTL, except what's-on pages: they change with
+the time as well, so they keep the cache's TTL. If the feed fails, the cache falls back to
+its TTL until the feed is back, then catches up from the last version it
+applied. If the site has pruned that version, the cache is cleared and
+syncing starts over from the current one.
+"""
+import asyncio
+import logging
+
+from .catalog import VersionGone
+from .metrics import CATALOG_CHANGES
+
+logger = logging.getLogger(__name__)
+
+SYNCED_TTL = 3600.0
+# Seconds each long poll waits for a change; below the site's limit.
+WAIT = 15
+RETRY_DELAYS = (1, 2, 5, 10, 30)
+
+
+class CatalogSync:
+    def __init__(self, catalog, client, wait=WAIT, synced_ttl=SYNCED_TTL):
+        self.catalog = catalog
+        self.client = client
+        self.wait = wait
+        self.synced_ttl = synced_ttl
+        self.version = None
+        self._ttls = [(cache, cache.ttl) for cache in (catalog.cache, catalog.index.cache)]
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _clear(self):
+        self.catalog.cache.invalidate()
+        self.catalog.whats_on_cache.invalidate()
+        self.catalog.index.cache.invalidate()
+
+    def _synced(self, synced):
+        for cache, ttl in self._ttls:
+            cache.ttl = self.synced_ttl if synced else ttl
+
+    async def sync(self, wait=0):
+        """Apply the next batch of changes, waiting up to ``wait`` seconds
+        for one; returns how many were applied."""
+        if self.version is None:
+            self.version = (await self.client.changes())['version']
+            # Anything cached so far may predate that version.
+            self._clear()
+            return 0
+        try:
+            page = await self.client.changes(self.version, wait=wait)
+        except VersionGone as e:
+            logger.warning(f"Catalog changes after version {self.version} are gone; starting over at {e.version}")
+            self._clear()
+            self.version = e.version
+            return 0
+        for change in page['changes']:
+            self.catalog.apply(change)
+            CATALOG_CHANGES.labels(change['kind'], change['action']).inc()
+        self.version = page['version']
+        return len(page['changes'])
+
+    async def _run(self):
+        failures = 0
+        while True:
+            try:
+                await self.sync(self.wait)
+            except Exception:
+                # Whatever went wrong, keep syncing; stop() cancels the task
+                # with CancelledError, which is not an Exception.
+                self._synced(False)
+                delay = RETRY_DELAYS[min(failures, len(RETRY_DELAYS) - 1)]
+                failures += 1
+                logger.exception(f"Catalog change feed failed, retrying in {delay}s")
+                await asyncio.sleep(delay)
+            else:
+                failures = 0
+                self._synced(True)
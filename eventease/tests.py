@@ -0,0 +1,855 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase, TestCase, mock
+
+import httpx
+from telegram import Update, User
+from telegram.error import RetryAfter
+from telegram.ext import Application, CommandHandler, ConversationHandler, ExtBot, MessageHandler, filters
+
+from benchmarks.fake_telegram import FakeTelegram
+
+from .bookings import BookingQueue
+from .cache import CatalogCache, TTLCache
+from .catalog import CatalogClient, CatalogError, VersionGone
+from .intent_data import EVALUATION
+from .intents import CatalogNames, IntentModel, NameIndex
+from .metrics import Counter, Gauge, HANDLER_SECONDS, Histogram, Registry, instrument_application, render, serve
+from .persistence import MemoryRedis, RedisPersistence, SQLitePersistence, StatePersistence, share_conversations
+from .profiling import Profiler, flamegraph_svg, list_profiles, load_folded
+from .render import RenderCache
+from .sending import HIGH, SendScheduler
+from .sync import CatalogSync
+from .webhook import MAX_BODY_SIZE, WebhookApp
+
+
+async def _get_me(bot, *args, **kwargs):
+    bot._bot_user = User(1, 'EventEase', True, username='eventease_bot')
+    return bot._bot_user
+
+
+def _message(update_id, text, user_id=7):
+    data = {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': text,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Ann'},
+        },
+    }
+    if text.startswith('/'):
+        data['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return data
+
+
+class FakeCatalog:
+    def __init__(self):
+        self.calls = []
+
+    async def categories(self, after=None, before=None):
+        self.calls.append(('categories', after))
+        if after is None:
+            return {'categories': [{'id': 1, 'name': 'Comedy'}], 'next': 'Mg', 'prev': None}
+        return {'categories': [{'id': 2, 'name': 'Music'}], 'next': None, 'prev': 'Mg'}
+
+    async def events(self, category_id, after=None, before=None):
+        self.calls.append(('events', category_id))
+        return {'events': [{'id': 1, 'name': 'Jazz Night', 'category': 'Music', 'participants': 3}],
+                'next': None, 'prev': None}
+
+    async def event(self, event_id):
+        self.calls.append(('event', event_id))
+        return {'id': event_id, 'name': 'Opera Gala', 'category': 'Music'}
+
+    async def whats_on(self, when, days=None, after=None, before=None):
+        self.calls.append(('whats_on', when))
+        return {'when': when, 'events': [{'id': 1, 'name': 'Jazz Night'}], 'next': None, 'prev': None}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingLoader:
+    """Returns ``value`` with the call number, after ``gate`` is set."""
+
+    def __init__(self, value='v'):
+        self.value = value
+        self.calls = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.error = None
+
+    async def __call__(self):
+        self.calls += 1
+        await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return f'{self.value}{self.calls}'
+
+
+class TTLCacheTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(ttl=30, stale_ttl=300, maxsize=2, clock=self.clock)
+
+    async def test_entries_expire_after_ttl_and_stale_ttl(self):
+        loader = CountingLoader()
+        self.assertEqual(await self.cache.get('a', loader), 'v1')
+        self.clock.now = 29
+        self.assertEqual(await self.cache.get('a', loader), 'v1')
+        self.clock.now = 400  # Past the stale window too: loaded while the caller waits.
+        self.assertEqual(await self.cache.get('a', loader), 'v2')
+        self.assertEqual(loader.calls, 2)
+
+    async def test_stale_value_is_served_during_one_background_refresh(self):
+        loader = CountingLoader()
+        await self.cache.get('a', loader)
+        self.clock.now = 31
+        loader.gate.clear()
+        self.assertEqual(await asyncio.gather(*(self.cache.get('a', loader) for _ in range(3))), ['v1'] * 3)
+        self.assertEqual(loader.calls, 2)
+        loader.gate.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(await self.cache.get('a', loader), 'v2')
+        self.assertEqual(loader.calls, 2)
+
+    async def test_concurrent_misses_share_one_load(self):
+        loader = CountingLoader()
+        loader.gate.clear()
+        waiting = asyncio.gather(*(self.cache.get('a', loader) for _ in range(3)))
+        await asyncio.sleep(0)
+        loader.gate.set()
+        self.assertEqual(await waiting, ['v1'] * 3)
+        self.assertEqual(loader.calls, 1)
+
+    async def test_loader_errors_are_not_cached(self):
+        loader = CountingLoader()
+        loader.error = RuntimeError('down')
+        with self.assertRaises(RuntimeError):
+            await self.cache.get('a', loader)
+        loader.error = None
+        self.assertEqual(await self.cache.get('a', loader), 'v2')
+
+        # A failed background refresh keeps the stale value.
+        self.clock.now = 31
+        loader.error = RuntimeError('down')
+        with self.assertLogs('eventease.cache', 'WARNING'):
+            self.assertEqual(await self.cache.get('a', loader), 'v2')
+            await asyncio.sleep(0)
+        loader.error = None
+        self.assertEqual(await self.cache.get('a', loader), 'v2')
+        await asyncio.sleep(0)
+        self.assertEqual(self.cache.peek('a'), 'v4')
+
+    async def test_least_recently_used_entries_are_evicted(self):
+        for key in ('a', 'b'):
+            await self.cache.get(key, CountingLoader(key))
+        await self.cache.get('a', CountingLoader())  # Now b is the least recently used.
+        await self.cache.get('c', CountingLoader('c'))
+        self.assertEqual((len(self.cache), self.cache.peek('a'), self.cache.peek('b')), (2, 'a1', None))
+
+
+class EventIndexTests(IsolatedAsyncioTestCase):
+    async def test_listed_events_are_shared_records(self):
+        client = FakeCatalog()
+        catalog = CatalogCache(client)
+        page = await catalog.events(5)
+        event = await catalog.event(1)
+
+        self.assertIs(event, page['events'][0])
+        self.assertEqual((event.name, event.participants, event.location), ('Jazz Night', 3, None))
+        self.assertEqual(client.calls, [('events', 5)])
+
+    async def test_unlisted_event_is_loaded_once(self):
+        client = FakeCatalog()
+        catalog = CatalogCache(client)
+        first, second = await asyncio.gather(catalog.event(9), catalog.event(9))
+
+        self.assertIs(first, second)
+        self.assertEqual(first.name, 'Opera Gala')
+        self.assertEqual(client.calls, [('event', 9)])
+
+
+class IntentTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = IntentModel()
+
+    def test_accuracy_on_held_out_messages(self):
+        correct = sum(self.model.classify(text)[0] == label for text, label in EVALUATION)
+        self.assertGreaterEqual(correct / len(EVALUATION), 0.9)
+
+    def test_classifies_within_a_millisecond(self):
+        started = time.perf_counter()
+        for text, _ in EVALUATION:
+            self.model.classify(text)
+        self.assertLess((time.perf_counter() - started) / len(EVALUATION), 0.001)
+
+    def test_names_prefer_the_longest_match(self):
+        names = NameIndex([('comedy', 'Comedy'), ('jazz', 'Jazz'), ('jazz night', 'Jazz Night')])
+
+        self.assertEqual(names.match('book a comedy show')[0], 'comedy')
+        self.assertEqual(names.match('two tickets for jazz night')[0], 'jazz night')
+        self.assertEqual(names.match('anything with jazz?')[0], 'jazz')
+        self.assertIsNone(names.match('my cat is sleeping'))
+
+
+class CatalogNamesTests(IsolatedAsyncioTestCase):
+    async def test_matches_categories_and_indexed_events(self):
+        client = FakeCatalog()
+        catalog = CatalogCache(client)
+        await catalog.events(2)
+        names = CatalogNames(catalog)
+
+        self.assertEqual((await names.match('any comedy tonight'))[0], ('category', 1))
+        self.assertEqual((await names.match('book jazz night please'))[0], ('event', 1))
+        self.assertEqual((await names.match('music'))[0], ('category', 2))
+        self.assertEqual(client.calls, [('events', 2), ('categories', None), ('categories', 'Mg')])
+
+
+class StatePersistenceTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'state.sqlite3')
+
+    async def test_sqlite_round_trip_keeps_only_whitelisted_keys(self):
+        persistence = SQLitePersistence(self.path, ['event_id', 'name'])
+        await persistence.update_user_data(7, {'event_id': 3, 'name': 'Ann', 'events': [{'id': 3}] * 100})
+        await persistence.update_conversation('booking', (7, 7), 4)
+        await persistence.update_conversation('booking', (8, 8), 1)
+        await persistence.update_conversation('booking', (8, 8), None)
+        await persistence.flush()
+
+        reopened = SQLitePersistence(self.path, ['event_id', 'name'])
+        self.assertEqual(await reopened.get_user_data(), {7: {'event_id': 3, 'name': 'Ann'}})
+        self.assertEqual(await reopened.get_conversations('booking'), {(7, 7): 4})
+        await reopened.flush()
+
+    async def test_flush_waits_for_batches_already_being_written(self):
+        persistence = RedisPersistence(MemoryRedis(), ['event_id'])
+        write = persistence._write
+
+        async def slow_write(changes):
+            await asyncio.sleep(0.05)
+            await write(changes)
+
+        persistence._write = slow_write
+        await persistence.update_user_data(1, {'event_id': 1})
+        await asyncio.sleep(0.01)  # The batch is now in flight.
+        await persistence.flush()
+        self.assertEqual(await persistence.get_user_data(), {1: {'event_id': 1}})
+
+    async def test_changes_of_one_round_are_written_in_one_batch(self):
+        persistence = RedisPersistence(MemoryRedis(), ['event_id'])
+        with mock.patch.object(persistence, '_write', wraps=persistence._write) as write:
+            await asyncio.gather(*(
+                persistence.update_user_data(user_id, {'event_id': user_id}) for user_id in range(50)
+            ))
+            await persistence.flush()
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(len(await persistence.get_user_data()), 50)
+
+    async def shared_workers(self, replies):
+        redis = MemoryRedis()
+
+        async def ask_name(update, context):
+            context.user_data['event_id'] = 3
+            return 1
+
+        async def save_name(update, context):
+            replies.append((context.user_data.get('event_id'), update.message.text))
+            return ConversationHandler.END
+
+        def worker():
+            application = (
+                Application.builder().token('1:test')
+                .persistence(RedisPersistence(redis, ['event_id']))
+                .build()
+            )
+            conversation = ConversationHandler(
+                entry_points=[CommandHandler('start', ask_name)],
+                states={1: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_name)]},
+                fallbacks=[],
+                name='booking',
+                persistent=True,
+            )
+            application.add_handler(conversation)
+            share_conversations(application, conversation)
+            return application
+
+        first, second = worker(), worker()
+        with mock.patch('telegram.ext.ExtBot.get_me', _get_me):
+            await first.initialize()
+            await second.initialize()
+        return first, second
+
+    async def test_workers_sharing_redis_continue_each_others_conversations(self):
+        replies = []
+        first, second = await self.shared_workers(replies)
+        await first.process_update(Update.de_json(_message(1, '/start'), first.bot))
+        await first.update_persistence()
+        await first.persistence.flush()
+
+        await second.process_update(Update.de_json(_message(2, 'Ann'), second.bot))
+        self.assertEqual(replies, [(3, 'Ann')])
+
+    async def test_shared_state_is_written_before_the_update_is_done(self):
+        # No update_interval has passed when the next message reaches the other worker.
+        replies = []
+        first, second = await self.shared_workers(replies)
+        await first.process_update(Update.de_json(_message(1, '/start'), first.bot))
+        await second.process_update(Update.de_json(_message(2, 'Ann'), second.bot))
+        await first.process_update(Update.de_json(_message(3, 'Bob'), first.bot))
+        self.assertEqual(replies, [(3, 'Ann')])
+
+    def test_backends_must_implement_storage(self):
+        class Incomplete(StatePersistence):
+            async def _load(self, table, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            Incomplete(['event_id'])
+
+
+class FakeFeed(FakeCatalog):
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = list(pages)
+
+    async def changes(self, since=None, wait=0):
+        self.calls.append(('changes', since))
+        if since is None:
+            return {'version': 10, 'changes': [], 'more': False}
+        if not self.pages:
+            await asyncio.sleep(wait)  # A long poll with nothing new.
+            return {'version': since, 'changes': [], 'more': False}
+        page = self.pages.pop(0)
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+
+def _change(version, action, data=None, kind='event', object_id=1):
+    return {'version': version, 'kind': kind, 'action': action, 'id': object_id, 'data': data}
+
+
+class CatalogSyncTests(IsolatedAsyncioTestCase):
+    async def test_bookings_update_records_without_refetching(self):
+        client = FakeFeed([])
+        catalog = CatalogCache(client)
+        page = await catalog.events(5)
+        catalog.apply(_change(11, 'participants', {'participants': 4}))
+
+        self.assertIs(await catalog.events(5), page)
+        self.assertEqual(page['events'][0].participants, 4)
+        self.assertEqual(client.calls, [('events', 5)])
+
+    async def test_listing_changes_drop_only_affected_pages(self):
+        client = FakeFeed([])
+        catalog = CatalogCache(client)
+        await catalog.events(5)
+        await catalog.events(6)
+        await catalog.categories()
+        event = await catalog.event(1)
+        catalog.apply(_change(11, 'updated', {'id': 1, 'name': 'Jazz Brunch', 'category_id': 5}))
+
+        self.assertEqual(event.name, 'Jazz Brunch')
+        await catalog.events(5)
+        await catalog.events(6)
+        await catalog.categories()
+        self.assertEqual(client.calls, [('events', 5), ('events', 6), ('categories', None), ('events', 5)])
+
+        catalog.apply(_change(12, 'updated', {'id': 5, 'name': 'Live Music'}, kind='category', object_id=5))
+        await catalog.categories()
+        self.assertEqual(client.calls[-1], ('categories', None))
+
+    async def test_page_loaded_across_a_change_is_not_kept(self):
+        client = FakeFeed([])
+        catalog = CatalogCache(client)
+        loading = asyncio.create_task(catalog.events(5))
+        await asyncio.sleep(0)
+        catalog.apply(_change(11, 'created', {'id': 2, 'name': 'New Gig', 'category_id': 5}))
+        await loading
+        await catalog.events(5)
+        self.assertEqual(client.calls, [('events', 5), ('events', 5)])
+
+    async def test_sync_applies_changes_and_starts_over_when_gone(self):
+        client = FakeFeed([
+            {'version': 12, 'changes': [_change(11, 'participants', {'participants': 7}), _change(12, 'deleted')],
+             'more': False},
+            VersionGone(40),
+            {'version': 40, 'changes': [], 'more': False},
+        ])
+        catalog = CatalogCache(client)
+        sync = CatalogSync(catalog, client)
+        await sync.sync()
+        event = await catalog.event(1)
+        self.assertEqual(sync.version, 10)
+
+        self.assertEqual(await sync.sync(25), 2)
+        self.assertEqual((sync.version, event.participants, catalog.index.peek(1)), (12, 7, None))
+        await catalog.categories()
+        with self.assertLogs('eventease.sync', 'WARNING'):
+            await sync.sync(25)
+        self.assertEqual((sync.version, len(catalog.cache)), (40, 0))
+
+    async def test_feed_failures_fall_back_to_the_cache_ttl(self):
+        client = FakeFeed([httpx.ConnectError('down'), {'version': 10, 'changes': [], 'more': False}])
+        catalog = CatalogCache(client, ttl=30)
+        sync = CatalogSync(catalog, client, synced_ttl=3600)
+        sync.version = 10
+        with mock.patch('eventease.sync.RETRY_DELAYS', (0,)), self.assertLogs('eventease.sync', 'WARNING'):
+            sync.start()
+            await asyncio.sleep(0.05)
+            await sync.stop()
+        self.assertEqual(catalog.cache.ttl, 3600)
+        self.assertEqual(client.pages, [])
+
+    async def test_whats_on_pages_keep_the_cache_ttl_while_synced(self):
+        # "Tonight" moves on without any change to the catalog.
+        client = FakeFeed([])
+        clock = FakeClock()
+        catalog = CatalogCache(client, ttl=30, stale_ttl=0)
+        catalog.cache.clock = catalog.whats_on_cache.clock = clock
+        sync = CatalogSync(catalog, client, wait=0.01, synced_ttl=3600)
+        sync.version = 10
+        sync.start()
+        await asyncio.sleep(0.05)
+        self.assertEqual(catalog.cache.ttl, 3600)
+        await catalog.events(5)
+        await catalog.whats_on('tonight')
+        clock.now = 31
+        await catalog.events(5)
+        await catalog.whats_on('tonight')
+        await sync.stop()
+        self.assertEqual([call for call in client.calls if call[0] != 'changes'],
+                         [('events', 5), ('whats_on', 'tonight'), ('whats_on', 'tonight')])
+
+    async def test_unexpected_errors_do_not_stop_syncing(self):
+        client = FakeFeed([
+            {'version': 11, 'changes': None, 'more': False},  # A TypeError, not a feed error.
+            {'version': 12, 'changes': [_change(12, 'participants', {'participants': 7})], 'more': False},
+        ])
+        catalog = CatalogCache(client, ttl=30)
+        event = await catalog.event(1)
+        sync = CatalogSync(catalog, client, synced_ttl=3600)
+        sync.version = 10
+        with mock.patch('eventease.sync.RETRY_DELAYS', (0,)), self.assertLogs('eventease.sync', 'ERROR') as logs:
+            sync.start()
+            await asyncio.sleep(0.05)
+            self.assertEqual(catalog.cache.ttl, 3600)
+            await sync.stop()
+        self.assertIn('Traceback', logs.output[0])
+        self.assertEqual((sync.version, event.participants), (12, 7))
+
+
+class CatalogClientTests(IsolatedAsyncioTestCase):
+    async def serve(self, respond):
+        """A local HTTP server calling ``respond(reader, writer)`` per request;
+        returns its URL and the most connections it had open at once."""
+        connections = {'open': 0, 'peak': 0}
+
+        async def handle(reader, writer):
+            connections['open'] += 1
+            connections['peak'] = max(connections['peak'], connections['open'])
+            try:
+                while await reader.readuntil(b'\r\n\r\n'):
+                    await respond(reader, writer)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                connections['open'] -= 1
+                writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        return f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}', connections
+
+    async def test_requests_beyond_the_pool_are_queued(self):
+        async def slow(reader, writer):
+            await asyncio.sleep(0.05)
+            body = b'{"event":{"id":1}}'
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+
+        url, connections = await self.serve(slow)
+        client = CatalogClient(url, limits=httpx.Limits(max_connections=2, max_keepalive_connections=2))
+        self.addAsyncCleanup(client.aclose)
+        events = await asyncio.gather(*(client.event(n) for n in range(6)))
+        self.assertEqual(events, [{'id': 1}] * 6)
+        self.assertEqual(connections['peak'], 2)
+
+    async def test_timeouts_raise_catalog_errors(self):
+        async def silent(reader, writer):
+            await reader.read()
+
+        url, _ = await self.serve(silent)
+        client = CatalogClient(url, timeout=httpx.Timeout(0.1))
+        self.addAsyncCleanup(client.aclose)
+        with self.assertRaises(CatalogError) as raised:
+            await client.event(1)
+        self.assertIsInstance(raised.exception, httpx.ReadTimeout)
+
+
+class IdempotentWriteTests(IsolatedAsyncioTestCase):
+    def client(self, responses):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        client = CatalogClient('http://catalog', transport=httpx.MockTransport(handler))
+        self.addAsyncCleanup(client.aclose)
+        return client, requests
+
+    async def test_keyed_increment_is_retried_with_the_same_key(self):
+        client, requests = self.client([
+            httpx.ReadTimeout('slow'),
+            httpx.Response(503),
+            httpx.Response(200, json={'status': 'success', 'participants': 5}),
+        ])
+        with mock.patch('eventease.catalog.RETRY_BACKOFF', 0):
+            self.assertEqual(await client.increment_participants(1, key='7:1:a'), 5)
+        self.assertEqual([request.headers['Idempotency-Key'] for request in requests], ['7:1:a'] * 3)
+
+    async def test_unkeyed_increment_is_not_retried(self):
+        client, requests = self.client([httpx.ReadTimeout('slow')])
+        with self.assertRaises(CatalogError):
+            await client.increment_participants(1)
+        self.assertEqual(len(requests), 1)
+
+    async def test_pending_bookings_are_sent_again(self):
+        pending = {'status': 'pending', 'message': 'Booking in progress, retry shortly'}
+        done = {'status': 'success', 'participants': 4}
+        client, requests = self.client([
+            httpx.Response(200, json={'status': 'success', 'results': [pending]}),
+            httpx.Response(200, json={'status': 'success', 'results': [done]}),
+        ])
+        booking = {'event_id': 1, 'user_id': 7, 'name': 'Ann', 'email': 'ann@example.com', 'key': '7:1:a'}
+        with mock.patch('eventease.catalog.RETRY_BACKOFF', 0):
+            self.assertEqual(await client.create_bookings([booking]), [done])
+        self.assertEqual(len(requests), 2)
+
+
+class BookingQueueTests(IsolatedAsyncioTestCase):
+    async def test_slow_batch_does_not_hold_up_the_others(self):
+        class Client:
+            async def create_bookings(self, bookings):
+                if bookings[0]['event_id'] == 1:
+                    await asyncio.sleep(0.5)
+                    raise httpx.ReadTimeout('timed out')
+                return [{'status': 'success', 'participants': booking['event_id']} for booking in bookings]
+
+        queue = BookingQueue(Client(), max_batch=1, max_delay=0)
+        queue.start()
+        started = time.monotonic()
+        slow = asyncio.create_task(queue.submit(1, 7, 'Ann', 'ann@example.com'))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(*(queue.submit(n, 7, 'Ann', 'ann@example.com') for n in (2, 3, 4)))
+        self.assertEqual([result['participants'] for result in results], [2, 3, 4])
+        self.assertLess(time.monotonic() - started, 0.25)
+        self.assertFalse(slow.done())
+        with self.assertRaises(CatalogError):
+            await slow
+        await queue.stop()
+
+
+class RenderCacheTests(IsolatedAsyncioTestCase):
+    async def test_page_renders_are_reused_until_the_page_changes(self):
+        catalog = CatalogCache(FakeCatalog())
+        renders = RenderCache()
+
+        page = await catalog.events(5)
+        first = renders.get('events', page, lambda: ['rendered'])
+        self.assertIs(renders.get('events', await catalog.events(5), lambda: self.fail('rendered again')), first)
+        self.assertEqual(renders.get('other', page, lambda: 'other'), 'other')
+
+        catalog.apply(_change(11, 'updated', {'id': 1, 'name': 'Jazz Brunch', 'category_id': 5}))
+        self.assertIsNot(renders.get('events', await catalog.events(5), lambda: ['rendered']), first)
+
+    async def test_record_renders_follow_its_revision(self):
+        catalog = CatalogCache(FakeCatalog())
+        renders = RenderCache()
+        event = await catalog.event(1)
+
+        def render():
+            return f'{event.name}: {event.participants}'
+
+        self.assertEqual(renders.get('event', event, render, event.revision), 'Opera Gala: None')
+        catalog.apply(_change(11, 'participants', {'participants': 4}))
+        self.assertEqual(renders.get('event', event, render, event.revision), 'Opera Gala: 4')
+
+    def test_least_recently_used_renders_are_evicted(self):
+        renders = RenderCache(maxsize=2)
+        pages = [{'n': n} for n in range(3)]
+        for page in pages:
+            renders.get('page', page, lambda: 'rendered')
+        renders.get('page', pages[0], lambda: 'again')
+        self.assertEqual(len(renders), 2)
+
+
+class MetricsTests(IsolatedAsyncioTestCase):
+    def test_renders_the_prometheus_text_format(self):
+        registry = Registry()
+        requests = Counter('requests_total', 'Requests.', ['view'], registry=registry)
+        latency = Histogram('latency_seconds', 'Latency.', ['view'], registry=registry, buckets=(0.1, 1))
+        Gauge('queue_size', 'Queued.', registry=registry, function=lambda: 3)
+        requests.labels('a"b').inc(2)
+        latency.labels('x').observe(0.5)
+        latency.labels('x').observe(5)
+
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{view="a\\"b"} 2',
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{view="x",le="0.1"} 0',
+            'latency_seconds_bucket{view="x",le="1"} 1',
+            'latency_seconds_bucket{view="x",le="+Inf"} 2',
+            'latency_seconds_sum{view="x"} 5.5',
+            'latency_seconds_count{view="x"} 2',
+            '# HELP queue_size Queued.',
+            '# TYPE queue_size gauge',
+            'queue_size 3',
+        ])
+
+    async def test_times_handlers_and_counts_open_conversations(self):
+        async def ask_name(update, context):
+            return 1
+
+        application = Application.builder().token('1:test').build()
+        application.add_handler(ConversationHandler(
+            entry_points=[CommandHandler('book', ask_name)], states={1: []}, fallbacks=[], name='booking',
+        ))
+        instrument_application(application, {1: 'name'})
+        timed = HANDLER_SECONDS.labels('ask_name')
+        before = sum(timed.counts)
+        with mock.patch('telegram.ext.ExtBot.get_me', _get_me):
+            await application.initialize()
+        for user_id in (1, 2):
+            await application.process_update(Update.de_json(_message(user_id, '/book', user_id), application.bot))
+
+        self.assertEqual(sum(timed.counts) - before, 2)
+        self.assertIn('eventease_bot_conversations{conversation="booking",state="name"} 2', render())
+
+    async def test_listener_serves_metrics(self):
+        server = await serve('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            response = await reader.read()
+            writer.close()
+        finally:
+            server.close()
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK'))
+        self.assertIn(b'# TYPE eventease_bot_handler_duration_seconds histogram', response)
+
+
+def _busy_for(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilerTests(TestCase):
+    def test_sampled_run_is_saved_with_its_stacks(self):
+        directory = tempfile.mkdtemp()
+        profiler = Profiler(directory, sample_rate=1.0, interval=0.001, slow_threshold=0.01, max_profiles=2)
+        for _ in range(3):
+            run = profiler.begin('handler', 'busy')
+            _busy_for(0.05)
+            with self.assertLogs('eventease.slow', 'WARNING') as logs:
+                profile_id = run.stop().describe(user=7).report()
+
+        self.assertIn('Slow handler busy', logs.output[0])
+        self.assertIn(f'profile={profile_id}', logs.output[0])
+        profiles = list_profiles(directory)
+        self.assertEqual(len(profiles), 2)  # The oldest was pruned.
+        self.assertEqual((profiles[0]['id'], profiles[0]['details']), (profile_id, {'user': 7}))
+        folded = load_folded(directory, profile_id)
+        busy = sum(count for line, count in folded.items() if '_busy_for' in line.rsplit(';', 1)[-1])
+        self.assertGreater(busy, sum(folded.values()) / 2)
+        self.assertIn('_busy_for', flamegraph_svg(folded))
+
+    def test_unsampled_fast_run_leaves_nothing(self):
+        directory = tempfile.mkdtemp()
+        profiler = Profiler(directory, sample_rate=0.0)
+        self.assertIsNone(profiler.begin('handler', 'quick').stop().report())
+        self.assertEqual(list_profiles(directory), [])
+
+
+class WebhookAppTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.application = (
+            Application.builder().token('1:test').update_queue(asyncio.Queue(maxsize=1)).build()
+        )
+        self.forwarded = []
+
+        async def django(scope, receive, send):
+            self.forwarded.append(scope['path'])
+            await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        self.app = WebhookApp(self.application, secret_token='s3cret', fallback=django)
+
+    async def request(self, method='POST', path='/telegram/', body=None, token=b's3cret'):
+        """Send one request through the ASGI app; returns the response status."""
+        if body is None:
+            body = json.dumps(_message(1, 'hi')).encode()
+        scope = {'type': 'http', 'method': method, 'path': path,
+                 'headers': [(b'x-telegram-bot-api-secret-token', token)] if token else []}
+        messages = [{'type': 'http.request', 'body': body}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        return sent[0]['status']
+
+    async def test_updates_are_queued(self):
+        self.assertEqual(await self.request(), 200)
+        update = self.application.update_queue.get_nowait()
+        self.assertEqual(update.message.text, 'hi')
+
+    async def test_secret_token_is_required(self):
+        self.assertEqual(await self.request(token=b'wrong'), 403)
+        self.assertEqual(await self.request(token=None), 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_invalid_requests_are_rejected(self):
+        self.assertEqual(await self.request(method='GET'), 405)
+        self.assertEqual(await self.request(body=b'x' * (MAX_BODY_SIZE + 1)), 413)
+        self.assertEqual(await self.request(body=b'{not json'), 400)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_full_queue_asks_telegram_to_retry(self):
+        self.assertEqual(await self.request(), 200)
+        self.assertEqual(await self.request(), 503)
+
+    async def test_other_paths_go_to_the_fallback(self):
+        self.assertEqual(await self.request(method='GET', path='/api/categories/'), 204)
+        self.assertEqual(self.forwarded, ['/api/categories/'])
+
+    async def test_lifespan_starts_and_stops_the_application(self):
+        hooks = []
+
+        async def post_init(application):
+            hooks.append('post_init')
+
+        async def post_shutdown(application):
+            hooks.append('post_shutdown')
+
+        self.application.post_init, self.application.post_shutdown = post_init, post_shutdown
+        events, sent = asyncio.Queue(), []
+
+        async def send(message):
+            sent.append(message['type'])
+
+        with mock.patch('telegram.ext.ExtBot.get_me', _get_me):
+            lifespan = asyncio.create_task(self.app({'type': 'lifespan'}, events.get, send))
+            await events.put({'type': 'lifespan.startup'})
+            while not sent:
+                await asyncio.sleep(0.01)
+            self.assertTrue(self.application.running)
+            await events.put({'type': 'lifespan.shutdown'})
+            await lifespan
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertEqual(hooks, ['post_init', 'post_shutdown'])
+        self.assertFalse(self.application.running)
+
+
+class SendSchedulerTests(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.sent = []
+
+    def _request(self, scheduler, endpoint, text, priority=None, chat_id=7, **data):
+        async def callback(value):
+            self.sent.append(value)
+            return value
+
+        return asyncio.create_task(scheduler.process_request(
+            callback, (text,), {}, endpoint, {'chat_id': chat_id, **data},
+            {'priority': priority} if priority is not None else None,
+        ))
+
+    async def _run(self, scheduler):
+        await scheduler.initialize()
+        self.addAsyncCleanup(scheduler.shutdown)
+
+    async def test_waiting_edits_of_a_message_are_coalesced(self):
+        scheduler = SendScheduler(chat_rate=20, chat_burst=1)
+        await self._run(scheduler)
+        first = self._request(scheduler, 'sendMessage', 'menu')
+        edits = [self._request(scheduler, 'editMessageText', f'page {n}', message_id=5) for n in range(3)]
+        other = self._request(scheduler, 'editMessageText', 'other', message_id=6)
+        await asyncio.sleep(0)
+
+        self.assertEqual(scheduler.pending, 3)
+        self.assertEqual(await asyncio.gather(first, *edits, other), ['menu', 'page 2', 'page 2', 'page 2', 'other'])
+        self.assertEqual(self.sent, ['menu', 'page 2', 'other'])
+
+    async def test_high_priority_goes_first_within_the_chat_rate(self):
+        scheduler = SendScheduler(chat_rate=20, chat_burst=1)
+        await self._run(scheduler)
+        started = time.monotonic()
+        normal = [self._request(scheduler, 'sendMessage', f'normal {n}') for n in range(3)]
+        await asyncio.sleep(0)
+        confirmation = self._request(scheduler, 'sendMessage', 'confirmed', priority=HIGH)
+        elsewhere = self._request(scheduler, 'sendMessage', 'elsewhere', chat_id=8)
+        await asyncio.gather(*normal, confirmation, elsewhere)
+
+        self.assertEqual(self.sent, ['normal 0', 'elsewhere', 'confirmed', 'normal 1', 'normal 2'])
+        # Three waits for chat 7's bucket at 20 a second.
+        self.assertGreaterEqual(time.monotonic() - started, 0.14)
+
+    async def test_requests_outside_a_chat_are_not_queued(self):
+        scheduler = SendScheduler(chat_rate=5, chat_burst=1)
+        await self._run(scheduler)
+        await self._request(scheduler, 'sendMessage', 'menu')
+        blocked = self._request(scheduler, 'sendMessage', 'later')
+        answer = self._request(scheduler, 'answerCallbackQuery', 'ok', chat_id=None)
+        self.assertEqual(await answer, 'ok')
+        self.assertFalse(blocked.done())
+        self.assertEqual(await blocked, 'later')
+
+    async def test_flood_control_pauses_and_retries(self):
+        telegram = FakeTelegram(flood_limit=1, retry_after=1)
+        scheduler = SendScheduler()
+        bot = ExtBot('123:TEST', request=telegram, get_updates_request=FakeTelegram(), rate_limiter=scheduler)
+        with mock.patch('eventease.sending.BACKOFF', 0.01), self.assertLogs('eventease.sending', 'WARNING'):
+            async with bot:
+                messages = await asyncio.gather(bot.send_message(7, 'one'), bot.send_message(7, 'two'))
+
+        self.assertEqual([message.text for message in messages], ['one', 'two'])
+        self.assertEqual(telegram.floods, 1)
+        self.assertEqual(telegram.log, [('sendMessage', 7, 'one'), ('sendMessage', 7, 'two')])
+
+    async def test_gives_up_after_max_retries(self):
+        telegram = FakeTelegram(flood_limit=0, retry_after=1)
+        bot = ExtBot(
+            '123:TEST', request=telegram, get_updates_request=FakeTelegram(),
+            rate_limiter=SendScheduler(max_retries=0),
+        )
+        async with bot:
+            with self.assertRaises(RetryAfter):
+                await bot.send_message(7, 'one')
+        self.assertEqual(telegram.floods, 1)
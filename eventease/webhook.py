@@ -0,0 +1,234 @@
+"""Running a bot ``Application`` from Telegram webhooks or long polling.
+
+In webhook mode Telegram POSTs each update to ``TELEGRAM_WEBHOOK_PATH``.
+:class:`WebhookApp` checks the secret token, puts the update on the
+application's bounded update queue and answers straight away; the
+application processes the queue with up to ``BOT_CONCURRENT_UPDATES``
+handlers at a time. It is a plain ASGI app, so it can be served on its own
+(``python bot2.py`` with ``BOT_MODE=webhook``, via uvicorn) or mounted in
+front of Django in ``event_management_system/asgi.py``.
+
+Settings, all read from the environment:
+
+* ``BOT_MODE`` -- ``polling`` (default, for local development) or ``webhook``
+* ``TELEGRAM_WEBHOOK_URL`` -- public URL registered with Telegram on startup;
+  leave unset when several workers share one URL and register it once
+* ``TELEGRAM_WEBHOOK_SECRET`` -- expected ``X-Telegram-Bot-Api-Secret-Token``
+* ``TELEGRAM_WEBHOOK_PATH`` -- path the updates are posted to (``/telegram/``)
+* ``BOT_CONCURRENT_UPDATES`` -- updates handled at once; ``0`` for one by one
+* ``BOT_UPDATE_QUEUE_SIZE`` -- queued updates before Telegram gets a 503 and
+  retries later
+* ``BOT_LISTEN`` / ``BOT_PORT`` -- address of the standalone webhook server
+
+Outgoing messages are paced by :class:`eventease.sending.SendScheduler`,
+which has settings of its own.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import time
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest, HTTPXRequest
+
+from .metrics import TELEGRAM_SECONDS
+from .sending import SendScheduler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEBHOOK_PATH = '/telegram/'
+DEFAULT_CONCURRENT_UPDATES = 256
+DEFAULT_QUEUE_SIZE = 1000
+# Telegram updates are a few KiB; anything much larger is not from Telegram.
+MAX_BODY_SIZE = 1024 * 1024
+SECRET_HEADER = b'x-telegram-bot-api-secret-token'
+# python-telegram-bot's default for the bot's own (non-polling) requests.
+CONNECTION_POOL_SIZE = 256
+
+
+class TimedRequest(BaseRequest):
+    """Wraps a request object to time each Bot API call by method."""
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        await self.request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        started, status = time.perf_counter(), 'error'
+        try:
+            status, payload = await self.request.do_request(url, method, request_data, **timeouts)
+            return status, payload
+        finally:
+            TELEGRAM_SECONDS.labels(url.rsplit('/', 1)[-1], status).observe(time.perf_counter() - started)
+
+
+def application_builder(token):
+    """``Application.builder()`` with the update processing settings applied,
+    Bot API calls timed and outgoing messages scheduled."""
+    concurrency = int(os.environ.get('BOT_CONCURRENT_UPDATES', DEFAULT_CONCURRENT_UPDATES))
+    queue_size = int(os.environ.get('BOT_UPDATE_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+    return (
+        Application.builder()
+        .token(token)
+        .request(TimedRequest(HTTPXRequest(connection_pool_size=CONNECTION_POOL_SIZE)))
+        .concurrent_updates(concurrency if concurrency > 0 else False)
+        .update_queue(asyncio.Queue(maxsize=queue_size))
+        .rate_limiter(SendScheduler.from_env())
+    )
+
+
+async def _respond(send, status, body=b''):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_SIZE:
+            raise ValueError('Request body too large')
+        if not message.get('more_body'):
+            return body
+
+
+class WebhookApp:
+    """ASGI app feeding Telegram webhook updates to ``application``.
+
+    Requests for other paths go to ``fallback`` (another ASGI app, e.g.
+    Django) when one is given. The ASGI lifespan starts and stops the bot
+    application, running its ``post_init``/``post_shutdown`` hooks just as
+    ``run_polling()`` does.
+    """
+
+    def __init__(self, application, path=DEFAULT_WEBHOOK_PATH, secret_token=None,
+                 webhook_url=None, fallback=None):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.webhook_url = webhook_url
+        self.fallback = fallback
+
+    @classmethod
+    def from_env(cls, application, fallback=None):
+        return cls(
+            application,
+            path=os.environ.get('TELEGRAM_WEBHOOK_PATH', DEFAULT_WEBHOOK_PATH),
+            secret_token=os.environ.get('TELEGRAM_WEBHOOK_SECRET') or None,
+            webhook_url=os.environ.get('TELEGRAM_WEBHOOK_URL') or None,
+            fallback=fallback,
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == self.path:
+            await self._handle(scope, receive, send)
+        elif self.fallback is not None:
+            await self.fallback(scope, receive, send)
+        else:
+            await _respond(send, 404)
+
+    async def startup(self):
+        application = self.application
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        if self.webhook_url:
+            await application.bot.set_webhook(
+                self.webhook_url, secret_token=self.secret_token, allowed_updates=Update.ALL_TYPES,
+            )
+        await application.start()
+
+    async def shutdown(self):
+        application = self.application
+        # Updates already queued are processed before stop() returns.
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception("Bot application failed to start")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _handle(self, scope, receive, send):
+        if scope['method'] != 'POST':
+            await _respond(send, 405)
+            return
+        if self.secret_token is not None:
+            token = dict(scope['headers']).get(SECRET_HEADER, b'')
+            if not hmac.compare_digest(token, self.secret_token.encode()):
+                await _respond(send, 403)
+                return
+        try:
+            body = await _read_body(receive)
+        except ValueError:
+            await _respond(send, 413)
+            return
+        if body is None:
+            return
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            await _respond(send, 400)
+            return
+        try:
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram redelivers the update later.
+            logger.warning("Update queue is full, asking Telegram to retry")
+            await _respond(send, 503)
+            return
+        await _respond(send, 200)
+
+
+def run(application):
+    """Run ``application`` in the mode selected by ``BOT_MODE``."""
+    mode = os.environ.get('BOT_MODE', 'polling')
+    if mode == 'polling':
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    elif mode == 'webhook':
+        import uvicorn
+
+        uvicorn.run(
+            WebhookApp.from_env(application),
+            host=os.environ.get('BOT_LISTEN', '0.0.0.0'),
+            port=int(os.environ.get('BOT_PORT', 8443)),
+            lifespan='on',
+        )
+    else:
+        raise ValueError(f"Unknown BOT_MODE {mode!r}, expected 'polling' or 'webhook'")